@@ -0,0 +1,113 @@
+"""
+SQLite microbenchmark: पुराना per-call connect/close बनाम SQLiteEngine.
+
+    python bench_db.py [--ops 2000] [--concurrency 50]
+
+दोनों तरीकों पर एक ही workload चलता है (INSERT + COUNT/SELECT, आधे-आधे) और
+statements/sec प्रिंट होता है।
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_bot_module():
+    spec = importlib.util.spec_from_file_location("botmain", os.path.join(HERE, "main (4).py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --- पुराना तरीका (baseline), जैसा db_fetchall/db_execute पहले करते थे ---
+def legacy_helpers(path):
+    async def fetchall(query, params=()):
+        loop = asyncio.get_event_loop()
+
+        def _do():
+            conn = sqlite3.connect(path)
+            c = conn.cursor()
+            c.execute(query, params)
+            rows = c.fetchall()
+            conn.close()
+            return rows
+
+        return await loop.run_in_executor(None, _do)
+
+    async def execute(query, params=()):
+        loop = asyncio.get_event_loop()
+
+        def _do():
+            conn = sqlite3.connect(path)
+            c = conn.cursor()
+            c.execute(query, params)
+            conn.commit()
+            conn.close()
+
+        await loop.run_in_executor(None, _do)
+
+    return fetchall, execute
+
+
+async def workload(fetchall, execute, ops, concurrency):
+    async def one(i):
+        button_id = f"btn{i % 5 + 1}"
+        if i % 2 == 0:
+            await execute(
+                "INSERT INTO messages (button_id, content, media_type, file_id) VALUES (?, ?, ?, ?)",
+                (button_id, f"msg {i}", "text", None),
+            )
+        else:
+            await fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='pending'", (button_id,))
+
+    start = time.perf_counter()
+    for base in range(0, ops, concurrency):
+        await asyncio.gather(*(one(i) for i in range(base, min(base + concurrency, ops))))
+    return time.perf_counter() - start
+
+
+def run(label, path, factory, ops, concurrency, bot):
+    fetchall, execute, cleanup = factory(path, bot)
+    try:
+        elapsed = asyncio.run(workload(fetchall, execute, ops, concurrency))
+    finally:
+        cleanup()
+    print(f"{label:<10} {ops} statements in {elapsed:.3f}s -> {ops / elapsed:,.0f} stmt/s")
+    return ops / elapsed
+
+
+def legacy_factory(path, bot):
+    conn = sqlite3.connect(path)
+    bot._create_schema(conn)
+    conn.commit()
+    conn.close()
+    fetchall, execute = legacy_helpers(path)
+    return fetchall, execute, lambda: None
+
+
+def engine_factory(path, bot):
+    engine = bot.SQLiteEngine(path)
+    engine.run_write_sync(bot._create_schema)
+    return engine.fetchall, engine.execute, engine.close
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    bot = load_bot_module()
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run("legacy", os.path.join(tmp, "legacy.db"), legacy_factory, args.ops, args.concurrency, bot)
+        after = run("engine", os.path.join(tmp, "engine.db"), engine_factory, args.ops, args.concurrency, bot)
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
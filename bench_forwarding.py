@@ -0,0 +1,304 @@
+"""
+forward_messages_job throughput benchmark (in-process fake Bot).
+
+    python bench_forwarding.py [--channels 1,5,10,20] [--batches 10,30,100]
+                               [--media text,photo,album] [--latency-ms 20]
+                               [--retry-after-rate 0] [--error-rate 0]
+                               [--error-kind transient|retry_after|permanent]
+                               [--timeout-rate 0] [--respect-limits]
+                               [--output results.jsonl]
+
+असली job कोड (forward_messages_job → fan_out_batch → send_message_with_backoff
+→ ledger → retry queue) एक नकली bot पर चलता है जिसकी latency, RetryAfter और
+errors configurable हैं। हर matrix cell के लिए एक JSON line निकलती है: messages/sec,
+p50/p99 send latency, DB time, job का wall time और retry queue ख़ाली होने तक का
+कुल wall time — commits के बीच तुलना के लिए।
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import types
+from datetime import timedelta
+
+from telegram import error
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_bot_module():
+    spec = importlib.util.spec_from_file_location("botmain", os.path.join(HERE, "main (4).py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+ERROR_KINDS = ("transient", "retry_after", "permanent")
+
+
+def injected_error(kind):
+    """--error-rate वाली एरर: transient (retry queue), retry_after, या permanent (चैनल circuit में parked)।"""
+    if kind == "retry_after":
+        return error.RetryAfter(timedelta(milliseconds=50))
+    if kind == "permanent":
+        return error.BadRequest("Chat not found")
+    return error.NetworkError("Bad Gateway")
+
+
+class FakeBot:
+    """Bot API का नकली रूप: हर call पर latency, और दिए गए अनुपात में RetryAfter/timeout/error।"""
+
+    def __init__(self, latency, retry_after_rate=0.0, error_rate=0.0, timeout_rate=0.0, seed=0,
+                 error_kind="transient"):
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.timeout_rate = timeout_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def _call(self, chat_id, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        roll = self.rng.random()
+        if roll < self.retry_after_rate:
+            raise error.RetryAfter(timedelta(milliseconds=50))
+        roll -= self.retry_after_rate
+        if roll < self.timeout_rate:
+            raise error.TimedOut()
+        roll -= self.timeout_rate
+        if roll < self.error_rate:
+            raise injected_error(self.error_kind)
+        return types.SimpleNamespace(message_id=self.calls, chat_id=chat_id)
+
+    async def send_message(self, chat_id=None, text=None, **kwargs):
+        return await self._call(chat_id)
+
+    async def send_photo(self, chat_id=None, **kwargs):
+        return await self._call(chat_id)
+
+    async def send_video(self, chat_id=None, **kwargs):
+        return await self._call(chat_id)
+
+    async def send_document(self, chat_id=None, **kwargs):
+        return await self._call(chat_id)
+
+    async def send_media_group(self, chat_id=None, **kwargs):
+        return await self._call(chat_id)
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self._jobs = []
+
+    def jobs(self):
+        return list(self._jobs)
+
+    def get_jobs_by_name(self, name):
+        return [j for j in self._jobs if j.name == name]
+
+    def run_repeating(self, callback, **kwargs):
+        job = types.SimpleNamespace(name=kwargs.get("name"), data=kwargs.get("data"), schedule_removal=lambda: None)
+        self._jobs.append(job)
+        return job
+
+    run_once = run_repeating
+
+
+def timed_engine_class(bot):
+    class TimedEngine(bot.SQLiteEngine):
+        """हर DB call का wall time जोड़ता है (event loop के नज़रिए से)।"""
+
+        db_seconds = 0.0
+
+        async def run_read(self, fn):
+            started = time.perf_counter()
+            try:
+                return await super().run_read(fn)
+            finally:
+                TimedEngine.db_seconds += time.perf_counter() - started
+
+        async def run_write(self, fn):
+            started = time.perf_counter()
+            try:
+                return await super().run_write(fn)
+            finally:
+                TimedEngine.db_seconds += time.perf_counter() - started
+
+    return TimedEngine
+
+
+def queue_rows(button_id, media, count):
+    for i in range(count):
+        if media == "text":
+            yield (button_id, f"benchmark message {i}", "text", None)
+        elif media == "album":
+            items = [{"type": "photo", "file_id": f"file-{i}-{k}", "caption": None} for k in range(5)]
+            yield (button_id, json.dumps(items), "album", None)
+        else:
+            yield (button_id, f"caption {i}", media, f"file-{i}")
+
+
+async def run_cell(bot, args, channels, batch, media):
+    engine_cls = timed_engine_class(bot)
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.DB = engine_cls(os.path.join(tmp, "bench.db"))
+        bot.CONFIG_CACHE = bot.ButtonConfigCache()
+        bot.init_db()
+        button_id = "btn1"
+        await bot.db_executemany(
+            "INSERT INTO channels (button_id, channel_id) VALUES (?, ?)",
+            [(button_id, f"-100{n}") for n in range(channels)],
+        )
+        await bot.db_executemany(
+            "INSERT INTO messages (button_id, content, media_type, file_id) VALUES (?, ?, ?, ?)",
+            list(queue_rows(button_id, media, batch)),
+        )
+
+        if args.respect_limits:
+            bot.RATE_LIMITER = bot.RateLimiter()
+        else:
+            bot.RATE_LIMITER = bot.RateLimiter(1e9, 1e9, 1e9, 1e9)
+
+        fake = FakeBot(args.latency_ms / 1000, args.retry_after_rate, args.error_rate, args.timeout_rate, args.seed,
+                       args.error_kind)
+        latencies = []
+        original_send = bot.send_message_with_backoff
+
+        async def timed_send(*a, **kw):
+            started = time.perf_counter()
+            try:
+                return await original_send(*a, **kw)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+        bot.send_message_with_backoff = timed_send
+        context = types.SimpleNamespace(
+            bot=fake,
+            job=types.SimpleNamespace(data={"button_id": button_id, "notify_chat_id": None, "time": "bench"}),
+            job_queue=FakeJobQueue(),
+        )
+        engine_cls.db_seconds = 0.0
+        # 'sent' rows ledger से हट जाती हैं (पूरा भेजा गया मैसेज history में), इसलिए गिनती यहाँ से
+        delivered = 0
+        original_finalize = bot._finalize_deliveries
+
+        def counting_finalize(conn, msg_ids, max_attempts):
+            nonlocal delivered
+            done, failed = original_finalize(conn, msg_ids, max_attempts)
+            delivered += done
+            return done, failed
+
+        bot._finalize_deliveries = counting_finalize
+        started = time.perf_counter()
+        try:
+            await bot.forward_messages_job(context)
+            job_wall = time.perf_counter() - started
+            deferred = (await bot.db_fetchall("SELECT COUNT(*) FROM deliveries WHERE status='retry'"))[0][0]
+            # job के बाद retry queue को भी ख़ाली करें (RetryDispatcher के passes, due होने तक रुककर)
+            while True:
+                await bot.RETRY.run_pass(fake)
+                next_at = (await bot.db_fetchall("SELECT MIN(retry_at) FROM deliveries WHERE status='retry'"))[0][0]
+                if next_at is None:
+                    break
+                await asyncio.sleep(max(next_at - time.time(), 0.0))
+        finally:
+            wall = time.perf_counter() - started
+            bot.send_message_with_backoff = original_send
+            bot._finalize_deliveries = original_finalize
+            remaining = await bot.count_pending(button_id)
+            dead = (await bot.db_fetchall("SELECT COUNT(DISTINCT message_id) FROM dead_letters"))[0][0]
+            bot.DB.close()
+
+    return {
+        "revision": git_revision(),
+        "channels": channels,
+        "batch": batch,
+        "media": media,
+        "latency_ms": args.latency_ms,
+        "retry_after_rate": args.retry_after_rate,
+        "error_rate": args.error_rate,
+        "error_kind": args.error_kind,
+        "timeout_rate": args.timeout_rate,
+        "delivered_messages": delivered,
+        "dead_lettered_messages": dead,
+        "remaining_messages": remaining,
+        "sends": len(latencies),
+        "api_calls": fake.calls,
+        "messages_per_sec": round(delivered / wall, 2) if wall else None,
+        "sends_per_sec": round(len(latencies) / wall, 2) if wall else None,
+        "send_latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "send_latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "deferred_deliveries": deferred,
+        "db_seconds": round(engine_cls.db_seconds, 4),
+        "job_wall_seconds": round(job_wall, 4),
+        "wall_seconds": round(wall, 4),
+    }
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def str_list(value):
+    return [v for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int_list, default=None, help="default: 1,5,10,MAX_CHANNELS_PER_BUTTON")
+    parser.add_argument("--batches", type=int_list, default=[10, 30, 100])
+    parser.add_argument("--media", type=str_list, default=["text", "photo", "album"])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-kind", choices=ERROR_KINDS, default="transient",
+                        help="--error-rate वाली एरर का प्रकार (permanent = चैनल circuit में parked)")
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--respect-limits", action="store_true", help="असली Telegram rate limits के साथ चलाएँ")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON lines यहाँ भी लिखें")
+    args = parser.parse_args()
+
+    bot = load_bot_module()
+    bot.logger.setLevel("ERROR")
+    channel_counts = args.channels or sorted({1, 5, 10, bot.MAX_CHANNELS_PER_BUTTON})
+
+    out = open(args.output, "a") if args.output else None
+    try:
+        for channels in channel_counts:
+            for batch in args.batches:
+                for media in args.media:
+                    result = asyncio.run(run_cell(bot, args, channels, batch, media))
+                    line = json.dumps(result)
+                    print(line, flush=True)
+                    if out:
+                        out.write(line + "\n")
+    finally:
+        if out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
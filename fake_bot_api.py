@@ -0,0 +1,320 @@
+"""
+Local Telegram Bot API stand-in (soak और fault-injection load tests के लिए)।
+
+    python fake_bot_api.py [--port 8081] [--rules rules.json] [--stats-interval 60]
+    BOT_API_BASE_URL=http://127.0.0.1:8081/bot python "main (4).py"
+
+बॉट जो endpoints इस्तेमाल करता है वो सब यहाँ हैं: getMe, deleteWebhook,
+getUpdates (long polling), sendMessage, sendPhoto, sendVideo, sendDocument,
+sendMediaGroup, answerCallbackQuery, editMessageText।
+
+Fault rules (JSON list, पहला मेल खाने वाला rule लागू होता है):
+
+    [{"method": "sendMessage", "chat_id": "-1001", "action": "retry_after",
+      "retry_after": 5, "probability": 0.1, "count": 100}]
+
+    action: retry_after | timeout (seconds) | drop | chat_not_found |
+            kicked | migrate (migrate_to_chat_id)
+
+Control endpoints:
+    POST /_control/rules     rules की पूरी लिस्ट बदलें
+    POST /_control/updates   synthetic updates (list) getUpdates क्यू में डालें
+    GET  /_control/stats     method/chat वार गिनती और delivery throughput
+    POST /_control/reset     stats और क्यू साफ़ करें
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+SEND_METHODS = {"sendMessage", "sendPhoto", "sendVideo", "sendDocument", "sendMediaGroup"}
+
+
+class FakeTelegram:
+    def __init__(self, rules=None, seed=None):
+        self.rules = list(rules or [])
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.updates_cond = threading.Condition(self.lock)
+        self.updates = deque()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.started = time.monotonic()
+        self.method_counts = Counter()
+        self.fault_counts = Counter()
+        self.deliveries = Counter()      # chat_id -> सफल sends
+        self.delivery_times = deque()    # throughput window के लिए timestamps
+
+    # --- updates ---
+    def push_updates(self, updates):
+        with self.updates_cond:
+            for update in updates:
+                update = dict(update)
+                update["update_id"] = self.next_update_id
+                self.next_update_id += 1
+                self.updates.append(update)
+            self.updates_cond.notify_all()
+
+    def get_updates(self, offset, timeout, limit):
+        deadline = time.monotonic() + timeout
+        with self.updates_cond:
+            while True:
+                while self.updates and offset and self.updates[0]["update_id"] < offset:
+                    self.updates.popleft()
+                if self.updates:
+                    return list(self.updates)[:limit]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.updates_cond.wait(remaining)
+
+    # --- faults ---
+    def match_rule(self, method, params):
+        chat_id = str(params.get("chat_id", ""))
+        with self.lock:
+            for rule in self.rules:
+                if rule.get("method", "*") not in ("*", method):
+                    continue
+                if "chat_id" in rule and str(rule["chat_id"]) != chat_id:
+                    continue
+                if rule.get("count") is not None and rule["count"] <= 0:
+                    continue
+                if self.rng.random() >= rule.get("probability", 1.0):
+                    continue
+                if rule.get("count") is not None:
+                    rule["count"] -= 1
+                self.fault_counts[rule["action"]] += 1
+                return rule
+        return None
+
+    # --- responses ---
+    def _chat(self, chat_id):
+        if isinstance(chat_id, str) and not chat_id.lstrip("-").isdigit():
+            # @username के लिए स्थिर नकली numeric id
+            return {"id": -1000000000000 - zlib.crc32(chat_id.encode()), "type": "channel", "username": chat_id.lstrip("@")}
+        return {"id": int(chat_id), "type": "channel"}
+
+    def _message(self, chat_id, **fields):
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return {"message_id": message_id, "date": int(time.time()), "chat": self._chat(chat_id), **fields}
+
+    @staticmethod
+    def _photo(file_id):
+        return [{"file_id": file_id, "file_unique_id": file_id[-16:], "width": 1280, "height": 720}]
+
+    def record_delivery(self, chat_id):
+        now = time.monotonic()
+        with self.lock:
+            self.deliveries[str(chat_id)] += 1
+            self.delivery_times.append(now)
+            while self.delivery_times and now - self.delivery_times[0] > 60:
+                self.delivery_times.popleft()
+
+    def handle(self, method, params):
+        """(http_status, payload) लौटाता है।"""
+        chat_id = params.get("chat_id")
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}}
+        if method in ("deleteWebhook", "setWebhook", "close", "logOut", "answerCallbackQuery"):
+            return 200, {"ok": True, "result": True}
+        if method == "getWebhookInfo":
+            return 200, {"ok": True, "result": {"url": "", "has_custom_certificate": False, "pending_update_count": 0}}
+        if method == "getUpdates":
+            updates = self.get_updates(
+                int(params.get("offset") or 0), float(params.get("timeout") or 0), int(params.get("limit") or 100)
+            )
+            return 200, {"ok": True, "result": updates}
+        if method == "editMessageText":
+            if chat_id is None:
+                return 200, {"ok": True, "result": True}
+            return 200, {"ok": True, "result": self._message(chat_id, text=params.get("text", ""))}
+        if method == "sendMessage":
+            result = self._message(chat_id, text=params.get("text", ""))
+        elif method == "sendPhoto":
+            result = self._message(chat_id, photo=self._photo(str(params.get("photo"))))
+        elif method == "sendVideo":
+            file_id = str(params.get("video"))
+            result = self._message(chat_id, video={"file_id": file_id, "file_unique_id": file_id[-16:], "width": 1280, "height": 720, "duration": 1})
+        elif method == "sendDocument":
+            file_id = str(params.get("document"))
+            result = self._message(chat_id, document={"file_id": file_id, "file_unique_id": file_id[-16:]})
+        elif method == "sendMediaGroup":
+            media = params.get("media") or []
+            if isinstance(media, str):
+                media = json.loads(media)
+            result = [self._message(chat_id, photo=self._photo(str(m.get("media")))) for m in media]
+        else:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        self.record_delivery(chat_id)
+        return 200, {"ok": True, "result": result}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "uptime_seconds": round(time.monotonic() - self.started, 1),
+                "methods": dict(self.method_counts),
+                "faults": dict(self.fault_counts),
+                "deliveries_total": sum(self.deliveries.values()),
+                "deliveries_per_chat": dict(self.deliveries),
+                "deliveries_per_sec_1m": round(len(self.delivery_times) / 60, 2),
+                "queued_updates": len(self.updates),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.method_counts.clear()
+            self.fault_counts.clear()
+            self.deliveries.clear()
+            self.delivery_times.clear()
+            self.updates.clear()
+            self.started = time.monotonic()
+
+
+def fault_response(rule):
+    action = rule["action"]
+    if action == "retry_after":
+        retry_after = int(rule.get("retry_after", 5))
+        return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                     "parameters": {"retry_after": retry_after}}
+    if action == "chat_not_found":
+        return 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}
+    if action == "kicked":
+        return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was kicked from the channel chat"}
+    if action == "migrate":
+        return 400, {"ok": False, "error_code": 400, "description": "Bad Request: group chat was upgraded to a supergroup chat",
+                     "parameters": {"migrate_to_chat_id": int(rule.get("migrate_to_chat_id", -1001))}}
+    return None
+
+
+def make_handler(api: FakeTelegram):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _read_params(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            ctype = self.headers.get("Content-Type", "")
+            if not body:
+                return {}
+            if ctype.startswith("application/json"):
+                return json.loads(body)
+            params = dict(parse_qsl(body.decode()))
+            # PTB जटिल values (media, reply_markup) JSON string के रूप में भेजता है
+            for key in ("media", "reply_markup"):
+                if key in params:
+                    try:
+                        params[key] = json.loads(params[key])
+                    except ValueError:
+                        pass
+            return params
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _control(self, path, params):
+            if path == "/_control/stats":
+                return self._send(200, api.stats())
+            if path == "/_control/rules":
+                with api.lock:
+                    api.rules = list(params if isinstance(params, list) else params.get("rules", []))
+                return self._send(200, {"ok": True, "rules": len(api.rules)})
+            if path == "/_control/updates":
+                api.push_updates(params if isinstance(params, list) else [params])
+                return self._send(200, {"ok": True})
+            if path == "/_control/reset":
+                api.reset()
+                return self._send(200, {"ok": True})
+            return self._send(404, {"ok": False})
+
+        def _dispatch(self):
+            path = urlparse(self.path).path
+            try:
+                params = self._read_params()
+            except ValueError:
+                return self._send(400, {"ok": False, "error_code": 400, "description": "Bad Request: can't parse body"})
+            if path.startswith("/_control/"):
+                return self._control(path, params)
+
+            # /bot<token>/<method>
+            parts = path.strip("/").split("/")
+            if len(parts) != 2 or not parts[0].startswith("bot"):
+                return self._send(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            method = parts[1]
+            with api.lock:
+                api.method_counts[method] += 1
+
+            rule = api.match_rule(method, params) if method != "getUpdates" else None
+            if rule is not None:
+                if rule["action"] == "drop":
+                    self.close_connection = True
+                    try:
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    return
+                if rule["action"] == "timeout":
+                    time.sleep(float(rule.get("seconds", 65)))
+                    return self._send(504, {"ok": False, "error_code": 504, "description": "Gateway Timeout"})
+                response = fault_response(rule)
+                if response is not None:
+                    return self._send(*response)
+            self._send(*api.handle(method, params))
+
+        do_GET = _dispatch
+        do_POST = _dispatch
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rules", help="fault rules की JSON फ़ाइल")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="हर N सेकंड पर stats JSON प्रिंट करें (0 = बंद)")
+    args = parser.parse_args()
+
+    rules = []
+    if args.rules:
+        with open(args.rules) as f:
+            rules = json.load(f)
+    api = FakeTelegram(rules, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(api))
+    server.daemon_threads = True
+    print(f"Fake Bot API listening on http://{args.host}:{args.port}/bot<token>/", flush=True)
+
+    if args.stats_interval > 0:
+        def report():
+            while True:
+                time.sleep(args.stats_interval)
+                print(json.dumps(api.stats()), flush=True)
+
+        threading.Thread(target=report, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,152 @@
+import atexit
 import logging
+import logging.handlers
 import sqlite3
 import pytz
 import re
 import asyncio
+import collections
+import contextlib
+import contextvars
+import csv
+import io
 import os
 import json
+import random
+import sys
+import hashlib
+import heapq
+import hmac
 import httpx
+import importlib.util
+import itertools
+import multiprocessing
+import socket
+import types
 import time
+import queue
+import secrets
+import signal
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import wraps
-from datetime import datetime, time as dtime
+from datetime import datetime, timedelta
 from typing import List
 from urllib.parse import urlparse
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, error
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+    error,
+)
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     ContextTypes,
     filters,
 )
 
 # =====================
-# Logging
+# Logging (queue handler -> background thread, JSON records)
 # =====================
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # 'json' या 'text'
+LOG_QUEUE_SIZE = 10000          # भरने पर नए records छोड़ दिए जाते हैं (event loop कभी नहीं रुकता)
+LOG_SEND_SAMPLE_RATE = float(os.environ.get("LOG_SEND_SAMPLE_RATE", "0.01"))  # per-send DEBUG records का अनुपात
+
+# हर record में अपने आप जुड़ने वाले ids — tasks/fan-out में contextvars से पहुँचते हैं
+CURRENT_BUTTON = contextvars.ContextVar("current_button", default="")
+CURRENT_JOB = contextvars.ContextVar("current_job", default="")
+TRACE_ID = contextvars.ContextVar("trace_id", default="")
+
+
+class ContextFilter(logging.Filter):
+    """Record बनाने वाले thread/task के contextvars record पर लिखें (queue में जाने से पहले)।"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.button_id = CURRENT_BUTTON.get()
+        record.job = CURRENT_JOB.get()
+        record.trace_id = TRACE_ID.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("button_id", "job", "trace_id"):
+            value = getattr(record, key, "")
+            if value:
+                entry[key] = value
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Event loop पर सिर्फ़ record queue में डालता है; formatting और stderr I/O listener
+    thread पर होते हैं। prepare() को no-op रखा है ताकि msg % args भी वहीं (lazy) बने —
+    इसलिए log args में बाद में बदलने वाली mutable चीज़ें न दें।
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+            LOG_DROPPED.inc()
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    stream = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(button_id)s %(job)s %(trace_id)s] %(message)s'
+        ))
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    # हर Bot API call पर httpx की INFO line — fan-out में यही सबसे ज़्यादा शोर था
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def send_log_sampled() -> bool:
+    """Per-send DEBUG records का sampling: DEBUG बंद हो तो record बनता ही नहीं।"""
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SEND_SAMPLE_RATE
+
+
+LOG_LISTENER = setup_logging()
 logger = logging.getLogger(__name__)
 
 try:
@@ -45,25 +164,347 @@ TOKEN = "7624784085:AAG3TTp5yYvnwbYz2SW4ZcWtwlRL8jUKT28"  # अपना बॉ
 ADMIN_IDS = [5865209445]           # अपने Telegram User IDs
 OWNER_ID = 5865209445  # अपना ID
 
+# Bot API का base URL — लोकल stand-in (fake_bot_api.py) पर चलाने के लिए बदलें
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL", "https://api.telegram.org/bot")
+BOT_API_BASE_FILE_URL = os.environ.get("BOT_API_BASE_FILE_URL", "https://api.telegram.org/file/bot")
+# Soak runs: हर N सेकंड पर memory / event-loop lag लॉग करें (0 = बंद)
+SOAK_MONITOR_INTERVAL = int(os.environ.get("SOAK_MONITOR_INTERVAL", "0"))
+
 # अगर TOKEN या OWNER_ID नहीं मिला तो बॉट को क्रैश कर दें
 if not TOKEN or not OWNER_ID:
     raise ValueError("BOT_TOKEN and OWNER_ID environment variables must be set.")
 
 
 MAX_CHANNELS_PER_BUTTON = 20
+BUTTONS_PER_PAGE = 8
+MAX_BUTTON_LABEL = 40
+DEFAULT_BUTTONS = [
+    ("btn1", "👉 US"),
+    ("btn2", "👉 IOS"),
+    ("btn3", "👉 SFB"),
+    ("btn4", "👉 personal "),
+    ("btn5", "बटन 5"),
+]
 MAX_TIMES_PER_BUTTON = 11
-BATCH_SIZE = 30
+CONFIG_SYNC_SECONDS = 2.0       # दूसरे processes के channels/schedules बदलाव इतनी देर में दिखें
+BATCH_SIZE = 30                 # एक chunk का आकार (और हर स्लॉट का न्यूनतम बजट)
+DRAIN_MODE = True               # False = पुराना व्यवहार, हर स्लॉट में सिर्फ़ BATCH_SIZE
+DRAIN_WINDOW_FRACTION = 0.8     # अगले स्लॉट तक के समय का कितना हिस्सा इस्तेमाल करें
+DRAIN_MAX_MESSAGES = 5000       # एक स्लॉट में अधिकतम मैसेज
+DELIVERY_MAX_ATTEMPTS = 3       # एक (message, channel) डिलीवरी के लिए अधिकतम job-रन
+LEDGER_FLUSH_SIZE = 50          # ledger updates इतने होते ही लिख दें
+LEDGER_FLUSH_INTERVAL = 0.5     # ... या इतने सेकंड बाद
+# Retry queue: RetryAfter / नेटवर्क एरर पर sender sleep नहीं करता — डिलीवरी deliveries.retry_at के
+# साथ DB में जाती है (restart के बाद भी बची रहती है) और RetryDispatcher उसे due होने पर भेजता है
+RETRY_BASE_DELAY = 2.0          # नेटवर्क एरर पर पहली retry; हर अगली पर दोगुना
+RETRY_MAX_DELAY = 60.0
+RETRY_MAX_ATTEMPTS = 5          # इतनी transient असफलताओं के बाद डिलीवरी 'failed' (= एक job-रन की कोशिश)
+RETRY_BATCH = 100               # एक pass में claim होने वाली due retries
+RETRY_CLAIM_SECONDS = 120.0     # claim हुई retry इतने में न निपटे (crash) तो फिर से due
+RETRY_MAX_SLEEP = 30.0          # दूसरे processes की retries के लिए DB कम से कम इतने में देखें
+
+ALBUM_COLLECT_SECONDS = 2.0     # एक media_group के सारे updates इकट्ठा होने का इंतज़ार
+ALBUM_MAX_ITEMS = 10            # sendMediaGroup की सीमा
+ALBUM_MEDIA_TYPES = ('photo', 'video', 'document')
+
+# Dedup: एक ही बटन में वही मैसेज (media_type + file_unique_id / text) दोबारा क्यू न हो
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "merge")  # 'merge' (क्यू वाले पर नया कैप्शन) | 'reject' | 'off'
+DEDUP_WINDOW = int(os.environ.get("DEDUP_WINDOW_HOURS", "24")) * 3600  # इतने समय में भेजा जा चुका भी duplicate
+BLOB_PURGE_BATCH = 2000         # maintenance में एक write में हटने वाले बेकार blobs
+
+IMPORT_CHUNK_SIZE = 5000        # import में एक executemany की rows
+IMPORT_MAX_BYTES = 20 * 1024 * 1024  # Bot API getFile की सीमा
+IMPORT_RESOLVE_CONCURRENCY = 8  # import में file_unique_id के लिए एक साथ getFile calls
 
 DB_NAME = "bot_data.db"
+DB_READ_POOL_SIZE = 4           # read-only कनेक्शन्स का pool
+DB_CACHED_STATEMENTS = 256      # हर कनेक्शन का prepared-statement cache
+DB_CACHE_SIZE_KB = 16000        # PRAGMA cache_size (KiB)
+DB_BUSY_TIMEOUT_MS = 5000
+DB_WRITE_GROUP_MAX = 64         # एक COMMIT में अधिकतम write jobs
+
+# Telegram flood limits (https://core.telegram.org/bots/faq#broadcasting-to-users)
+TG_GLOBAL_RATE = 30.0           # messages/sec पूरे बॉट के लिए
+TG_GLOBAL_BURST = 30.0
+TG_CHAT_RATE = 20 / 60          # एक ग्रुप/चैनल में 20 messages/min
+TG_CHAT_BURST = 20.0
+RATE_LIMIT_DECREASE = 0.5       # RetryAfter पर rate का गुणक
+RATE_LIMIT_INCREASE = 0.05      # हर सफल send पर base_rate का इतना हिस्सा वापस
+RATE_LIMIT_MIN_FRACTION = 0.1   # rate इससे नीचे नहीं जाएगी
+
+# Prometheus metrics endpoint (/metrics, /healthz, /readyz) — 0 = बंद
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+JOB_STALL_SECONDS = 1800        # इतनी देर से कोई chunk पूरा न करने वाली जॉब को readiness "stalled" मानेगा
+
+# Profiling: हर forward job run का span breakdown job_profiles टेबल में (opt-in)
+PROFILE_JOBS = os.environ.get("PROFILE_JOBS", "0") == "1"
+PROFILE_DEFAULT_SECONDS = 30    # /profile का default sampling समय
+PROFILE_MAX_SECONDS = 300
+PROFILE_SAMPLE_INTERVAL = 0.005  # sampling profiler हर 5 ms पर सारे threads के stacks लेता है
+JOB_PROFILES_SHOWN = 10
+
+# Webhook mode: WEBHOOK_PORT > 0 पर run_polling की जगह अपना async HTTP server
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "0"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")  # public HTTPS base URL; खाली = setWebhook न करें (लोकल टेस्ट)
+# setWebhook के साथ भेजा जाता है; WEBHOOK_URL के बिना (लोकल synthetic POSTs) इसे env में देना ज़रूरी है
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_MAX_BODY = 1024 * 1024
+# सिर्फ़ वही update types जिनके handlers रजिस्टर हैं (message + callback_query)
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Schedule dispatcher: सारे बटन्स के स्लॉट्स एक heap में (हर स्लॉट की अलग run_daily जॉब नहीं)
+SCHEDULE_JITTER_SECONDS = float(os.environ.get("SCHEDULE_JITTER_SECONDS", "30"))  # हर (बटन, स्लॉट) का स्थिर offset [0, N)
+SCHEDULE_STAGGER = 0.1          # दो forward runs के शुरू होने के बीच कम से कम इतने सेकंड
+SCHEDULE_MISFIRE_GRACE = 300    # dispatcher इससे ज़्यादा देर से जागे तो वो स्लॉट छोड़ दें
+SCHEDULE_MAX_SLEEP = 60.0       # घड़ी बदलने पर भी dispatcher इतनी देर में दोबारा देखे
+
+# Priority lane: priority > 0 वाले मैसेज स्लॉट का इंतज़ार नहीं करते — due होते ही सेकंडों में
+URGENT_PRIORITY = 10            # UI के "अर्जेंट मैसेज" की priority (import में कोई भी int)
+URGENT_SLOT = "urgent"          # forward_tasks.slot / job data "time" — urgent-only रन
+URGENT_MAX_SLEEP = 300.0        # urgent dispatcher बिना किसी सूचना के भी इतनी देर में DB देखे
+
+# Owner/admin सूचनाएँ: हर event पर अलग मैसेज नहीं — हर chat का एक dashboard (edit) या digest
+NOTIFY_MODE = os.environ.get("NOTIFY_MODE", "dashboard")  # 'dashboard' | 'digest'
+NOTIFY_INTERVAL = 60            # एक chat को अधिकतम इतने सेकंड में एक API call
+NOTIFY_MAX_NEW_PER_HOUR = 6     # नए मैसेज (digest / अलर्ट ping) की प्रति chat सीमा; edits इसमें नहीं गिने जाते
+NOTIFY_DASHBOARD_TTL = 6 * 3600  # dashboard से पुराने events इतने सेकंड बाद हटते हैं
+NOTIFY_MAX_CHARS = 4000         # Telegram की 4096 सीमा से थोड़ा कम
+UNAUTHORIZED_REPLY_TTL = 3600   # एक अनधिकृत user को "❌ आप use नहीं कर सकते" अधिकतम इतने में एक बार
+
+# Worker mode: polling process के साथ N forwarding processes (0 = सब कुछ एक process में)
+FORWARD_WORKERS = int(os.environ.get("FORWARD_WORKERS", "0"))
+WORKER_MAX_TASKS = 4            # एक worker एक साथ कितने बटन चलाए
+WORKER_POLL_INTERVAL = 1.0      # खाली क्यू पर कितनी देर बाद दोबारा देखें
+LEASE_TTL = 60.0                # lease इतने सेकंड में expire, अगर heartbeat न आए
+FORWARD_TASK_MAX_ATTEMPTS = 3   # इतने claims (worker crash / lease खोना) के बाद task छोड़ दें और admin को अलर्ट
+LEASE_HEARTBEAT = 15.0
+
+# क्यू के रखरखाव: भेजे जा चुके मैसेजों का history, retention और incremental vacuum
+HISTORY_RETENTION_DAYS = int(os.environ.get("HISTORY_RETENTION_DAYS", "30"))  # 0 = history न रखें
+MAINTENANCE_INTERVAL = 600      # सेकंड; हर रन छोटे-छोटे हिस्सों में काम करता है
+MAINTENANCE_PURGE_BATCH = 2000  # एक write में history की इतनी rows हटेंगी
+VACUUM_PAGES_PER_STEP = 256     # एक incremental_vacuum में लौटाए जाने वाले pages
+VACUUM_MAX_STEPS = 40           # एक रन में अधिकतम vacuum steps
+ANALYSIS_LIMIT = 400            # PRAGMA optimize के ANALYZE की प्रति-index row सीमा
+
+# HTTP transport: sends और long polling के अलग connection pools
+# (default pool = हर बटन के सारे चैनल × एक साथ चलने वाले बटन + UI के लिए कुछ)
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", str(MAX_CHANNELS_PER_BUTTON * WORKER_MAX_TASKS + 8)))
+HTTP_UPDATES_POOL_SIZE = 2      # getUpdates के लिए अलग pool — long poll sends को नहीं रोकता
+HTTP2 = os.environ.get("HTTP2", "0") == "1"  # h2 package (httpx[http2]) ज़रूरी
+HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_KEEPALIVE_CONNECTIONS", str(HTTP_POOL_SIZE)))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = 60.0             # pool / connect / read / write
+
+# Circuit breaker: स्थायी एरर (kicked, chat not found) पर चैनल को कुछ देर fan-out से बाहर
+CIRCUIT_COOLDOWN = 3600         # पहली बार trip पर; हर अगली trip पर दोगुना
+CIRCUIT_MAX_COOLDOWN = 86400
+PERMANENT_CHAT_ERRORS = (
+    "chat not found", "channel_private", "chat_write_forbidden",
+    "not enough rights", "need administrator rights", "have no rights",
+)
+DEAD_LETTERS_SHOWN = 10         # डेड-लेटर स्क्रीन पर कितने चैनल दिखें
+
+
+# =====================
+# Metrics (Prometheus text format)
+# =====================
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        METRICS.register(self)
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def replace(self, values) -> None:
+        """पूरी सीरीज़ बदलें: values = {(label, ...): value}"""
+        self._values = dict(values)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for key, (counts, total, count) in self._values.items():
+            for bound, c in zip(self.buckets, counts):
+                labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {c}")
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: Metric) -> None:
+        self._metrics.append(metric)
+
+    def add_collector(self, fn) -> None:
+        """async fn() जो scrape से ठीक पहले gauges अपडेट करे (जैसे queue depth)।"""
+        self._collectors.append(fn)
+
+    async def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                await fn()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", fn.__name__, e)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+SEND_LATENCY = Histogram("bot_send_latency_seconds", "One delivery attempt in send_message_with_backoff", ("button", "channel"))
+SEND_RESULTS = Counter("bot_sends_total", "Channel deliveries by result", ("button", "result"))
+RETRY_AFTER_SECONDS = Counter("bot_retry_after_wait_seconds_total", "Seconds Telegram asked us to wait (RetryAfter)", ("channel",))
+NETWORK_RETRIES = Counter("bot_network_retries_total", "Network errors deferred to the retry queue", ("channel",))
+RETRY_QUEUE = Gauge("bot_retry_queue_deliveries", "Deliveries waiting in the retry queue per button", ("button",))
+PENDING_MESSAGES = Gauge("bot_pending_messages", "Queued messages per button (pending + sending)", ("button",))
+JOB_DURATION = Histogram("bot_job_duration_seconds", "forward_messages_job run time", ("button",))
+JOB_LAG = Histogram("bot_job_lag_seconds", "How late forward_messages_job started vs. its HH:MM slot (+ jitter)", ())
+JOBS_RUNNING = Gauge("bot_jobs_running", "forward_messages_job runs in progress", ())
+LOOP_LAG_GAUGE = Gauge("bot_event_loop_lag_seconds", "Latest measured event-loop lag", ())
+DB_CALL_SECONDS = Histogram("bot_db_call_seconds", "SQLite call latency as seen by the event loop", ("kind",))
+UPDATE_HANDLING = Histogram("bot_update_handling_seconds", "Update receipt (webhook) or dispatch (polling) to handlers done", ("mode",))
+LOG_DROPPED = Counter("bot_log_records_dropped_total", "Log records dropped because the log queue was full", ())
+SCHEDULED_SLOTS = Gauge("bot_scheduled_slots", "Enabled (button, HH:MM) slots in the schedule dispatcher", ())
+SCHEDULE_SKIPPED = Counter("bot_schedule_skipped_total", "Slots the dispatcher did not run", ("reason",))
+URGENT_DELIVERY_DELAY = Histogram("bot_urgent_delivery_delay_seconds", "Urgent message due time to its send pass", ())
+NOTIFY_EVENTS = Counter("bot_notify_events_total", "Owner/admin notification events by kind", ("kind",))
+NOTIFY_CALLS = Counter("bot_notify_api_calls_total", "Bot API calls made for notifications", ("method",))
+ENQUEUE_RESULTS = Counter("bot_enqueue_total", "Messages offered to the queue by dedup result", ("result",))
+HTTP_POOL_WAIT = Histogram("bot_http_pool_wait_seconds", "Time a Bot API request waited for a pooled connection", ("pool",))
+
+# चल रही forward jobs: (button_id, slot) -> आख़िरी progress (शुरुआत या पूरा हुआ chunk) का monotonic समय
+RUNNING_JOBS = {}
+
+# Profiling mode में मौजूदा job run के spans: name -> [seconds, count]
+# (fan-out tasks इसी dict में जोड़ते हैं, इसलिए concurrent spans का जोड़ wall time से ज़्यादा हो सकता है)
+JOB_SPANS = contextvars.ContextVar("job_spans", default=None)
+
+
+def add_span(name: str, seconds: float, count: int = 1) -> None:
+    spans = JOB_SPANS.get()
+    if spans is not None:
+        total = spans.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += count
+
+
+@contextlib.contextmanager
+def span(name: str):
+    if JOB_SPANS.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - started)
 
 
 # =====================
 # SQLite only for Metadata (channels, schedules, users)
 # =====================
 def init_db() -> None:
-    conn = sqlite3.connect(DB_NAME)
+    DB.run_write_sync(_create_schema)
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
     c = conn.cursor()
 
+    # बटन रजिस्ट्री — पहली बार बनने पर पुराने 5 बटन seed होते हैं
+    buttons_existed = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='buttons'"
+    ).fetchone() is not None
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS buttons (
+            button_id TEXT PRIMARY KEY, -- 'btn<N>', इसमें '_' नहीं होना चाहिए
+            label TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_buttons_position ON buttons(position, button_id)")
+    if not buttons_existed:
+        c.executemany(
+            "INSERT OR IGNORE INTO buttons (button_id, label, position) VALUES (?, ?, ?)",
+            [(bid, label, i) for i, (bid, label) in enumerate(DEFAULT_BUTTONS, 1)],
+        )
+
     # messages table हटाया गया है (SQlite queue use हो रही है)
     c.execute("""
         CREATE TABLE IF NOT EXISTS channels (
@@ -81,6 +522,67 @@ def init_db() -> None:
         )
     """)
 
+    # channels/schedules के हर बदलाव पर बटन का seq बढ़े — दूसरे processes (workers) का
+    # ButtonConfigCache इसी से जानता है कि उसकी कॉपी पुरानी हो गई
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS config_changes (
+            button_id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    """)
+    for table in ("channels", "schedules"):
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            c.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_config AFTER {event} ON {table}
+                BEGIN
+                    INSERT OR REPLACE INTO config_changes (button_id, seq)
+                    VALUES ({row}.button_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM config_changes));
+                END
+            """)
+
+    # Worker mode: शेड्यूल स्लॉट से बने काम, और उन पर lease
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS forward_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            button_id TEXT NOT NULL,
+            slot TEXT,
+            notify_chat_id INTEGER,
+            owner TEXT,              -- NULL = अभी किसी ने claim नहीं किया
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_forward_tasks_owner ON forward_tasks(owner, lease_expires)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS leases (
+            resource TEXT PRIMARY KEY, -- 'button:<button_id>'
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL
+        )
+    """)
+    # Worker processes की सूचनाएँ / रिमाइंडर अनुरोध — main process का Notifier इन्हें उठाता है
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS notify_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,      -- Notifier kind, या 'remind' = खाली-क्यू रिमाइंडर शेड्यूल करें
+            key TEXT,
+            text TEXT
+        )
+    """)
+
+    # बटन की फॉरवर्डिंग चालू है या नहीं — startup पर जॉब्स इसी से वापस बनती हैं
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS forwarding (
+            button_id TEXT PRIMARY KEY,
+            enabled INTEGER NOT NULL DEFAULT 0,
+            notify_chat_id INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
     c.execute("""
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY,
@@ -96,52 +598,445 @@ def init_db() -> None:
     CREATE TABLE IF NOT EXISTS messages (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         button_id TEXT NOT NULL,
-        content TEXT,
+        content TEXT, -- album के लिए items का JSON
+        media_type TEXT NOT NULL, -- 'text', 'photo', 'video', 'document', 'album'
+        file_id TEXT,
+        status TEXT DEFAULT 'pending', -- 'pending', 'sending', 'failed'
+        blob_id INTEGER, -- message_blobs.id; NULL = पूरा payload इसी row में (पुरानी/replay rows)
+        priority INTEGER NOT NULL DEFAULT 0, -- > 0 = urgent lane
+        send_at REAL -- इससे पहले नहीं भेजना (epoch); NULL = जब भी बारी आए
+    )
+    """)
+    _ensure_column(c, "messages", "blob_id", "INTEGER")
+    _ensure_column(c, "messages", "priority", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(c, "messages", "send_at", "REAL")
+
+    # एक जैसे payloads एक ही बार: text का content या media का file_id यहाँ, caption/album JSON row में
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS message_blobs (
+        id INTEGER PRIMARY KEY,
+        hash TEXT NOT NULL UNIQUE, -- content_hash(): media_type + file_unique_id/content
         media_type TEXT NOT NULL,
+        content TEXT,
         file_id TEXT,
-        status TEXT DEFAULT 'pending' -- 'pending', 'sent'
+        created_at REAL NOT NULL
     )
     """)
     # ------------------------------------
 
+    # पूरी तरह डिलीवर हुए मैसेज यहाँ archive होते हैं (HISTORY_RETENTION_DAYS तक)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS messages_history (
+        id INTEGER PRIMARY KEY, -- messages.id ही
+        button_id TEXT NOT NULL,
+        content TEXT,
+        media_type TEXT NOT NULL,
+        file_id TEXT,
+        delivered_at REAL NOT NULL,
+        blob_id INTEGER
+    )
+    """)
+    _ensure_column(c, "messages_history", "blob_id", "INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_history_delivered ON messages_history(delivered_at)")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_history_blob ON messages_history(blob_id, button_id, delivered_at) "
+        "WHERE blob_id IS NOT NULL"
+    )
+
+    # जो डिलीवरी हो ही नहीं सकी (कोशिशें ख़त्म या चैनल parked) — owner देखकर replay कर सकता है
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS dead_letters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message_id INTEGER NOT NULL,
+        button_id TEXT NOT NULL,
+        channel_id TEXT NOT NULL,
+        content TEXT,
+        media_type TEXT NOT NULL,
+        file_id TEXT,
+        reason TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dead_letters_button ON dead_letters(button_id, channel_id)")
+
+    # PROFILE_JOBS=1 पर हर forward job run का span breakdown
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS job_profiles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        button_id TEXT NOT NULL,
+        slot TEXT,
+        started_at REAL NOT NULL,
+        wall_seconds REAL NOT NULL,
+        spans TEXT NOT NULL -- JSON: {name: {"seconds": s, "count": n}}
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_job_profiles_button ON job_profiles(button_id, id)")
+
+    # Circuit breaker की स्थिति (processes के बीच साझा)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS channel_health (
+        channel_id TEXT PRIMARY KEY,
+        reason TEXT,
+        failures INTEGER NOT NULL DEFAULT 0,
+        tripped_at REAL NOT NULL,
+        retry_at REAL NOT NULL -- इसके बाद एक probe send की इजाज़त (half-open)
+    )
+    """)
+
+    # हर (message, channel) की डिलीवरी का हिसाब — crash के बाद resume के लिए
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS deliveries (
+        message_id INTEGER NOT NULL,
+        channel_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'sent', 'failed', 'retry', 'dead'
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (message_id, channel_id)
+    ) WITHOUT ROWID
+    """)
+    # 'retry' = transient असफलता, retry_at पर RetryDispatcher दोबारा भेजेगा
+    _ensure_column(c, "deliveries", "retries", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(c, "deliveries", "retry_at", "REAL")
+    _ensure_column(c, "deliveries", "claimed_by", "TEXT")  # retry pass जिसने claim किया; retry_at तब claim की expiry
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_retry ON deliveries(retry_at) WHERE status='retry'")
+
     c.execute("CREATE INDEX IF NOT EXISTS idx_channels_button ON channels(button_id)")
+    # एक बटन में एक चैनल सिर्फ़ एक बार — पुरानी duplicate rows पहले हटाएँ
+    has_unique = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_channels_button_channel'"
+    ).fetchone() is not None
+    if not has_unique:
+        c.execute("DELETE FROM channels WHERE id NOT IN (SELECT MIN(id) FROM channels GROUP BY button_id, channel_id)")
+        c.execute("CREATE UNIQUE INDEX idx_channels_button_channel ON channels(button_id, channel_id)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_schedules_button ON schedules(button_id)")
     c.execute("CREATE INDEX IF NOT EXISTS idx_users_authorized ON users(is_authorized)")
-      # --- नई टेबल के लिए इंडेक्स जोड़ें ---
-    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_button_status ON messages(button_id, status)")
-    # ------------------------------------
+    # messages सिर्फ़ क्यू है: partial indexes में सिर्फ़ ज़िंदा/failed rows रहती हैं, इसलिए
+    # COUNT और drain क्वेरी क्यू के आकार पर चलती हैं, पूरे इतिहास पर नहीं
+    c.execute("DROP INDEX IF EXISTS idx_messages_button_status")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_queue ON messages(button_id, id) "
+        "WHERE status IN ('pending', 'sending')"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_failed ON messages(button_id, id) WHERE status='failed'")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_blob ON messages(blob_id, button_id) WHERE blob_id IS NOT NULL")
+    # urgent lane की lookups (due / अगला send_at) सिर्फ़ इसी index से, table rows पढ़े बिना
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_lanes ON messages(button_id, status, priority, send_at, id)"
+    )
 
 
-    conn.commit()
-    conn.close()
+def _ensure_column(c, table: str, column: str, decl: str) -> None:
+    """पुरानी DB में नया column जोड़ें (CREATE TABLE IF NOT EXISTS मौजूदा टेबल नहीं बदलता)।"""
+    if column not in {row[1] for row in c.execute(f"PRAGMA table_info({table})")}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
 
 
-# Async DB helpers (run sync sqlite in executor safely)
-async def db_fetchall(query: str, params=()):
-    loop = asyncio.get_event_loop()
+# =====================
+# Storage engine: one writer thread + read pool (WAL)
+# =====================
+class SQLiteEngine:
+    """
+    लंबे समय तक खुले रहने वाले SQLite कनेक्शन्स।
+
+    सभी writes एक dedicated writer thread पर एक ही कनेक्शन से चलते हैं; queue में
+    जमा हुए writes एक ही transaction (group commit) में commit होते हैं और हर write
+    अपने SAVEPOINT में चलता है ताकि एक की गलती बाकी को rollback न करे।
+    Reads एक छोटे thread pool पर read-only कनेक्शन्स से चलते हैं (WAL की वजह से
+    reads writer को ब्लॉक नहीं करते)। हर कनेक्शन sqlite3 का prepared-statement
+    cache (cached_statements) इस्तेमाल करता है।
+    """
+
+    def __init__(self, path: str, read_pool_size: int = DB_READ_POOL_SIZE):
+        self.path = path
+        self.read_pool_size = read_pool_size
+        self._write_q: "queue.Queue" = queue.Queue()
+        self._writer = None
+        self._readers = None
+        self._reader_conns = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._start_error = None
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            isolation_level=None,  # transactions हम खुद BEGIN/COMMIT से संभालते हैं
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS,
+        )
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        if not readonly:
+            # नई DB पर पहली table से पहले लगना ज़रूरी है; पुरानी DB के लिए migrate_auto_vacuum()
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+        return conn
 
-    def _do():
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute(query, params)
-        rows = c.fetchall()
+    def start(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._ready.clear()
+            self._start_error = None
+            self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+            self._writer.start()
+            self._ready.wait()
+            if self._start_error is not None:
+                self._writer = None
+                raise self._start_error
+            self._readers = ThreadPoolExecutor(
+                max_workers=self.read_pool_size, thread_name_prefix="sqlite-reader"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                return
+            self._write_q.put(None)
+            self._writer.join()
+            self._writer = None
+            self._readers.shutdown(wait=True)
+            self._readers = None
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns = []
+            self._local = threading.local()
+
+    # --- writer thread ---
+    def _writer_loop(self) -> None:
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self._start_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        stop = False
+        while not stop:
+            item = self._write_q.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < DB_WRITE_GROUP_MAX:
+                try:
+                    nxt = self._write_q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            try:
+                self._run_write_batch(conn, batch)
+            except BaseException as e:
+                # writer thread किसी हाल में न मरे — वरना आगे का हर run_write हमेशा अटका रहेगा
+                logger.exception("SQLite write batch failed")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
         conn.close()
-        return rows
 
-    return await loop.run_in_executor(None, _do)
+    @staticmethod
+    def _run_write_batch(conn: sqlite3.Connection, batch) -> None:
+        live = [(fn, fut) for fn, fut in batch if fut.set_running_or_notify_cancel()]
+        if not live:
+            return
+        results = []
+        try:
+            # दूसरा process (worker, import, VACUUM) busy_timeout से ज़्यादा lock रखे तो यहीं
+            # "database is locked" — पूरा batch उसी एरर से fail, loop चलता रहता है
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, fut in live:
+                conn.execute("SAVEPOINT job")
+                try:
+                    res = fn(conn)
+                except BaseException as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((fut, None, e))
+                else:
+                    conn.execute("RELEASE job")
+                    results.append((fut, res, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    logger.exception("ROLLBACK after failed write batch failed")
+            for _, fut in live:
+                fut.set_exception(e)
+            return
+        for fut, res, exc in results:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(res)
+
+    # --- readers ---
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(readonly=True)
+            self._local.conn = conn
+            with self._lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    # --- public API ---
+    def submit_write(self, fn) -> Future:
+        """fn(conn) writer thread पर चलता है; fn खुद BEGIN/COMMIT न करे।"""
+        self.start()
+        writer = self._writer
+        if writer is None or not writer.is_alive():
+            raise sqlite3.OperationalError("SQLite writer thread is not running")
+        fut: Future = Future()
+        self._write_q.put((fn, fut))
+        return fut
+
+    def submit_read(self, fn) -> Future:
+        self.start()
+        return self._readers.submit(lambda: fn(self._reader_conn()))
+
+    async def run_write(self, fn):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(self.submit_write(fn))
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_CALL_SECONDS.observe(elapsed, kind="write")
+            add_span("db_write", elapsed)
+
+    async def run_read(self, fn):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(self.submit_read(fn))
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_CALL_SECONDS.observe(elapsed, kind="read")
+            add_span("db_read", elapsed)
+
+    def run_write_sync(self, fn):
+        return self.submit_write(fn).result()
+
+    async def fetchall(self, query: str, params=()):
+        return await self.run_read(lambda conn: conn.execute(query, params).fetchall())
+
+    async def execute(self, query: str, params=()) -> int:
+        return await self.run_write(lambda conn: conn.execute(query, params).rowcount)
+
+    async def executemany(self, query: str, seq_of_params) -> int:
+        return await self.run_write(lambda conn: conn.executemany(query, seq_of_params).rowcount)
+
+
+DB = SQLiteEngine(DB_NAME)
+
+
+# Async DB helpers (सब कुछ DB engine से होकर जाता है)
+async def db_fetchall(query: str, params=()):
+    return await DB.fetchall(query, params)
 
 
 async def db_execute(query: str, params=()):
-    loop = asyncio.get_event_loop()
+    return await DB.execute(query, params)
 
-    def _do():
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute(query, params)
-        conn.commit()
-        conn.close()
 
-    await loop.run_in_executor(None, _do)
+async def db_executemany(query: str, seq_of_params):
+    return await DB.executemany(query, seq_of_params)
+
+
+# =====================
+# Button config cache (channels + schedules)
+# =====================
+class ButtonConfig:
+    __slots__ = ("channels", "schedules")
+
+    def __init__(self, channels=(), schedules=()):
+        self.channels = tuple(channels)
+        self.schedules = tuple(sorted(schedules))
+
+
+class ButtonConfigCache:
+    """
+    हर बटन के channels/schedules की in-memory कॉपी। startup पर load_all() से
+    भरती है; channels/schedules बदलने वाले हर handler को invalidate() बुलाना
+    होता है। Miss पर DB से लोड होकर cache में रखी जाती है।
+    दूसरे process के बदलाव config_changes (triggers) से आते हैं: get() हर
+    CONFIG_SYNC_SECONDS पर sync() करती है।
+    """
+
+    def __init__(self):
+        self._configs = {}
+        self._generation = {}
+        self._seq = 0
+        self._synced_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    async def sync(self) -> None:
+        """config_changes में पिछली sync के बाद बदले बटन invalidate करें।"""
+        self._synced_at = time.monotonic()
+        rows = await db_fetchall("SELECT button_id, seq FROM config_changes WHERE seq > ?", (self._seq,))
+        for button_id, seq in rows:
+            self.invalidate(button_id)
+            self._seq = max(self._seq, seq)
+
+    async def load_all(self) -> None:
+        rows = await db_fetchall("SELECT MAX(seq) FROM config_changes")
+        self._seq = rows[0][0] or 0
+        self._synced_at = time.monotonic()
+        channel_rows = await db_fetchall("SELECT button_id, channel_id FROM channels ORDER BY id")
+        schedule_rows = await db_fetchall("SELECT button_id, schedule_time FROM schedules")
+        channels, schedules = {}, {}
+        for button_id, channel_id in channel_rows:
+            channels.setdefault(button_id, []).append(channel_id)
+        for button_id, schedule_time in schedule_rows:
+            schedules.setdefault(button_id, []).append(schedule_time)
+        self._configs = {
+            button_id: ButtonConfig(channels.get(button_id, ()), schedules.get(button_id, ()))
+            for button_id in set(channels) | set(schedules)
+        }
+        logger.info("Button config cache loaded for %d buttons", len(self._configs))
+
+    async def get(self, button_id: str) -> ButtonConfig:
+        if time.monotonic() - self._synced_at > CONFIG_SYNC_SECONDS:
+            await self.sync()
+        config = self._configs.get(button_id)
+        if config is not None:
+            self.hits += 1
+            return config
+        self.misses += 1
+        generation = self._generation.get(button_id, 0)
+        channel_rows = await db_fetchall("SELECT channel_id FROM channels WHERE button_id=? ORDER BY id", (button_id,))
+        schedule_rows = await db_fetchall("SELECT schedule_time FROM schedules WHERE button_id=?", (button_id,))
+        config = ButtonConfig([r[0] for r in channel_rows], [r[0] for r in schedule_rows])
+        # लोड के दौरान invalidate हुआ हो तो पुराना डेटा cache न करें
+        if self._generation.get(button_id, 0) == generation:
+            self._configs[button_id] = config
+        return config
+
+    async def channels(self, button_id: str):
+        return (await self.get(button_id)).channels
+
+    async def schedules(self, button_id: str):
+        return (await self.get(button_id)).schedules
+
+    def invalidate(self, button_id: str) -> None:
+        self._configs.pop(button_id, None)
+        self._generation[button_id] = self._generation.get(button_id, 0) + 1
+
+    def stats(self) -> dict:
+        return {"buttons": len(self._configs), "hits": self.hits, "misses": self.misses}
+
+
+CONFIG_CACHE = ButtonConfigCache()
 
 # Utils
 # =====================
@@ -157,40 +1052,33 @@ def is_valid_time_str(s: str) -> bool:
 
 
 
+def is_valid_channel_id(ch: str) -> bool:
+    return ch.startswith("@") or (ch.startswith("-") and ch[1:].isdigit())
+
+
 def owner_only(func):
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user = getattr(update, 'effective_user', None)
         
         if not user:
-            print("DEBUG: Update received without a user. Ignoring.")
+            logger.debug("Update received without a user; ignoring")
             return
 
         if user.id != OWNER_ID:
             # --- अनधिकृत पहुंच का प्रयास ---
-            print(f"Unauthorized access attempt by user {user.id} ({user.username or 'N/A'}).")
+            logger.warning("Unauthorized access attempt by user %s (%s)", user.id, user.username or 'N/A')
             
-            # उपयोगकर्ता को संदेश भेजें
-            if update.effective_message:
+            # उपयोगकर्ता को संदेश भेजें — spam burst में हर update पर नहीं, हर user को घंटे में एक बार
+            if update.effective_message and NOTIFIER.should_reply_unauthorized(user.id):
                 await update.effective_message.reply_text(
                     "❌ आप इस बॉट को use नहीं कर सकते!\nकृपया Owner से contact करें।"
                 )
             
-            # एडमिन को सूचना भेजें
-            alert_message = (
-                f"⚠️ *अनधिकृत पहुंच का प्रयास* ⚠️\n\n"
-                f"*User ID:* `{user.id}`\n"
-                f"*Username:* @{user.username or 'N/A'}\n"
-                f"*First Name:* {user.first_name}"
+            # एडमिन को सूचना — अगले dashboard/digest में, user वार गिनती के साथ
+            NOTIFIER.post_admins(
+                "unauthorized", user.id,
+                f"🚫 अनधिकृत पहुंच का प्रयास: {user.id} @{user.username or 'N/A'} ({user.first_name})",
             )
-            for admin_id in ADMIN_IDS:
-                try:
-                    await context.bot.send_message(
-                        chat_id=admin_id,
-                        text=alert_message,
-                        parse_mode='Markdown'
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send unauthorized access alert to admin {admin_id}: {e}")
             # --------------------------------
 
             return # फंक्शन को आगे न चलाएं
@@ -205,13 +1093,37 @@ def owner_only(func):
 # =====================
 # Status (async) - uses SQliteand SQLite
 # =====================
+async def count_pending(button_id: str) -> int:
+    """क्यू में बचे मैसेज: नए ('pending') और अधूरे batch वाले ('sending')।"""
+    rows = await db_fetchall(
+        "SELECT COUNT(*) FROM messages WHERE button_id=? AND status IN ('pending', 'sending')", (button_id,)
+    )
+    return rows[0][0] if rows else 0
+
+
 async def get_button_status(button_id: str) -> str:
-    channels = await db_fetchall("SELECT channel_id FROM channels WHERE button_id=?", (button_id,))
-    schedules = await db_fetchall("SELECT schedule_time FROM schedules WHERE button_id=? ORDER BY schedule_time", (button_id,))
+    config = await CONFIG_CACHE.get(button_id)
+    channels, schedules = config.channels, config.schedules
     
     # --- SQLite से पेंडिंग संदेशों की गिनती करें ---
-    pending_rows = await db_fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='pending'", (button_id,))
-    pending = pending_rows[0][0] if pending_rows else 0
+    pending = await count_pending(button_id)
+    failed_rows = await db_fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='failed'", (button_id,))
+    failed = failed_rows[0][0] if failed_rows else 0
+    lane_rows = await db_fetchall(
+        "SELECT COALESCE(SUM(priority > 0), 0), COALESCE(SUM(send_at > ?), 0) FROM messages "
+        "WHERE button_id=? AND status IN ('pending', 'sending')",
+        (time.time(), button_id),
+    )
+    urgent, deferred = lane_rows[0] if lane_rows else (0, 0)
+    retry_rows = await db_fetchall(
+        "SELECT COUNT(*), MIN(d.retry_at) FROM deliveries d JOIN messages m ON m.id = d.message_id "
+        "WHERE d.status='retry' AND m.button_id=?",
+        (button_id,),
+    )
+    retrying, next_retry = retry_rows[0] if retry_rows else (0, None)
+    dead_rows = await db_fetchall("SELECT COUNT(*) FROM dead_letters WHERE button_id=?", (button_id,))
+    dead = dead_rows[0][0] if dead_rows else 0
+    parked = [ch for ch in channels if CIRCUIT.is_open(ch)]
     # ----------------------------------------------
 
     status = []
@@ -219,196 +1131,1771 @@ async def get_button_status(button_id: str) -> str:
     status.append("")
     status.append(f"चैनल्स: {len(channels)}")
     status.append(f"पेंडिंग मैसेजेस: {pending}")
+    if urgent:
+        status.append(f"⚡ अर्जेंट: {urgent}")
+    if deferred:
+        status.append(f"⏰ आगे के समय के लिए रुके: {deferred}")
+    if failed:
+        status.append(f"असफल मैसेजेस: {failed}")
+    if retrying:
+        when = datetime.fromtimestamp(next_retry, IST).strftime("%H:%M:%S")
+        status.append(f"🔁 retry queue में डिलीवरी: {retrying} (अगली कोशिश {when})")
+    if dead:
+        status.append(f"डेड-लेटर डिलीवरी: {dead}")
+    if parked:
+        status.append(f"रुके हुए चैनल्स (circuit open): {', '.join(parked)}")
     status.append("शेड्यूल टाइम्स:")
     if schedules:
-        for i, row in enumerate(schedules, 1):
-            status.append(f"{i}. {row[0]}")
+        for i, t in enumerate(schedules, 1):
+            status.append(f"{i}. {t}")
     else:
         status.append("(कोई टाइम सेट नहीं)")
     return "\n".join(status)
 
 # =====================
-# Message sending with exponential backoff
-async def send_message_with_backoff(bot, chat_id, text, media_type, file_id):
+# Button registry (paginated menus)
+# =====================
+async def count_buttons() -> int:
+    rows = await db_fetchall("SELECT COUNT(*) FROM buttons")
+    return rows[0][0] if rows else 0
+
+
+async def fetch_button_page(page: int, per_page: int = BUTTONS_PER_PAGE):
     """
-    मैसेज भेजने के लिए एक मज़बूत फ़ंक्शन जो नेटवर्क एरर और फ्लड कंट्रोल को संभालता है।
+    एक पेज के सभी बटन का summary एक ही query में: (button_id, label, channels, pending, times)।
+    हर aggregate सिर्फ़ इसी पेज के बटन्स पर GROUP BY होता है।
     """
-    retry_wait = 2
-    max_retries = 5
-    attempt = 0
+    return await db_fetchall(
+        """
+        WITH page AS (
+            SELECT button_id, label, position FROM buttons
+            ORDER BY position, button_id LIMIT ? OFFSET ?
+        )
+        SELECT p.button_id, p.label, COALESCE(c.n, 0), COALESCE(q.n, 0), s.times
+        FROM page p
+        LEFT JOIN (
+            SELECT button_id, COUNT(*) AS n FROM channels
+            WHERE button_id IN (SELECT button_id FROM page) GROUP BY button_id
+        ) c ON c.button_id = p.button_id
+        LEFT JOIN (
+            SELECT button_id, COUNT(*) AS n FROM messages
+            WHERE status IN ('pending', 'sending') AND button_id IN (SELECT button_id FROM page)
+            GROUP BY button_id
+        ) q ON q.button_id = p.button_id
+        LEFT JOIN (
+            SELECT button_id, GROUP_CONCAT(schedule_time, ' ') AS times FROM schedules
+            WHERE button_id IN (SELECT button_id FROM page) GROUP BY button_id
+        ) s ON s.button_id = p.button_id
+        ORDER BY p.position, p.button_id
+        """,
+        (per_page, page * per_page),
+    )
 
-    while attempt < max_retries:
-        attempt += 1
-        try:
-            if media_type == 'text':
-                await bot.send_message(chat_id=chat_id, text=text, read_timeout=60, write_timeout=60, connect_timeout=60)
-            elif media_type == 'photo':
-                await bot.send_photo(chat_id=chat_id, photo=file_id, caption=text or None, read_timeout=60, write_timeout=60, connect_timeout=60)
-            elif media_type == 'video':
-                await bot.send_video(chat_id=chat_id, video=file_id, caption=text or None, read_timeout=60, write_timeout=60, connect_timeout=60)
-            elif media_type == 'document':
-                await bot.send_document(chat_id=chat_id, document=file_id, caption=text or None, read_timeout=60, write_timeout=60, connect_timeout=60)
-            else:
-                logger.warning(f"Unknown media_type {media_type}")
-            
-            # सफलतापूर्वक भेजा गया, तो लूप से बाहर निकलें
-            return
 
-        except error.RetryAfter as e:
-            # टेलीग्राम ने जितने समय के लिए कहा है, उतने समय रुकें
-            retry_seconds = e.retry_after
-            logger.warning(f"Flood control exceeded for {chat_id}. Retrying in {retry_seconds} seconds.")
-            await asyncio.sleep(retry_seconds)
-            
-        except (error.TimedOut, httpx.ReadError, httpx.ConnectError) as e:
-            # नेटवर्क एरर के लिए फिर से कोशिश करें
-            logger.warning(f"Network error on attempt {attempt} for {chat_id}: {e}. Retrying in {retry_wait}s...")
-            await asyncio.sleep(retry_wait)
-            retry_wait = min(retry_wait * 2, 60) # इंतज़ार का समय बढ़ाएं
+async def render_main_menu(page: int):
+    total = await count_buttons()
+    pages = max(1, (total + BUTTONS_PER_PAGE - 1) // BUTTONS_PER_PAGE)
+    page = min(max(page, 0), pages - 1)
+    rows = await fetch_button_page(page)
 
-        except Exception as e:
-            # किसी अन्य एरर के लिए लॉग करें और बाहर निकलें
-            logger.error(f"An unhandled error occurred for {chat_id}: {e}", exc_info=True)
-            break
-    
-    logger.error(f"Failed to send message to {chat_id} after {max_retries} attempts.")
+    lines = [f"मुख्य मेनू (पेज {page + 1}/{pages}, कुल बटन: {total}):", ""]
+    keyboard = []
+    for button_id, label, channels, pending, times in rows:
+        lines.append(f"{label.strip()} — चैनल: {channels}, पेंडिंग: {pending}, टाइम्स: {times or '-'}")
+        keyboard.append([InlineKeyboardButton(label, callback_data=button_id)])
 
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=f"menu_{page - 1}"))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton("▶️", callback_data=f"menu_{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton("➕ नया बटन", callback_data="new_btn")])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
 
 
+def _insert_button(conn: sqlite3.Connection, label: str) -> str:
+    next_num = conn.execute(
+        "SELECT COALESCE(MAX(CAST(SUBSTR(button_id, 4) AS INTEGER)), 0) + 1 FROM buttons"
+    ).fetchone()[0]
+    next_pos = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM buttons").fetchone()[0]
+    button_id = f"btn{next_num}"
+    conn.execute("INSERT INTO buttons (button_id, label, position) VALUES (?, ?, ?)", (button_id, label, next_pos))
+    return button_id
 
-# =====================
-# Empty Queue Reminder (5 minutes)
-# =====================
-async def empty_queue_reminder(context: ContextTypes.DEFAULT_TYPE):
-    data = context.job.data or {}
-    button_id = data.get("button_id")
-    notify_chat_id = data.get("notify_chat_id")
 
-    try:
-        # SQLite में पेंडिंग संदेशों की गिनती करें
-        pending_rows = await db_fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='pending'", (button_id,))
-        pending_count = pending_rows[0][0] if pending_rows else 0
+async def create_button(label: str) -> str:
+    return await DB.run_write(lambda conn: _insert_button(conn, label))
+
+
+async def rename_button(button_id: str, label: str) -> bool:
+    return await db_execute("UPDATE buttons SET label=? WHERE button_id=?", (label, button_id)) > 0
+
+
+def _purge_button(conn: sqlite3.Connection, button_id: str) -> None:
+    # status की शर्तें partial indexes से मेल खाती हैं
+    for status in ("status IN ('pending', 'sending')", "status='failed'"):
+        conn.execute(
+            f"DELETE FROM deliveries WHERE message_id IN (SELECT id FROM messages WHERE button_id=? AND {status})",
+            (button_id,),
+        )
+        conn.execute(f"DELETE FROM messages WHERE button_id=? AND {status}", (button_id,))
+    conn.execute("DELETE FROM messages_history WHERE button_id=?", (button_id,))
+    conn.execute("DELETE FROM dead_letters WHERE button_id=?", (button_id,))
+    for table in ("channels", "schedules", "forwarding", "forward_tasks", "buttons"):
+        conn.execute(f"DELETE FROM {table} WHERE button_id=?", (button_id,))
+    # worker mode: बचे tasks/lease पर कोई worker हटाए गए बटन को claim न करे
+    conn.execute("DELETE FROM leases WHERE resource=?", (f"button:{button_id}",))
+    conn.execute("DELETE FROM notify_outbox WHERE key IN (?, ?)", (button_id, f"task:{button_id}"))
+
+
+async def delete_button(button_id: str) -> None:
+    await DB.run_write(lambda conn: _purge_button(conn, button_id))
+    CONFIG_CACHE.invalidate(button_id)
+    NOTIFIER.forget(button_id)
+    lock = BUTTON_LOCKS.get(button_id)
+    if lock is not None and not lock.locked():
+        del BUTTON_LOCKS[button_id]
+
+
+# =====================
+# HTTP transport (connection pools)
+# =====================
+class PoolTimedTransport(httpx.AsyncHTTPTransport):
+    """
+    httpcore के trace events से मापता है कि request को connection मिलने में कितना
+    समय लगा: नए connection पर connect_tcp शुरू होने तक, पुराने पर headers भेजने तक।
+    """
+
+    WAIT_DONE_EVENTS = (
+        "connection.connect_tcp.started",
+        "connection.connect_unix_socket.started",
+        "http11.send_request_headers.started",
+        "http2.send_request_headers.started",
+    )
+
+    def __init__(self, pool: str, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        observed = False
+
+        async def trace(event_name, info):
+            nonlocal observed
+            if not observed and event_name in self.WAIT_DONE_EVENTS:
+                observed = True
+                HTTP_POOL_WAIT.observe(time.perf_counter() - started, pool=self.pool)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return await super().handle_async_request(request)
+
+
+class PooledHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest जिसका transport pool size, keepalive, HTTP/2 और pool-wait metric के साथ बनता है।"""
+
+    def __init__(self, pool: str, pool_size: int, http2: bool = False):
+        self._pool = pool
+        self._transport_kwargs = {
+            "limits": httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=min(HTTP_KEEPALIVE_CONNECTIONS, pool_size),
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "http1": not http2,
+            "http2": http2,
+        }
+        super().__init__(
+            connection_pool_size=pool_size,
+            http_version="2" if http2 else "1.1",
+            read_timeout=HTTP_TIMEOUT,
+            write_timeout=HTTP_TIMEOUT,
+            connect_timeout=HTTP_TIMEOUT,
+            pool_timeout=HTTP_TIMEOUT,
+        )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # transport हर बार नया — shutdown के बाद initialize() पर client दोबारा बनता है
+        kwargs = dict(self._client_kwargs, transport=PoolTimedTransport(self._pool, **self._transport_kwargs))
+        return httpx.AsyncClient(**kwargs)
+
+
+def http2_available() -> bool:
+    if not HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2=1 but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def configure_transport(builder, polling: bool = True):
+    """Application builder पर sends और getUpdates के अलग request pools लगाएँ।"""
+    http2 = http2_available()
+    builder = builder.request(PooledHTTPXRequest("bot", HTTP_POOL_SIZE, http2))
+    if polling:
+        # long polling एक ही लंबी request है; HTTP/2 से यहाँ कुछ नहीं मिलता
+        builder = builder.get_updates_request(PooledHTTPXRequest("updates", HTTP_UPDATES_POOL_SIZE))
+    return builder
+
+
+# =====================
+# Rate limiting (global + per-chat token buckets)
+# =====================
+def retry_after_seconds(exc: error.RetryAfter) -> float:
+    value = exc.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class TokenBucket:
+    """
+    Reservation-style token bucket: tokens नेगेटिव जा सकते हैं, और उतना ही
+    इंतज़ार caller को करना होता है। इसलिए asyncio में बिना lock के FIFO जैसा
+    व्यवहार मिलता है। RetryAfter आने पर rate घटती है (multiplicative decrease)
+    और हर सफल send पर धीरे-धीरे base_rate तक वापस बढ़ती है (additive increase)।
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0    # RetryAfter की सज़ा कब तक (monotonic)
+
+    def reserve(self) -> float:
+        """एक token रिज़र्व करें और बताएँ कि भेजने से पहले कितने सेकंड रुकना है।"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def penalize(self, seconds: float) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.tokens, 0)
+        self.updated = max(self.updated, now + seconds)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.rate = max(self.base_rate * RATE_LIMIT_MIN_FRACTION, self.rate * RATE_LIMIT_DECREASE)
+
+    def reward(self) -> None:
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RATE_LIMIT_INCREASE)
+
+
+class RateLimiter:
+    """सभी Bot API sends के लिए साझा limiter: पहले चैट का bucket, फिर global।"""
+
+    def __init__(self, global_rate: float = TG_GLOBAL_RATE, global_burst: float = TG_GLOBAL_BURST,
+                 chat_rate: float = TG_CHAT_RATE, chat_burst: float = TG_CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chats = {}
+
+    def _chat(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id) -> None:
+        wait = self._chat(chat_id).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        wait = self.global_bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def blocked_for(self, chat_id) -> float:
+        """चैट पर RetryAfter की सज़ा के कितने सेकंड बचे हैं (सामान्य pacing इसमें नहीं)।"""
+        bucket = self._chats.get(chat_id)
+        return max(0.0, bucket.blocked_until - time.monotonic()) if bucket is not None else 0.0
+
+    def on_success(self, chat_id) -> None:
+        self._chat(chat_id).reward()
+        self.global_bucket.reward()
+
+    def on_retry_after(self, chat_id, seconds: float) -> None:
+        self._chat(chat_id).penalize(seconds)
+        # global rate भी थोड़ा घटाएँ ताकि बाकी चैट्स पर 429 की लहर न आए
+        self.global_bucket.rate = max(
+            self.global_bucket.base_rate * RATE_LIMIT_MIN_FRACTION,
+            self.global_bucket.rate * RATE_LIMIT_DECREASE,
+        )
+
+
+RATE_LIMITER = RateLimiter()
+
+
+async def send_limited_message(bot, chat_id, text, **kwargs):
+    """Status/alert मैसेज भी उसी limiter से होकर जाते हैं।"""
+    await RATE_LIMITER.acquire(chat_id)
+    try:
+        result = await bot.send_message(chat_id, text, **kwargs)
+    except error.RetryAfter as e:
+        RATE_LIMITER.on_retry_after(chat_id, retry_after_seconds(e))
+        raise
+    RATE_LIMITER.on_success(chat_id)
+    return result
+
+
+# =====================
+# Notifications (coalesced dashboard / digest)
+# =====================
+class Notifier:
+    """
+    Owner/admin सूचनाओं का aggregator। post() कोई API call नहीं करता: event (kind, key)
+    पर dedup होकर chat के buffer में जाता है (वही key दोबारा आए तो text बदलता है और
+    गिनती बढ़ती है)। flush() हर NOTIFY_INTERVAL पर हर बदले हुए chat के लिए एक call करता है —
+    dashboard mode में उसी मैसेज का edit (नया अलर्ट हो तो एक नया मैसेज, ताकि notification
+    बजे), digest mode में पिछले flush के बाद के events का एक नया मैसेज।
+
+    kinds: 'button' (हर बटन का आख़िरी job नतीजा), 'empty' (खाली क्यू रिमाइंडर),
+    बाकी सब अलर्ट ('job_error', 'unauthorized', 'bot_error')।
+
+    relay=True (worker processes): post() कुछ नहीं भेजता, flush() events को notify_outbox
+    में लिखता है और main process का pull_relayed() उन्हें अपने Notifier में डालता है —
+    हर chat में एक ही dashboard रहता है।
+    """
+
+    def __init__(self, mode: str = NOTIFY_MODE, relay: bool = False):
+        self.mode = mode
+        self.relay = relay
+        self.outbox = []            # relay mode: [(chat_id, kind, key, text), ...]
+        self.events = {}            # chat_id -> {(kind, key): [text, count, first_at, last_at]}
+        self.dirty = set()          # पिछले flush के बाद बदले chats
+        self.ping = set()           # जिन chats में नया अलर्ट आया है
+        self.dashboards = {}        # chat_id -> dashboard message_id
+        self.rendered = {}          # chat_id -> आख़िरी भेजा गया text
+        self.new_sends = {}         # chat_id -> deque(नए मैसेज के समय) — hourly cap
+        self.replied = {}           # अनधिकृत user_id -> आख़िरी जवाब का समय
+
+    def post(self, chat_id, kind: str, key, text: str) -> None:
+        if not chat_id:
+            return
+        if self.relay:
+            self.outbox.append((chat_id, kind, key, text))
+            return
+        NOTIFY_EVENTS.inc(kind=kind)
+        events = self.events.setdefault(chat_id, {})
+        now = time.time()
+        entry = events.get((kind, key))
+        if entry is None:
+            events[(kind, key)] = [text, 1, now, now]
+            if kind not in ("button", "empty"):
+                self.ping.add(chat_id)
+        else:
+            entry[0] = text
+            entry[1] += 1
+            entry[3] = now
+        self.dirty.add(chat_id)
+
+    def post_admins(self, kind: str, key, text: str) -> None:
+        for admin_id in ADMIN_IDS:
+            self.post(admin_id, kind, key, text)
+
+    def clear(self, kind: str, key) -> None:
+        """जो स्थिति ख़त्म हो गई (जैसे क्यू अब खाली नहीं) उसे हर chat से हटाएँ।"""
+        for chat_id, events in self.events.items():
+            if events.pop((kind, key), None) is not None:
+                self.dirty.add(chat_id)
+
+    def forget(self, button_id: str) -> None:
+        """हटाए गए बटन की हर सूचना (नतीजा, रिमाइंडर, अलर्ट) dashboards से हटाएँ।"""
+        keys = (button_id, f"task:{button_id}")
+        for chat_id, events in self.events.items():
+            for k in [k for k in events if k[1] in keys]:
+                del events[k]
+                self.dirty.add(chat_id)
+
+    def should_reply_unauthorized(self, user_id: int) -> bool:
+        now = time.time()
+        if now - self.replied.get(user_id, 0.0) < UNAUTHORIZED_REPLY_TTL:
+            return False
+        if len(self.replied) > 10000:
+            self.replied = {u: t for u, t in self.replied.items() if now - t < UNAUTHORIZED_REPLY_TTL}
+        self.replied[user_id] = now
+        return True
+
+    def _may_send_new(self, chat_id, now: float) -> bool:
+        sent = self.new_sends.setdefault(chat_id, collections.deque())
+        while sent and now - sent[0] > 3600:
+            sent.popleft()
+        return len(sent) < NOTIFY_MAX_NEW_PER_HOUR
+
+    def render(self, chat_id, now: float) -> str:
+        events = self.events.get(chat_id, {})
+        if self.mode == "dashboard":
+            for k in [k for k, entry in events.items() if now - entry[3] > NOTIFY_DASHBOARD_TTL]:
+                del events[k]
+        stamp = lambda ts: datetime.fromtimestamp(ts, IST or pytz.utc).strftime("%H:%M")
+        buttons, empty, alerts = [], [], []
+        for (kind, key), (text, count, _, last_at) in sorted(events.items(), key=lambda kv: -kv[1][3]):
+            if kind == "button":
+                buttons.append(f"{stamp(last_at)} {text}")
+            elif kind == "empty":
+                empty.append(str(key))
+            else:
+                alerts.append(f"{stamp(last_at)} {text}" + (f" (×{count})" if count > 1 else ""))
+
+        title = "📊 बॉट डैशबोर्ड" if self.mode == "dashboard" else "📬 सूचनाओं का सार"
+        lines = [f"{title} — {stamp(now)}"]
+        if alerts:
+            lines += ["", "अलर्ट:"] + alerts
+        if empty:
+            lines += ["", "⏰ खाली क्यू (नए मैसेज जोड़ें): " + ", ".join(sorted(empty))]
+        if buttons:
+            lines += ["", "बटन:"] + buttons
+        text = "\n".join(lines)
+        if len(text) > NOTIFY_MAX_CHARS:
+            text = text[:NOTIFY_MAX_CHARS] + "\n…"
+        return text
+
+    async def _send_new(self, bot, chat_id, text: str, now: float) -> None:
+        message = await send_limited_message(bot, chat_id, text)
+        NOTIFY_CALLS.inc(method="sendMessage")
+        self.new_sends.setdefault(chat_id, collections.deque()).append(now)
+        if self.mode == "dashboard":
+            self.dashboards[chat_id] = message.message_id
+
+    async def _deliver(self, bot, chat_id, text: str, now: float) -> bool:
+        """Returns: False अगर hourly cap की वजह से अभी नहीं भेजा जा सका।"""
+        message_id = self.dashboards.get(chat_id) if self.mode == "dashboard" else None
+        if message_id is not None and chat_id not in self.ping:
+            await RATE_LIMITER.acquire(chat_id)
+            try:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+                NOTIFY_CALLS.inc(method="editMessageText")
+                return True
+            except error.BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return True
+                # dashboard मैसेज हटा दिया गया / बहुत पुराना — नया बनाएँ
+                logger.info("Dashboard in %s not editable (%s); posting a new one", chat_id, e)
+        if not self._may_send_new(chat_id, now):
+            if message_id is not None:
+                # ping की सीमा पूरी — कम से कम dashboard अपडेट रहे
+                self.ping.discard(chat_id)
+                return await self._deliver(bot, chat_id, text, now)
+            return False
+        await self._send_new(bot, chat_id, text, now)
+        return True
+
+    async def pull_relayed(self, job_queue) -> None:
+        """Workers के notify_outbox events इसी process में post करें (और रिमाइंडर शेड्यूल करें)।"""
+        def _take(conn: sqlite3.Connection):
+            rows = conn.execute("SELECT id, chat_id, kind, key, text FROM notify_outbox ORDER BY id").fetchall()
+            if rows:
+                conn.execute("DELETE FROM notify_outbox WHERE id <= ?", (rows[-1][0],))
+            return rows
+
+        for _, chat_id, kind, key, text in await DB.run_write(_take):
+            if kind == "remind":
+                schedule_empty_reminder(job_queue, key, chat_id)
+            else:
+                self.post(chat_id, kind, key, text)
+
+    async def flush(self, bot) -> None:
+        if self.relay:
+            outbox, self.outbox = self.outbox, []
+            if outbox:
+                await db_executemany(
+                    "INSERT INTO notify_outbox (chat_id, kind, key, text) VALUES (?, ?, ?, ?)", outbox
+                )
+            return
+        now = time.time()
+        for chat_id in list(self.dirty):
+            text = self.render(chat_id, now)
+            if text == self.rendered.get(chat_id) and chat_id not in self.ping:
+                self.dirty.discard(chat_id)
+                continue
+            try:
+                if not await self._deliver(bot, chat_id, text, now):
+                    continue  # cap पूरा; events जमा रहते हैं
+            except Exception as e:
+                logger.warning("Notification flush to %s failed: %s", chat_id, e)
+                continue
+            self.dirty.discard(chat_id)
+            self.ping.discard(chat_id)
+            self.rendered[chat_id] = text
+            if self.mode == "digest":
+                self.events.pop(chat_id, None)
+
+    async def repost(self, bot, chat_id) -> None:
+        """/dashboard: मौजूदा स्थिति का नया मैसेज (hourly cap के बाहर, owner ने ख़ुद माँगा है)।"""
+        text = self.render(chat_id, time.time())
+        await self._send_new(bot, chat_id, text, time.time())
+        self.dirty.discard(chat_id)
+        self.ping.discard(chat_id)
+        self.rendered[chat_id] = text
+        if self.mode == "digest":
+            self.events.pop(chat_id, None)
+
+
+NOTIFIER = Notifier()
+
+
+async def notify_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    if not NOTIFIER.relay and FORWARD_WORKERS > 0:
+        await NOTIFIER.pull_relayed(context.job_queue)
+    await NOTIFIER.flush(context.bot)
+
+
+# =====================
+# Circuit breaker + chat migration
+# =====================
+class ChannelCircuit:
+    """
+    हर चैनल का circuit breaker। स्थायी एरर पर चैनल 'open' (parked) हो जाता है और
+    retry_at तक उस पर कोई send नहीं होता; उसके बाद अगला send probe है — सफल हुआ
+    तो circuit बंद, फिर से स्थायी एरर आया तो दोगुने cooldown के साथ दोबारा open।
+    स्थिति channel_health टेबल में रहती है; refresh() हर chunk से पहले उसे पढ़ता है।
+    """
+
+    def __init__(self):
+        self._state = {}  # channel_id -> (retry_at, reason)
+
+    async def refresh(self) -> None:
+        rows = await db_fetchall("SELECT channel_id, retry_at, reason FROM channel_health")
+        self._state = {ch: (retry_at, reason) for ch, retry_at, reason in rows}
+
+    def is_open(self, channel_id) -> bool:
+        state = self._state.get(str(channel_id))
+        return state is not None and state[0] > time.time()
+
+    def is_probing(self, channel_id) -> bool:
+        return str(channel_id) in self._state and not self.is_open(channel_id)
+
+    async def trip(self, channel_id, reason: str) -> float:
+        channel_id = str(channel_id)
+        now = time.time()
+
+        def _trip(conn: sqlite3.Connection) -> float:
+            row = conn.execute("SELECT failures FROM channel_health WHERE channel_id=?", (channel_id,)).fetchone()
+            failures = (row[0] if row else 0) + 1
+            retry_at = now + min(CIRCUIT_COOLDOWN * 2 ** (failures - 1), CIRCUIT_MAX_COOLDOWN)
+            conn.execute(
+                "INSERT OR REPLACE INTO channel_health (channel_id, reason, failures, tripped_at, retry_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (channel_id, reason, failures, now, retry_at),
+            )
+            return retry_at
+
+        retry_at = await DB.run_write(_trip)
+        self._state[channel_id] = (retry_at, reason)
+        logger.warning("Circuit open for %s for %.0fs: %s", channel_id, retry_at - now, reason)
+        return retry_at
+
+    async def reset(self, channel_id) -> None:
+        channel_id = str(channel_id)
+        self._state.pop(channel_id, None)
+        await db_execute("DELETE FROM channel_health WHERE channel_id=?", (channel_id,))
+
+
+CIRCUIT = ChannelCircuit()
+CHAT_MIGRATIONS = {}  # पुराना chat_id -> supergroup का नया chat_id (इस process में)
+
+
+def is_permanent_chat_error(exc: Exception) -> bool:
+    if isinstance(exc, error.Forbidden):
+        return True
+    return isinstance(exc, error.BadRequest) and any(s in exc.message.lower() for s in PERMANENT_CHAT_ERRORS)
+
+
+async def apply_chat_migration(old_chat_id, new_chat_id) -> None:
+    """ग्रुप supergroup बन गया: channels टेबल में हर बटन का chat_id नए पर बदलें।"""
+    old_chat_id, new_chat_id = str(old_chat_id), str(new_chat_id)
+    CHAT_MIGRATIONS[old_chat_id] = new_chat_id
+
+    def _migrate(conn: sqlite3.Connection):
+        buttons = [r[0] for r in conn.execute("SELECT button_id FROM channels WHERE channel_id=?", (old_chat_id,))]
+        # जिस बटन में नया id पहले से है वहाँ पुरानी row सिर्फ़ हटेगी (unique index)
+        conn.execute("UPDATE OR IGNORE channels SET channel_id=? WHERE channel_id=?", (new_chat_id, old_chat_id))
+        conn.execute("DELETE FROM channels WHERE channel_id=?", (old_chat_id,))
+        conn.execute("DELETE FROM channel_health WHERE channel_id=?", (old_chat_id,))
+        return buttons
+
+    buttons = await DB.run_write(_migrate)
+    for button_id in buttons:
+        CONFIG_CACHE.invalidate(button_id)
+    logger.warning("Chat %s migrated to %s; updated %d button(s)", old_chat_id, new_chat_id, len(buttons))
+
+
+# =====================
+# Message sending with exponential backoff
+class SendDeferred(Exception):
+    """Transient असफलता (RetryAfter / नेटवर्क): डिलीवरी retry queue में जाए, retry_in सेकंड बाद।"""
+
+    def __init__(self, retry_in: float, reason: str):
+        super().__init__(reason)
+        self.retry_in = retry_in
+        self.reason = reason
+
+
+async def send_message_with_backoff(bot, chat_id, text, media_type, file_id):
+    """
+    एक डिलीवरी की एक कोशिश। सफल होने पर True, स्थायी असफलता पर False। RetryAfter और
+    नेटवर्क एरर पर SendDeferred उठता है — यहाँ कोई sleep नहीं; backoff retry queue
+    (deliveries.retry_at) में लगता है और caller अपना batch बिना रुके पूरा करता है।
+    """
+    started = time.perf_counter()
+    result = "failed"
+    try:
+        ok = await _send_attempt(bot, chat_id, text, media_type, file_id)
+        result = "ok" if ok else "failed"
+        return ok
+    except SendDeferred:
+        result = "deferred"
+        raise
+    finally:
+        button_id = CURRENT_BUTTON.get()
+        elapsed = time.perf_counter() - started
+        SEND_LATENCY.observe(elapsed, button=button_id, channel=chat_id)
+        SEND_RESULTS.inc(button=button_id, result=result)
+        if send_log_sampled():
+            logger.debug(
+                "send %s to %s: %s in %.3fs", media_type, chat_id, result, elapsed,
+                extra={"fields": {"channel": str(chat_id), "result": result, "seconds": round(elapsed, 4)}},
+            )
+
+
+async def _send_once(bot, chat_id, text, media_type, file_id) -> bool:
+    """एक API call; अनजान media_type पर False।"""
+    if media_type == 'text':
+        await bot.send_message(chat_id=chat_id, text=text, read_timeout=60, write_timeout=60, connect_timeout=60)
+    elif media_type == 'photo':
+        await bot.send_photo(chat_id=chat_id, photo=file_id, caption=text or None, read_timeout=60, write_timeout=60, connect_timeout=60)
+    elif media_type == 'video':
+        await bot.send_video(chat_id=chat_id, video=file_id, caption=text or None, read_timeout=60, write_timeout=60, connect_timeout=60)
+    elif media_type == 'document':
+        await bot.send_document(chat_id=chat_id, document=file_id, caption=text or None, read_timeout=60, write_timeout=60, connect_timeout=60)
+    elif media_type == 'album':
+        # पूरा एल्बम एक ही API call में (text में एल्बम का JSON है)
+        await bot.send_media_group(chat_id=chat_id, media=build_album_media(text), read_timeout=60, write_timeout=60, connect_timeout=60)
+    else:
+        logger.warning("Unknown media_type %s", media_type)
+        return False
+    return True
+
+
+async def _send_attempt(bot, chat_id, text, media_type, file_id):
+    # ChatMigrated पर नए chat_id पर तुरंत दोबारा (बिना इंतज़ार); बाकी हर हाल में एक ही call
+    for _ in range(3):
+        chat_id = CHAT_MIGRATIONS.get(str(chat_id), chat_id)
+        with span("rate_limit_wait"):
+            await RATE_LIMITER.acquire(chat_id)
+        try:
+            with span("http_send"):
+                sent = await _send_once(bot, chat_id, text, media_type, file_id)
+            if not sent:
+                return False
+
+            RATE_LIMITER.on_success(chat_id)
+            return True
+
+        except error.RetryAfter as e:
+            # चैट का bucket सज़ा में — इसके बाकी मैसेज भी बिना call के queue में जाएँगे
+            retry_seconds = retry_after_seconds(e)
+            logger.warning("Flood control exceeded for %s. Deferring for %s seconds.", chat_id, retry_seconds)
+            RATE_LIMITER.on_retry_after(chat_id, retry_seconds)
+            RETRY_AFTER_SECONDS.inc(retry_seconds, channel=chat_id)
+            add_span("retry_after_requested", retry_seconds)
+            raise SendDeferred(retry_seconds, "retry_after") from e
+
+        except error.ChatMigrated as e:
+            # नया chat_id टेबल में लगाएँ और उसी पर तुरंत फिर भेजें
+            await apply_chat_migration(chat_id, e.new_chat_id)
+
+        except (error.Forbidden, error.BadRequest) as e:
+            if is_permanent_chat_error(e):
+                await CIRCUIT.trip(chat_id, e.message)
+                return False
+            logger.error("An unhandled error occurred for %s: %s", chat_id, e, exc_info=True)
+            return False
+
+        except error.NetworkError as e:
+            # नेटवर्क एरर (PTB transport failures को NetworkError में लपेटता है; TimedOut भी यही) —
+            # exponential backoff retry queue लगाएगी। BadRequest भी NetworkError है, इसलिए ये ऊपर वाले के बाद।
+            logger.warning("Network error for %s: %s. Deferring to the retry queue.", chat_id, e)
+            NETWORK_RETRIES.inc(channel=chat_id)
+            raise SendDeferred(0.0, "network") from e
+
+        except Exception as e:
+            # किसी अन्य एरर के लिए लॉग करें और बाहर निकलें
+            logger.error("An unhandled error occurred for %s: %s", chat_id, e, exc_info=True)
+            return False
+
+    logger.error("Failed to send message to %s: chat keeps migrating.", chat_id)
+    return False
+
+
+# =====================
+# Fan-out: हर चैनल का अपना worker
+# =====================
+async def fan_out_batch(bot, work, on_result=None):
+    """
+    हर चैनल के लिए एक स्वतंत्र worker जो अपने हिस्से के मैसेज क्रम से भेजता है।
+    धीमा या RetryAfter में फँसा चैनल बाकी चैनलों को नहीं रोकता; हर चैनल में
+    मैसेजेस का क्रम बना रहता है। कुल समय ≈ सबसे धीमे चैनल का समय।
+
+    Transient एरर पर चैनल रुकता नहीं: वो डिलीवरी और उस चैनल के इस chunk के बाकी
+    मैसेज (क्रम बना रहे) retry queue में जाते हैं, और बाकी चैनल चलते रहते हैं।
+
+    work: {channel_id: [(id, content, media_type, file_id), ...]}
+    on_result: async callback(msg_id, channel_id, ok, retry) हर मैसेज के बाद;
+               retry = (retry_in, attempted) जब डिलीवरी retry queue में गई (ok None)
+    Returns: {channel_id: [True/False/None हर मैसेज के लिए, उसी क्रम में]}
+    """
+    async def channel_worker(ch, rows):
+        outcome = []
+        hold_until = 0.0  # इस चैनल पर transient एरर के बाद (monotonic) — तब तक बिना call के queue
+        for msg_id, content, media_type, file_id in rows:
+            retry = None
+            if CIRCUIT.is_open(ch):
+                # parked चैनल पर कोई API call नहीं; ये डिलीवरी dead-letter में जाएँगी
+                ok = False
+            else:
+                wait = max(hold_until - time.monotonic(), RATE_LIMITER.blocked_for(ch))
+                if wait > 0:
+                    ok, retry = None, (wait, False)
+                else:
+                    probing = CIRCUIT.is_probing(ch)
+                    try:
+                        ok = await send_message_with_backoff(bot, ch, content, media_type, file_id)
+                    except SendDeferred as e:
+                        ok, retry = None, (e.retry_in, True)
+                        hold_until = time.monotonic() + max(e.retry_in, RETRY_BASE_DELAY)
+                    if ok and probing:
+                        await CIRCUIT.reset(ch)
+            outcome.append(ok)
+            if on_result is not None:
+                await on_result(msg_id, ch, ok, retry)
+        return ch, outcome
+
+    results = await asyncio.gather(*(channel_worker(ch, rows) for ch, rows in work.items()))
+    return dict(results)
+
+
+# =====================
+# Delivery ledger (per message × channel)
+# =====================
+def _placeholders(n: int) -> str:
+    return ",".join(["?"] * n)
+
+
+def _prepare_deliveries(conn: sqlite3.Connection, msg_ids, channels) -> None:
+    """Batch के हर मैसेज के लिए मौजूदा चैनल्स की ledger rows बनाएँ और उन्हें 'sending' मार्क करें।"""
+    conn.executemany(
+        "INSERT OR IGNORE INTO deliveries (message_id, channel_id) VALUES (?, ?)",
+        [(m, ch) for m in msg_ids for ch in channels],
+    )
+    # जो चैनल अब बटन में नहीं हैं, उनकी बची हुई डिलीवरी छोड़ दें
+    conn.execute(
+        f"DELETE FROM deliveries WHERE message_id IN ({_placeholders(len(msg_ids))}) "
+        f"AND channel_id NOT IN ({_placeholders(len(channels))}) AND status != 'sent'",
+        (*msg_ids, *channels),
+    )
+    conn.execute(
+        f"UPDATE messages SET status='sending' WHERE id IN ({_placeholders(len(msg_ids))}) AND status='pending'",
+        tuple(msg_ids),
+    )
+    # जो retries due हो चुकी हैं वो यही रन भेजेगा; किसी retry pass का claim तभी छूता है जब वो
+    # expire हो गया हो (heartbeat रुक गया) — ज़िंदा claim का retry_at हमेशा आगे रहता है
+    conn.execute(
+        f"UPDATE deliveries SET status='pending', retry_at=NULL, claimed_by=NULL WHERE message_id IN ({_placeholders(len(msg_ids))}) "
+        "AND status='retry' AND retry_at <= ?",
+        (*msg_ids, time.time()),
+    )
+
+
+def _defer_deliveries(conn: sqlite3.Connection, rows, now: float):
+    """
+    Transient असफल डिलीवरी retry queue में: retry_at = now + max(retry_in, backoff), जहाँ
+    backoff = RETRY_BASE_DELAY × 2^retries (सिर्फ़ असली API कोशिशों पर, RETRY_MAX_DELAY तक)।
+    उसी चैनल की पहले वाले मैसेज की retry से पहले कभी नहीं, ताकि चैनल में क्रम बना रहे।
+    RETRY_MAX_ATTEMPTS पूरे होने पर डिलीवरी 'failed' — आगे job-रन / dead-letter वाला रास्ता।
+
+    rows: [(msg_id, channel_id, retry_in, attempted), ...]
+    Returns: सबसे पहली due retry का समय (या None)
+    """
+    conn.executemany(
+        "UPDATE deliveries SET status='retry', retries=retries+?, claimed_by=NULL, updated_at=CURRENT_TIMESTAMP, "
+        "retry_at=MAX(? + MAX(?, ? * MIN(?, ? * (1 << retries))), COALESCE(("
+        "SELECT MAX(r.retry_at) FROM deliveries r WHERE r.status='retry' "
+        "AND r.channel_id = deliveries.channel_id AND r.message_id < deliveries.message_id), 0)) "
+        "WHERE message_id=? AND channel_id=?",
+        [
+            (int(attempted), now, retry_in, int(attempted), RETRY_MAX_DELAY, RETRY_BASE_DELAY, msg_id, ch)
+            for msg_id, ch, retry_in, attempted in rows
+        ],
+    )
+    conn.execute(
+        "UPDATE deliveries SET status='failed', attempts=attempts+1, retries=0, retry_at=NULL, claimed_by=NULL "
+        "WHERE status='retry' AND retries >= ?",
+        (RETRY_MAX_ATTEMPTS,),
+    )
+    return conn.execute("SELECT MIN(retry_at) FROM deliveries WHERE status='retry'").fetchone()[0]
+
+
+def _finalize_deliveries(conn: sqlite3.Connection, msg_ids, max_attempts: int):
+    """
+    जो असफल डिलीवरी max_attempts पूरे कर चुकी हैं या जिनका चैनल parked है, उन्हें
+    dead_letters में डालें; फिर पूरी तरह निपट चुके मैसेज (और उनकी ledger rows)
+    हटाएँ। बाकी 'sending' रहते हैं और अगले रन में सिर्फ़ बची हुई डिलीवरी दोबारा
+    भेजी जाती हैं।
+    Returns: (delivered, failed) — failed = जिन मैसेजों की कोई डिलीवरी dead-letter हुई
+    """
+    ph = _placeholders(len(msg_ids))
+    now = time.time()
+    dead_filter = (
+        f"d.message_id IN ({ph}) AND d.status='failed' AND (d.attempts >= ? OR d.channel_id IN "
+        "(SELECT channel_id FROM channel_health WHERE retry_at > ?))"
+    )
+    dead_params = (*msg_ids, max_attempts, now)
+    failed = conn.execute(
+        f"SELECT COUNT(DISTINCT d.message_id) FROM deliveries d WHERE {dead_filter}", dead_params
+    ).fetchone()[0]
+    if failed:
+        conn.execute(
+            "INSERT INTO dead_letters (message_id, button_id, channel_id, content, media_type, file_id, reason, attempts, created_at) "
+            "SELECT m.id, m.button_id, d.channel_id, COALESCE(m.content, b.content), m.media_type, COALESCE(m.file_id, b.file_id), "
+            "COALESCE((SELECT reason FROM channel_health h WHERE h.channel_id = d.channel_id), 'max_attempts'), d.attempts, ? "
+            "FROM deliveries d JOIN messages m ON m.id = d.message_id LEFT JOIN message_blobs b ON b.id = m.blob_id "
+            f"WHERE {dead_filter}",
+            (now, *dead_params),
+        )
+        conn.execute(
+            "UPDATE deliveries SET status='dead' WHERE (message_id, channel_id) IN ("
+            f"SELECT d.message_id, d.channel_id FROM deliveries d WHERE {dead_filter})",
+            dead_params,
+        )
+    delivered = conn.execute(
+        f"SELECT COUNT(*) FROM messages WHERE id IN ({ph}) AND NOT EXISTS ("
+        "SELECT 1 FROM deliveries d WHERE d.message_id = messages.id AND d.status != 'sent')",
+        tuple(msg_ids),
+    ).fetchone()[0]
+    done = (
+        f"id IN ({ph}) AND NOT EXISTS ("
+        "SELECT 1 FROM deliveries d WHERE d.message_id = messages.id AND d.status NOT IN ('sent', 'dead'))"
+    )
+    if HISTORY_RETENTION_DAYS > 0:
+        conn.execute(
+            "INSERT OR REPLACE INTO messages_history (id, button_id, content, media_type, file_id, blob_id, delivered_at) "
+            f"SELECT id, button_id, content, media_type, file_id, blob_id, ? FROM messages WHERE {done}",
+            (time.time(), *msg_ids),
+        )
+    conn.execute(f"DELETE FROM messages WHERE {done}", tuple(msg_ids))
+    conn.execute(
+        f"DELETE FROM deliveries WHERE message_id IN ({ph}) "
+        "AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.id = deliveries.message_id)",
+        tuple(msg_ids),
+    )
+    return delivered, failed
+
+
+class DeliveryLedger:
+    """Send के नतीजे buffer करता है और उन्हें executemany से batch में लिखता है।"""
+
+    def __init__(self, flush_size: int = LEDGER_FLUSH_SIZE, flush_interval: float = LEDGER_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buf = []
+        self._retries = []
+        self._last_flush = time.monotonic()
+        self.deferred = 0
+
+    async def record(self, msg_id, channel_id, ok, retry=None) -> None:
+        if retry is not None:
+            self._retries.append((msg_id, channel_id, *retry))
+            self.deferred += 1
+        else:
+            self._buf.append(('sent' if ok else 'failed', msg_id, channel_id))
+        pending = len(self._buf) + len(self._retries)
+        if pending >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows, self._buf = self._buf, []
+        retries, self._retries = self._retries, []
+        self._last_flush = time.monotonic()
+        if rows:
+            await db_executemany(
+                "UPDATE deliveries SET status=?, attempts=attempts+1, retry_at=NULL, claimed_by=NULL, "
+                "updated_at=CURRENT_TIMESTAMP "
+                "WHERE message_id=? AND channel_id=?",
+                rows,
+            )
+        if retries:
+            next_at = await DB.run_write(lambda conn: _defer_deliveries(conn, retries, time.time()))
+            if next_at is not None:
+                RETRY.notify(next_at)
+
+
+async def load_delivery_work(messages_rows, channels):
+    """Ledger से हर चैनल के लिए सिर्फ़ वही मैसेज निकालें जो अभी डिलीवर नहीं हुए।"""
+    msg_ids = [r[0] for r in messages_rows]
+    await DB.run_write(lambda conn: _prepare_deliveries(conn, msg_ids, channels))
+    rows = await db_fetchall(
+        f"SELECT message_id, channel_id FROM deliveries WHERE message_id IN ({_placeholders(len(msg_ids))}) "
+        "AND status NOT IN ('sent', 'retry') AND attempts < ?",
+        (*msg_ids, DELIVERY_MAX_ATTEMPTS),
+    )
+    todo = set(rows)
+    work = {}
+    for ch in channels:
+        chunk = [r for r in messages_rows if (r[0], ch) in todo]
+        if chunk:
+            work[ch] = chunk
+    return work
+
+
+# =====================
+# Empty Queue Reminder (5 minutes)
+# =====================
+def schedule_empty_reminder(job_queue, button_id: str, notify_chat_id) -> None:
+    """
+    खाली क्यू का 5-मिनट रिमाइंडर, अगर पहले से नहीं चल रहा। Worker में नहीं — वहाँ का
+    job_queue main process के cancel_empty_reminder() की पहुँच से बाहर है, इसलिए अनुरोध
+    notify_outbox से main process तक जाता है।
+    """
+    if not notify_chat_id:
+        return
+    if NOTIFIER.relay:
+        NOTIFIER.outbox.append((notify_chat_id, "remind", button_id, None))
+        return
+    if job_queue.get_jobs_by_name(f"empty_notify_{button_id}"):
+        return
+    logger.debug("Queue for %s is empty; scheduling 5-minute reminder", button_id)
+    job_queue.run_repeating(
+        empty_queue_reminder,
+        interval=300, first=300,  # 5 मिनट
+        name=f"empty_notify_{button_id}",
+        data={"button_id": button_id, "notify_chat_id": notify_chat_id},
+    )
+
+
+async def empty_queue_reminder(context: ContextTypes.DEFAULT_TYPE):
+    data = context.job.data or {}
+    button_id = data.get("button_id")
+    notify_chat_id = data.get("notify_chat_id")
+
+    try:
+        # SQLite में पेंडिंग संदेशों की गिनती करें
+        pending_count = await count_pending(button_id)
+
+        if pending_count == 0:
+            NOTIFIER.post(notify_chat_id, "empty", button_id, f"⏰ {button_id} की क्यू खाली है")
+        else:
+            # अगर क्यू खाली नहीं है, तो इस रिमाइंडर जॉब को हटा दें
+            context.job.schedule_removal()
+            logger.debug("Reminder for %s removed as queue is no longer empty", button_id)
+            
+    except Exception as e:
+        logger.error("empty_queue_reminder error: %s", e)
+
+# =====================
+# Forwarding Job - uses SQlitequeue
+# =====================
+def seconds_until_next_slot(times, now=None) -> float:
+    """अगले HH:MM स्लॉट तक कितने सेकंड बचे हैं (अकेला स्लॉट हो तो 24 घंटे)।"""
+    now = now or datetime.now(IST)
+    now_secs = now.hour * 3600 + now.minute * 60 + now.second
+    best = 86400
+    for t in times:
+        try:
+            h, m = map(int, t.split(":"))
+        except ValueError:
+            continue
+        delta = (h * 3600 + m * 60 - now_secs) % 86400 or 86400
+        best = min(best, delta)
+    return float(best)
+
+
+def drain_budget(channel_count: int, window_seconds: float) -> int:
+    """
+    एक स्लॉट में कितने मैसेज भेजे जा सकते हैं: हर मैसेज हर चैनल पर जाता है,
+    इसलिए per-chat rate और (global rate / channel count) में से जो कम हो वही सीमा है।
+    BATCH_SIZE से कम कभी नहीं।
+    """
+    per_chat = RATE_LIMITER.chat_rate * window_seconds + RATE_LIMITER.chat_burst
+    bucket = RATE_LIMITER.global_bucket
+    global_share = (bucket.rate * window_seconds + bucket.capacity) / max(channel_count, 1)
+    return max(BATCH_SIZE, min(int(per_chat), int(global_share), DRAIN_MAX_MESSAGES))
+
+
+async def deliver_chunk(bot, channels, messages_rows):
+    """
+    एक chunk भेजें (हर चैनल अपनी रफ़्तार से), हर नतीजा ledger में दर्ज करें और
+    पूरी तरह भेजे गए संदेश हटाएँ; बाकी अगली बार resume होंगे।
+    Returns: (delivered_messages, failed_messages, failed_deliveries, deferred_deliveries)
+    """
+    await CIRCUIT.refresh()
+    work = await load_delivery_work(messages_rows, channels)
+    ledger = DeliveryLedger()
+    try:
+        with span("fan_out"):
+            results = await fan_out_batch(bot, work, on_result=ledger.record)
+    finally:
+        await ledger.flush()
+    failed_deliveries = sum(outcome.count(False) for outcome in results.values())
+
+    msg_ids = [r[0] for r in messages_rows]
+    delivered, failed = await DB.run_write(
+        lambda conn: _finalize_deliveries(conn, msg_ids, DELIVERY_MAX_ATTEMPTS)
+    )
+    return delivered, failed, failed_deliveries, ledger.deferred
+
+
+# एक बटन की क्यू को एक समय में एक ही pass पढ़े+भेजे (स्लॉट drain और urgent lane chunk-दर-chunk बारी लेते हैं)
+BUTTON_LOCKS = {}
+
+
+def button_lock(button_id: str) -> asyncio.Lock:
+    lock = BUTTON_LOCKS.get(button_id)
+    if lock is None:
+        lock = BUTTON_LOCKS[button_id] = asyncio.Lock()
+    return lock
+
+
+async def drain_urgent(bot, button_id: str, channels, attempted=None) -> int:
+    """
+    बटन के due urgent मैसेज (priority > 0, send_at बीत चुका) priority क्रम में भेजें।
+    attempted (message ids का set) caller का होता है: स्लॉट रन हर bulk chunk से पहले इसे
+    बुलाता है, और एक रन में हर मैसेज एक ही बार जाए — असफल डिलीवरी अगले रन/स्लॉट में।
+    Returns: पूरी तरह डिलीवर हुए मैसेज
+    """
+    delivered_total = 0
+    attempted = set() if attempted is None else attempted
+    while len(attempted) < DRAIN_MAX_MESSAGES:
+        async with button_lock(button_id):
+            now = time.time()
+            rows = await db_fetchall(
+                "SELECT m.id, COALESCE(m.content, b.content), m.media_type, COALESCE(m.file_id, b.file_id), m.send_at "
+                "FROM messages m LEFT JOIN message_blobs b ON b.id = m.blob_id "
+                "WHERE m.button_id=? AND m.status IN ('pending', 'sending') AND m.priority > 0 "
+                f"AND (m.send_at IS NULL OR m.send_at <= ?) AND m.id NOT IN ({_placeholders(len(attempted))}) "
+                "ORDER BY m.priority DESC, m.id LIMIT ?",
+                (button_id, now, *attempted, BATCH_SIZE),
+            )
+            if not rows:
+                break
+            for row in rows:
+                if row[4] is not None:
+                    URGENT_DELIVERY_DELAY.observe(max(now - row[4], 0.0))
+            attempted.update(r[0] for r in rows)
+            delivered, _, _, _ = await deliver_chunk(bot, channels, [r[:4] for r in rows])
+        delivered_total += delivered
+    return delivered_total
+
+
+def slot_lag_seconds(slot, now=None):
+    """HH:MM स्लॉट के मुकाबले जॉब कितनी देर से शुरू हुई (अमान्य स्लॉट पर None)।"""
+    if not slot or not is_valid_time_str(slot):
+        return None
+    now = now or datetime.now(IST)
+    h, m = map(int, slot.split(":"))
+    lag = (now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6) - (h * 3600 + m * 60)
+    # आधी रात के आर-पार वाले स्लॉट
+    if lag < -43200:
+        lag += 86400
+    return max(lag, 0.0)
+
+
+async def store_job_profile(button_id, slot, started_at: float, wall: float, spans) -> None:
+    breakdown = {name: {"seconds": round(s, 4), "count": n} for name, (s, n) in sorted(spans.items())}
+    try:
+        await db_execute(
+            "INSERT INTO job_profiles (button_id, slot, started_at, wall_seconds, spans) VALUES (?, ?, ?, ?, ?)",
+            (button_id, slot, started_at, round(wall, 4), json.dumps(breakdown)),
+        )
+    except Exception as e:
+        logger.warning("Could not store job profile for %s: %s", button_id, e)
+    logger.info("Job profile %s@%s: %.2fs", button_id, slot, wall, extra={"fields": {"spans": breakdown}})
 
-        if pending_count == 0:
-            await context.bot.send_message(
-                notify_chat_id,
-                f"⏰ रिमाइंडर: बटन {button_id} की मैसेज क्यू अब भी खाली है। कृपया नए मैसेज जोड़ें।"
-            )
-        else:
-            # अगर क्यू खाली नहीं है, तो इस रिमाइंडर जॉब को हटा दें
-            context.job.schedule_removal()
-            print(f"DEBUG: Reminder for {button_id} removed as queue is no longer empty.")
-            
-    except Exception as e:
-        logger.error(f"empty_queue_reminder error: {e}")
 
-# =====================
-# Forwarding Job - uses SQlitequeue
-# =====================
 async def forward_messages_job(context: ContextTypes.DEFAULT_TYPE):
     """
-    यह जॉब शेड्यूल के अनुसार SQLite से मैसेज फॉरवर्ड करती है और रिमाइंडर को मैनेज करती है।
+    यह जॉब शेड्यूल के अनुसार SQLite से मैसेज फॉरवर्ड करती है और रिमाइंडर को मैनेज करती है।
+    Metrics (lag, duration, running jobs) यहीं दर्ज होते हैं; असली काम _forward_messages में।
+    """
+    data = context.job.data or {}
+    button_id = data.get("button_id")
+    slot = data.get("time")
+    lag = slot_lag_seconds(slot)
+    if lag is not None:
+        # dispatcher का jitter जान-बूझकर है, उसे lag में न गिनें
+        JOB_LAG.observe(max(lag - data.get("jitter", 0.0), 0.0))
+
+    token = CURRENT_BUTTON.set(button_id or "")
+    job_token = CURRENT_JOB.set(f"{button_id}@{slot}")
+    trace_token = TRACE_ID.set(secrets.token_hex(6))
+    spans = {} if PROFILE_JOBS else None
+    spans_token = JOB_SPANS.set(spans)
+    key = (button_id, slot)
+    started_at = time.time()
+    started = time.monotonic()
+    RUNNING_JOBS[key] = started  # drain loop हर chunk पर इसे आगे बढ़ाता है
+    JOBS_RUNNING.set(len(RUNNING_JOBS))
+    try:
+        await _forward_messages(context)
+    finally:
+        wall = time.monotonic() - started
+        JOB_DURATION.observe(wall, button=button_id)
+        RUNNING_JOBS.pop(key, None)
+        JOBS_RUNNING.set(len(RUNNING_JOBS))
+        JOB_SPANS.reset(spans_token)
+        if spans is not None:
+            await store_job_profile(button_id, slot, started_at, wall, spans)
+        TRACE_ID.reset(trace_token)
+        CURRENT_JOB.reset(job_token)
+        CURRENT_BUTTON.reset(token)
+
+
+async def _forward_messages(context: ContextTypes.DEFAULT_TYPE):
+    data = context.job.data or {}
+    button_id = data.get("button_id")
+    notify_chat_id = data.get("notify_chat_id")
+    sched_time = data.get("time")
+    logger.info("Running forward job for %s at %s", button_id, sched_time)
+
+    try:
+        # 1. चैनल प्राप्त करें
+        channels = list(await CONFIG_CACHE.channels(button_id))
+
+        if not channels:
+            NOTIFIER.post(notify_chat_id, "job_error", button_id, f"⚠️ {button_id}: फॉरवर्डिंग असफल! इस बटन में कोई चैनल नहीं जुड़ा है।")
+            return
+
+        # 2. इस स्लॉट का बजट: कितने मैसेज अगले स्लॉट से पहले भेजे जा सकते हैं
+        window = seconds_until_next_slot(await CONFIG_CACHE.schedules(button_id)) * DRAIN_WINDOW_FRACTION
+        budget = drain_budget(len(channels), window) if DRAIN_MODE else BATCH_SIZE
+        deadline = time.monotonic() + window
+        logger.debug("%s: drain budget %d messages, window %.0fs", button_id, budget, window)
+
+        # 3. SQLite से 'pending' (और पिछली बार अधूरे रहे 'sending') मैसेज keyset pagination से
+        #    छोटे-छोटे chunks में निकालें और भेजें — पूरी क्यू कभी मेमोरी में नहीं आती
+        #    urgent lane (priority > 0) हर chunk से पहले; यहाँ सिर्फ़ bulk, और send_at बीत चुके मैसेज
+        #    बजट में सिर्फ़ वही मैसेज गिने जाते हैं जो sent/failed तक पहुँचे — जिनकी डिलीवरी retry
+        #    queue में गईं वो 'sending' रहते हैं और अलग गिने जाते हैं (keyset उन्हें दोबारा नहीं उठाता)
+        fetched = processed = sent_count = failed_count = failed_deliveries = deferred = 0
+        last_id = 0
+        urgent_attempted = set()
+        while processed < budget and time.monotonic() < deadline:
+            sent_count += await drain_urgent(context.bot, button_id, channels, urgent_attempted)
+            async with button_lock(button_id):
+                messages_rows = await db_fetchall(
+                    "SELECT m.id, COALESCE(m.content, b.content), m.media_type, COALESCE(m.file_id, b.file_id) "
+                    "FROM messages m LEFT JOIN message_blobs b ON b.id = m.blob_id "
+                    "WHERE m.button_id=? AND m.status IN ('pending', 'sending') AND m.priority = 0 "
+                    "AND (m.send_at IS NULL OR m.send_at <= ?) AND m.id > ? ORDER BY m.id ASC LIMIT ?",
+                    (button_id, time.time(), last_id, min(BATCH_SIZE, budget - processed))
+                )
+                if not messages_rows:
+                    break
+                last_id = messages_rows[-1][0]
+                fetched += len(messages_rows)
+
+                sent, failed, failed_chunk, deferred_chunk = await deliver_chunk(context.bot, channels, messages_rows)
+            processed += sent + failed
+            if (button_id, sched_time) in RUNNING_JOBS:
+                # लंबा drain (दिन का एक ही स्लॉट = घंटों) stalled नहीं है जब तक chunks पूरे हो रहे हैं
+                RUNNING_JOBS[(button_id, sched_time)] = time.monotonic()
+            sent_count += sent
+            failed_count += failed
+            failed_deliveries += failed_chunk
+            deferred += deferred_chunk
+
+        # --- यहाँ रिमाइंडर लॉजिक जोड़ें (जब कोई संदेश न मिले) ---
+        if fetched == 0 and sent_count == 0:
+            NOTIFIER.post(notify_chat_id, "button", button_id, f"ℹ️ {button_id}: भेजने के लिए कोई पेंडिंग मैसेज नहीं है।")
+            
+            # अगर पहले से कोई रिमाइंडर जॉब नहीं चल रही है, तो नई जॉब बनाएं
+            schedule_empty_reminder(context.job_queue, button_id, notify_chat_id)
+            return
+        # --------------------------------------------------------
+
+        # 4. सफलता का अलर्ट भेजें
+        if notify_chat_id:
+            summary = f"✅ {button_id}: {sent_count} मैसेज सफलतापूर्वक फॉरवर्ड कर दिए गए।"
+            if failed_deliveries:
+                summary += f" ⚠️ {failed_deliveries} चैनल-डिलीवरी असफल रहीं।"
+            if deferred:
+                summary += f" 🔁 {deferred} चैनल-डिलीवरी retry queue में (अपने आप दोबारा भेजी जाएँगी)।"
+            if failed_count:
+                summary += f" ❌ {failed_count} मैसेज कुछ चैनल्स पर नहीं भेजे जा सके (डेड-लेटर में देखें)।"
+            NOTIFIER.post(notify_chat_id, "button", button_id, summary)
+
+        # --- यहाँ रिमाइंडर लॉजिक जोड़ें (जब संदेश भेजने के बाद क्यू खाली हो जाए) ---
+        remaining_count = await count_pending(button_id)
+
+        if remaining_count == 0:
+            schedule_empty_reminder(context.job_queue, button_id, notify_chat_id)
+        # --------------------------------------------------------------------
+
+    except Exception as e:
+        logger.exception("Serious error in forward job for %s", button_id)
+        NOTIFIER.post(notify_chat_id, "job_error", button_id, f"❌ {button_id}: फॉरवर्डिंग में गंभीर त्रुटि हुई: {e}")
+
+
+
+# =====================
+# Schedule dispatcher (सारे स्लॉट्स एक heap में)
+# =====================
+def job_context(app: Application, data: dict):
+    """JobQueue के बाहर चलने वाली forward runs के लिए वैसा ही context जैसा PTB jobs को देता है।"""
+    return types.SimpleNamespace(
+        bot=app.bot,
+        job=types.SimpleNamespace(data=data, schedule_removal=lambda: None),
+        job_queue=app.job_queue,
+    )
+
+
+def slot_jitter(button_id: str, slot: str) -> float:
+    """(बटन, स्लॉट) का स्थिर offset [0, SCHEDULE_JITTER_SECONDS) — restart के बाद भी वही रहता है।"""
+    if SCHEDULE_JITTER_SECONDS <= 0:
+        return 0.0
+    return zlib.crc32(f"{button_id}@{slot}".encode()) % 1000 / 1000 * SCHEDULE_JITTER_SECONDS
+
+
+def next_slot_time(slot: str, after: float) -> float:
+    """HH:MM (IST) स्लॉट की after के बाद वाली अगली घटना, epoch seconds में।"""
+    h, m = map(int, slot.split(":"))
+    now = datetime.fromtimestamp(after, IST or pytz.utc)
+    candidate = now.replace(hour=h, minute=m, second=0, microsecond=0)
+    if candidate.timestamp() <= after:
+        candidate += timedelta(days=1)
+    return candidate.timestamp()
+
+
+class ScheduleDispatcher:
+    """
+    सारे enabled बटन्स के HH:MM स्लॉट्स का एक min-heap और उसे चलाने वाला एक task।
+    schedules बदलने पर सिर्फ़ उस बटन के जुड़े/हटे स्लॉट्स बदलते हैं। Heap से entries
+    हटाई नहीं जातीं (lazy delete): self.slots में जिसका fire time मेल न खाए वो पुरानी है।
+    एक ही समय वाले बटन्स jitter से फैलते हैं, और एक साथ due हुए स्लॉट्स में जो बटन सबसे
+    पहले चला था वो सबसे बाद में — हर शुरुआत के बीच कम से कम SCHEDULE_STAGGER।
+    """
+
+    def __init__(self):
+        self.heap = []              # (fire_at, seq, button_id, slot)
+        self.slots = {}             # (button_id, slot) -> fire_at
+        self.buttons = {}           # button_id -> [notify_chat_id, {slot, ...}]
+        self.last_fired = {}        # button_id -> पिछली dispatch का समय
+        self.running = {}           # button_id -> चल रहा asyncio.Task
+        self.task = None
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._next_start = 0.0
+
+    def _push(self, button_id: str, slot: str, after: float) -> None:
+        jitter = slot_jitter(button_id, slot)
+        fire_at = next_slot_time(slot, after - jitter) + jitter
+        self.slots[(button_id, slot)] = fire_at
+        heapq.heappush(self.heap, (fire_at, next(self._seq), button_id, slot))
+
+    def _changed(self) -> None:
+        # पुरानी entries बहुत हो जाएँ तो heap दोबारा बनाएँ
+        if len(self.heap) > 2 * len(self.slots) + 64:
+            self.heap = [e for e in self.heap if self.slots.get((e[2], e[3])) == e[0]]
+            heapq.heapify(self.heap)
+        SCHEDULED_SLOTS.set(len(self.slots))
+        self._wake.set()
+
+    def set_button(self, button_id: str, times, notify_chat_id=None) -> int:
+        """बटन को enable करें / उसके स्लॉट्स times से मिलाएँ। Returns: वैध स्लॉट्स की गिनती"""
+        wanted = set()
+        for t in times:
+            if is_valid_time_str(t):
+                wanted.add(t)
+            else:
+                logger.warning("Invalid time format found: %s. Skipping.", t)
+        entry = self.buttons.setdefault(button_id, [notify_chat_id, set()])
+        if notify_chat_id is not None:
+            entry[0] = notify_chat_id
+        now = time.time()
+        for slot in entry[1] - wanted:
+            del self.slots[(button_id, slot)]
+        for slot in wanted - entry[1]:
+            self._push(button_id, slot, now)
+        entry[1] = wanted
+        self._changed()
+        return len(wanted)
+
+    def remove_button(self, button_id: str) -> None:
+        entry = self.buttons.pop(button_id, None)
+        if entry is None:
+            return
+        for slot in entry[1]:
+            del self.slots[(button_id, slot)]
+        self.last_fired.pop(button_id, None)
+        self._changed()
+
+    async def refresh(self, button_id: str) -> None:
+        """schedules टेबल बदलने के बाद: बटन enabled हो तो उसके स्लॉट्स दोबारा मिलाएँ।"""
+        if button_id in self.buttons:
+            self.set_button(button_id, await CONFIG_CACHE.schedules(button_id))
+
+    async def load_all(self) -> None:
+        """
+        Startup पर forwarding टेबल (enabled=1) और schedules से heap भरें,
+        ताकि deploy/crash के बाद किसी को "फॉरवर्डिंग शुरू करें" दोबारा न दबाना पड़े।
+        """
+        started = time.perf_counter()
+        rows = await db_fetchall("SELECT button_id, notify_chat_id FROM forwarding WHERE enabled=1")
+        for button_id, notify_chat_id in rows:
+            self.set_button(button_id, await CONFIG_CACHE.schedules(button_id), notify_chat_id)
+        logger.info(
+            "Scheduled %d slots for %d buttons in %.1f ms",
+            len(self.slots), len(rows), (time.perf_counter() - started) * 1000,
+        )
+
+    def _pop_due(self, now: float):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, _, button_id, slot = heapq.heappop(self.heap)
+            if self.slots.get((button_id, slot)) != fire_at:
+                continue  # हटाया/बदला गया स्लॉट
+            self._push(button_id, slot, fire_at)
+            if now - fire_at > SCHEDULE_MISFIRE_GRACE:
+                logger.warning("Skipping %s@%s: dispatcher woke %.0fs late", button_id, slot, now - fire_at)
+                SCHEDULE_SKIPPED.inc(reason="misfire")
+                continue
+            due.append((button_id, slot))
+        due.sort(key=lambda item: self.last_fired.get(item[0], 0.0))
+        return due
+
+    def _dispatch(self, app: Application, button_id: str, slot: str, now: float) -> None:
+        current = self.running.get(button_id)
+        if current is not None and not current.done():
+            logger.warning("Skipping %s@%s: previous run still in progress", button_id, slot)
+            SCHEDULE_SKIPPED.inc(reason="overlap")
+            return
+        self.last_fired[button_id] = now
+        start_at = max(now, self._next_start)
+        self._next_start = start_at + SCHEDULE_STAGGER
+        data = {
+            "button_id": button_id,
+            "notify_chat_id": self.buttons[button_id][0],
+            "time": slot,
+            "jitter": slot_jitter(button_id, slot) + (start_at - now),
+        }
+        self.running[button_id] = app.create_task(self._start(app, data, start_at - now), name=f"job_{button_id}_{slot}")
+
+    @staticmethod
+    async def _start(app: Application, data: dict, delay: float) -> None:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # worker mode में polling process सिर्फ़ task क्यू में डालता है
+        callback = enqueue_forward_task if FORWARD_WORKERS > 0 else forward_messages_job
+        await callback(job_context(app, data))
+
+    async def run(self, app: Application) -> None:
+        while True:
+            self._wake.clear()
+            now = time.time()
+            due = self._pop_due(now)
+            if due and app.running:
+                for button_id, slot in due:
+                    self._dispatch(app, button_id, slot, now)
+            timeout = min(self.heap[0][0] - now, SCHEDULE_MAX_SLEEP) if self.heap else SCHEDULE_MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(timeout, 0.0))
+            except asyncio.TimeoutError:
+                pass
+
+
+SCHEDULER = ScheduleDispatcher()
+
+
+# =====================
+# Urgent lane dispatcher (priority > 0)
+# =====================
+async def forwarding_enabled(button_id: str) -> bool:
+    rows = await db_fetchall("SELECT 1 FROM forwarding WHERE button_id=? AND enabled=1", (button_id,))
+    return bool(rows)
+
+
+async def urgent_forward_job(context) -> None:
+    """Urgent-only रन: सिर्फ़ due urgent मैसेज — स्लॉट बजट, summary या रिमाइंडर नहीं।"""
+    button_id = (context.job.data or {}).get("button_id")
+    token = CURRENT_BUTTON.set(button_id or "")
+    job_token = CURRENT_JOB.set(f"{button_id}@{URGENT_SLOT}")
+    trace_token = TRACE_ID.set(secrets.token_hex(6))
+    try:
+        # dispatch के बाद owner ने बटन रोका हो सकता है
+        if not await forwarding_enabled(button_id):
+            logger.debug("Urgent messages for %s wait: forwarding is stopped", button_id)
+            return
+        channels = list(await CONFIG_CACHE.channels(button_id))
+        if not channels:
+            logger.warning("Urgent messages for %s wait: button has no channels", button_id)
+            return
+        sent = await drain_urgent(context.bot, button_id, channels)
+        if sent:
+            logger.info("Urgent lane delivered %d messages for %s", sent, button_id)
+    except Exception:
+        logger.exception("Urgent lane failed for %s", button_id)
+    finally:
+        TRACE_ID.reset(trace_token)
+        CURRENT_JOB.reset(job_token)
+        CURRENT_BUTTON.reset(token)
+
+
+class UrgentDispatcher:
+    """
+    जिन चालू (forwarding enabled) बटन्स में urgent मैसेज हैं उनका min-heap (कब देखना है)। enqueue होते ही notify()
+    से जागता है, इसलिए urgent मैसेज HH:MM स्लॉट का नहीं, सिर्फ़ अपने send_at का इंतज़ार
+    करते हैं। बाकी processes/असफल डिलीवरी के लिए हर URGENT_MAX_SLEEP पर DB दोबारा देखता है।
+    """
+
+    def __init__(self):
+        self.heap = []              # (due_at, button_id)
+        self.due = {}               # button_id -> heap में सबसे पहला due_at
+        self.running = {}           # button_id -> चल रहा asyncio.Task
+        self.again = set()          # चलते pass के दौरान फिर notify हुए बटन
+        self.task = None
+        self._wake = asyncio.Event()
+
+    def notify(self, button_id: str, at=None) -> None:
+        at = at or time.time()
+        if at < self.due.get(button_id, float("inf")):
+            self.due[button_id] = at
+            heapq.heappush(self.heap, (at, button_id))
+            self._wake.set()
+
+    async def load_all(self) -> None:
+        rows = await db_fetchall(
+            "SELECT m.button_id, MIN(COALESCE(m.send_at, 0)) FROM messages m "
+            "JOIN forwarding f ON f.button_id = m.button_id AND f.enabled = 1 "
+            "WHERE m.status IN ('pending', 'sending') AND m.priority > 0 GROUP BY m.button_id"
+        )
+        for button_id, at in rows:
+            self.notify(button_id, at)
+
+    async def _next_due(self, button_id: str, now: float):
+        rows = await db_fetchall(
+            "SELECT MIN(m.send_at) FROM messages m "
+            "JOIN forwarding f ON f.button_id = m.button_id AND f.enabled = 1 "
+            "WHERE m.button_id=? AND m.status IN ('pending', 'sending') AND m.priority > 0 AND m.send_at > ?",
+            (button_id, now),
+        )
+        return rows[0][0] if rows else None
+
+    def _finished(self, button_id: str) -> None:
+        if button_id in self.again:
+            self.again.discard(button_id)
+            self.notify(button_id)
+
+    def _dispatch(self, app: Application, button_id: str) -> None:
+        current = self.running.get(button_id)
+        if current is not None and not current.done():
+            self.again.add(button_id)
+            return
+        data = {"button_id": button_id, "notify_chat_id": None, "time": URGENT_SLOT}
+        # worker mode में lease वाले worker ही बटन की क्यू छूते हैं
+        callback = enqueue_forward_task if FORWARD_WORKERS > 0 else urgent_forward_job
+        task = app.create_task(callback(job_context(app, data)), name=f"urgent_{button_id}")
+        task.add_done_callback(lambda _, b=button_id: self._finished(b))
+        self.running[button_id] = task
+
+    async def run(self, app: Application) -> None:
+        while True:
+            self._wake.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                at, button_id = heapq.heappop(self.heap)
+                if self.due.get(button_id) != at:
+                    continue
+                del self.due[button_id]
+                if app.running:
+                    self._dispatch(app, button_id)
+                next_at = await self._next_due(button_id, now)
+                if next_at is not None:
+                    self.notify(button_id, next_at)
+            timeout = min(self.heap[0][0] - time.time(), URGENT_MAX_SLEEP) if self.heap else URGENT_MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(timeout, 0.0))
+            except asyncio.TimeoutError:
+                await self.load_all()
+
+
+URGENT = UrgentDispatcher()
+
+
+# =====================
+# Retry queue worker
+# =====================
+def retry_claim_limits():
+    """
+    एक pass कितनी retries claim करे: claim window के आधे में limiter जितना भेज सके —
+    हर चैनल पर per-chat rate से, कुल global rate से (और RETRY_BATCH से ज़्यादा नहीं)।
+    Returns: (per_channel, total)
+    """
+    window = RETRY_CLAIM_SECONDS / 2
+    per_channel = max(1, int(RATE_LIMITER.chat_rate * window))
+    total = max(1, min(RETRY_BATCH, int(RATE_LIMITER.global_bucket.rate * window)))
+    return per_channel, total
+
+
+def _claim_retries(conn: sqlite3.Connection, owner: str, now: float, per_channel: int, limit: int):
+    """
+    Due retries owner के नाम claim करें (हर चैनल के सबसे पुराने per_channel, कुल limit)।
+    retry_at = claim की expiry: pass का heartbeat इसे आगे बढ़ाता रहता है, इसलिए दूसरा
+    process या forward job ज़िंदा claim को due नहीं देखता; crash हुआ तो expiry पर फिर due।
+    Writer transaction की वजह से processes के बीच atomic।
+    """
+    rows = conn.execute(
+        "SELECT message_id, channel_id FROM ("
+        "SELECT message_id, channel_id, retry_at, "
+        "ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY message_id) AS n "
+        "FROM deliveries WHERE status='retry' AND retry_at <= ?"
+        ") WHERE n <= ? ORDER BY retry_at LIMIT ?",
+        (now, per_channel, limit),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE deliveries SET retry_at=?, claimed_by=? WHERE message_id=? AND channel_id=?",
+        [(now + RETRY_CLAIM_SECONDS, owner, msg_id, ch) for msg_id, ch in rows],
+    )
+    return rows
+
+
+def _renew_retry_claims(conn: sqlite3.Connection, owner: str, now: float) -> int:
+    conn.execute(
+        "UPDATE leases SET expires_at=?, heartbeat_at=? WHERE owner=?", (now + LEASE_TTL, now, owner)
+    )
+    return conn.execute(
+        "UPDATE deliveries SET retry_at=? WHERE claimed_by=? AND status='retry'", (now + RETRY_CLAIM_SECONDS, owner)
+    ).rowcount
+
+
+def _release_retries(conn: sqlite3.Connection, owner: str, retry_at: float, pairs=None) -> None:
+    """Claim छोड़ें (बचे हुए, या सिर्फ़ pairs) — retry_at पर फिर due।"""
+    if pairs is None:
+        conn.execute(
+            "UPDATE deliveries SET claimed_by=NULL, retry_at=? WHERE claimed_by=? AND status='retry'", (retry_at, owner)
+        )
+    else:
+        conn.executemany(
+            "UPDATE deliveries SET claimed_by=NULL, retry_at=? WHERE message_id=? AND channel_id=? AND claimed_by=?",
+            [(retry_at, msg_id, ch, owner) for msg_id, ch in pairs],
+        )
+
+
+def _take_button_lease(conn: sqlite3.Connection, button_id: str, owner: str, now: float) -> bool:
+    """
+    बटन की lease (वही जो forward workers लेते हैं) — कोई ज़िंदा lease किसी और के पास
+    हो तो False। Worker mode में इससे retry pass और forward job एक बटन पर साथ नहीं चलते।
     """
-    data = context.job.data or {}
-    button_id = data.get("button_id")
-    notify_chat_id = data.get("notify_chat_id")
-    sched_time = data.get("time")
-    print("-" * 30)
-    print(f"DEBUG: Running forward job for button_id = {button_id} at {sched_time}")
+    return conn.execute(
+        "INSERT INTO leases (resource, owner, expires_at, heartbeat_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(resource) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at, "
+        "heartbeat_at=excluded.heartbeat_at WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+        (f"button:{button_id}", owner, now + LEASE_TTL, now, now),
+    ).rowcount > 0
 
-    try:
-        # 1. चैनल प्राप्त करें
-        channels_rows = await db_fetchall("SELECT channel_id FROM channels WHERE button_id=?", (button_id,))
-        channels = [r[0] for r in channels_rows]
 
-        if not channels:
-            if notify_chat_id:
-                await context.bot.send_message(notify_chat_id, f"⚠️ {button_id}: फॉरवर्डिंग असफल! इस बटन में कोई चैनल नहीं जुड़ा है।")
-            return
+def _drop_retries(conn: sqlite3.Connection, pairs) -> None:
+    """जिन retries का मैसेज या चैनल अब बटन में नहीं रहा।"""
+    conn.executemany("DELETE FROM deliveries WHERE message_id=? AND channel_id=? AND status='retry'", pairs)
+
+
+async def retry_button(bot, owner: str, button_id: str, claimed) -> int:
+    """
+    एक बटन की claimed retries भेजें — बटन की lease और button_lock लेकर, वही fan-out,
+    ledger और finalize जो forward job इस्तेमाल करती है (फिर transient एरर आया तो अगली
+    retry, कोशिशें ख़त्म तो dead-letter)। Lease किसी और के पास हो तो claims छोड़ दें।
+    claimed: [(msg_id, channel_id, content, media_type, file_id), ...]
+    Returns: पूरी तरह डिलीवर हुए मैसेज
+    """
+    pairs = [(r[0], r[1]) for r in claimed]
+    if not await DB.run_write(lambda conn: _take_button_lease(conn, button_id, owner, time.time())):
+        logger.debug("Button %s is leased by another run; retries wait", button_id)
+        await DB.run_write(lambda conn: _release_retries(conn, owner, time.time() + LEASE_HEARTBEAT, pairs))
+        return 0
+
+    token = CURRENT_BUTTON.set(button_id)
+    job_token = CURRENT_JOB.set(f"{button_id}@retry")
+    try:
+        # worker में भी owner के ताज़ा बदलाव (हटाए/जोड़े चैनल) देखकर ही भेजें या drop करें
+        await CONFIG_CACHE.sync()
+        channels = set(await CONFIG_CACHE.channels(button_id))
+        stale = [(r[0], r[1]) for r in claimed if r[1] not in channels]
+        if stale:
+            await DB.run_write(lambda conn: _drop_retries(conn, stale))
+        work = {}
+        for msg_id, ch, content, media_type, file_id in sorted(claimed):
+            if ch in channels:
+                work.setdefault(ch, []).append((msg_id, content, media_type, file_id))
 
-        # 2. SQLite से 'pending' मैसेज निकालें
-        messages_rows = await db_fetchall(
-            "SELECT id, content, media_type, file_id FROM messages WHERE button_id=? AND status='pending' ORDER BY id ASC LIMIT ?",
-            (button_id, BATCH_SIZE)
+        msg_ids = sorted({r[0] for r in claimed})
+        async with button_lock(button_id):
+            ledger = DeliveryLedger()
+            try:
+                await fan_out_batch(bot, work, on_result=ledger.record)
+            finally:
+                await ledger.flush()
+            delivered, _ = await DB.run_write(
+                lambda conn: _finalize_deliveries(conn, msg_ids, DELIVERY_MAX_ATTEMPTS)
+            )
+        if delivered:
+            logger.info("Retry queue delivered %d messages for %s", delivered, button_id)
+        return delivered
+    finally:
+        CURRENT_JOB.reset(job_token)
+        CURRENT_BUTTON.reset(token)
+        await DB.run_write(
+            lambda conn: conn.execute("DELETE FROM leases WHERE resource=? AND owner=?", (f"button:{button_id}", owner))
         )
 
-        # --- यहाँ रिमाइंडर लॉजिक जोड़ें (जब कोई संदेश न मिले) ---
-        if not messages_rows:
-            if notify_chat_id:
-                await context.bot.send_message(notify_chat_id, f"ℹ️ {button_id}: भेजने के लिए कोई पेंडिंग मैसेज नहीं है।")
-            
-            # अगर पहले से कोई रिमाइंडर जॉब नहीं चल रही है, तो नई जॉब बनाएं
-            if notify_chat_id and not context.job_queue.get_jobs_by_name(f"empty_notify_{button_id}"):
-                print(f"DEBUG: Queue for {button_id} is empty. Scheduling 5-minute reminder.")
-                context.job_queue.run_repeating(
-                    empty_queue_reminder,
-                    interval=300, first=300,  # 5 मिनट
-                    name=f"empty_notify_{button_id}",
-                    data={"button_id": button_id, "notify_chat_id": notify_chat_id},
-                )
-            return
-        # --------------------------------------------------------
 
-        # 3. मैसेज भेजें
-        sent_count = 0
-        sent_message_ids = []
-        for msg_id, content, media_type, file_id in messages_rows:
-            tasks = []
-            for ch in channels:
-                tasks.append(send_message_with_backoff(context.bot, ch, content, media_type, file_id))
-            await asyncio.gather(*tasks)
-            sent_count += 1
-            sent_message_ids.append(msg_id)
-            if sent_count % 5 == 0:
-                await asyncio.sleep(1)
-
-        # 4. भेजे गए संदेशों को डेटाबेस से हटाएं
-        if sent_message_ids:
-            query = f"DELETE FROM messages WHERE id IN ({','.join(['?'] * len(sent_message_ids))})"
-            await db_execute(query, tuple(sent_message_ids))
-
-        # 5. सफलता का अलर्ट भेजें
-        if notify_chat_id:
-            await context.bot.send_message(notify_chat_id, f"✅ {button_id}: {sent_count} मैसेज सफलतापूर्वक फॉरवर्ड कर दिए गए।")
+class RetryDispatcher:
+    """
+    Delivery retry queue (deliveries.status='retry', idx_deliveries_retry) का background worker।
+    अगली due retry तक सोता है, due rows batch में claim करके बटन-वार भेजता है। ledger में
+    नई retry आते ही notify() से जल्दी जागता है; दूसरे processes की retries के लिए हर
+    RETRY_MAX_SLEEP पर DB देखता है। Queue DB में है, इसलिए restart के बाद भी retries चलती रहती हैं।
+    """
 
-        # --- यहाँ रिमाइंडर लॉजिक जोड़ें (जब संदेश भेजने के बाद क्यू खाली हो जाए) ---
-        remaining_rows = await db_fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='pending'", (button_id,))
-        remaining_count = remaining_rows[0][0] if remaining_rows else 0
-
-        if remaining_count == 0 and notify_chat_id:
-             if not context.job_queue.get_jobs_by_name(f"empty_notify_{button_id}"):
-                print(f"DEBUG: Queue for {button_id} is now empty. Scheduling 5-minute reminder.")
-                context.job_queue.run_repeating(
-                    empty_queue_reminder,
-                    interval=300, first=300,  # 5 मिनट
-                    name=f"empty_notify_{button_id}",
-                    data={"button_id": button_id, "notify_chat_id": notify_chat_id},
-                )
-        # --------------------------------------------------------------------
+    def __init__(self):
+        self.next_at = None
+        self.task = None
+        self._wake = asyncio.Event()
 
-    except Exception as e:
-        logger.exception(f"Serious error in forward job for {button_id}")
-        if notify_chat_id:
+    def notify(self, at: float) -> None:
+        if self.next_at is None or at < self.next_at:
+            self.next_at = at
+            self._wake.set()
+
+    async def _heartbeat(self, owner: str) -> None:
+        while True:
+            await asyncio.sleep(LEASE_HEARTBEAT)
+            await DB.run_write(lambda conn: _renew_retry_claims(conn, owner, time.time()))
+
+    async def run_pass(self, bot) -> int:
+        """एक batch claim करके भेजें। Returns: claim हुई retries की गिनती।"""
+        owner = f"{socket.gethostname()}:{os.getpid()}:retry:{secrets.token_hex(4)}"
+        per_channel, limit = retry_claim_limits()
+        pairs = await DB.run_write(lambda conn: _claim_retries(conn, owner, time.time(), per_channel, limit))
+        if not pairs:
+            return 0
+        heartbeat = asyncio.create_task(self._heartbeat(owner))
+        try:
+            await self._deliver(bot, owner, pairs)
+        finally:
+            heartbeat.cancel()
+            # जो claim भेजे/टाले बिना बचे (एरर) वो तुरंत फिर due
+            await DB.run_write(lambda conn: _release_retries(conn, owner, time.time()))
+        return len(pairs)
+
+    async def _deliver(self, bot, owner: str, pairs) -> None:
+        msg_ids = sorted({msg_id for msg_id, _ in pairs})
+        rows = await db_fetchall(
+            "SELECT m.id, m.button_id, COALESCE(m.content, b.content), m.media_type, COALESCE(m.file_id, b.file_id) "
+            "FROM messages m LEFT JOIN message_blobs b ON b.id = m.blob_id "
+            f"WHERE m.id IN ({_placeholders(len(msg_ids))})",
+            tuple(msg_ids),
+        )
+        messages = {r[0]: r for r in rows}
+        orphans = [(msg_id, ch) for msg_id, ch in pairs if msg_id not in messages]
+        if orphans:
+            await DB.run_write(lambda conn: _drop_retries(conn, orphans))
+
+        by_button = {}
+        for msg_id, ch in pairs:
+            m = messages.get(msg_id)
+            if m is not None:
+                by_button.setdefault(m[1], []).append((msg_id, ch, m[2], m[3], m[4]))
+        results = await asyncio.gather(
+            *(retry_button(bot, owner, button_id, claimed) for button_id, claimed in by_button.items()),
+            return_exceptions=True,
+        )
+        for button_id, result in zip(by_button, results):
+            if isinstance(result, Exception):
+                logger.error("Retry pass failed for %s: %s", button_id, result)
+
+    async def run(self, bot) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                await self.run_pass(bot)
+                rows = await db_fetchall("SELECT MIN(retry_at) FROM deliveries WHERE status='retry'")
+                self.next_at = rows[0][0] if rows else None
+            except Exception:
+                logger.exception("Retry queue pass failed")
+                self.next_at = None
+            timeout = RETRY_MAX_SLEEP if self.next_at is None else min(self.next_at - time.time(), RETRY_MAX_SLEEP)
             try:
-                await context.bot.send_message(notify_chat_id, f"❌ {button_id}: फॉरवर्डिंग में गंभीर त्रुटि हुई: {e}")
-            except Exception as ex:
-                logger.error(f"Failed to send error notification: {ex}")
+                await asyncio.wait_for(self._wake.wait(), max(timeout, 0.0))
+            except asyncio.TimeoutError:
+                pass
 
 
+RETRY = RetryDispatcher()
+
 
 # =====================
 # Bot UI Handlers
 # =====================
 @owner_only
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    text, markup = await render_main_menu(0)
+    await update.message.reply_text(text, reply_markup=markup)
+
+@owner_only
+async def main_menu_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    page = int(query.data.split("_")[-1])
+    text, markup = await render_main_menu(page)
+    await query.edit_message_text(text, reply_markup=markup)
+
+@owner_only
+async def new_button_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    context.user_data["action"] = "new_button"
+    await query.edit_message_text(f"नए बटन का नाम भेजें (अधिकतम {MAX_BUTTON_LABEL} अक्षर):")
+
+@owner_only
+async def rename_button_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
+    context.user_data["action"] = f"rename_button_{button_id}"
+    await query.edit_message_text(f"बटन {button_id} का नया नाम भेजें:")
+
+@owner_only
+async def delete_button_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
     keyboard = [
-        [InlineKeyboardButton("👉 US", callback_data="btn1")],
-        [InlineKeyboardButton("👉 IOS", callback_data="btn2")],
-        [InlineKeyboardButton("👉 SFB", callback_data="btn3")],
-        [InlineKeyboardButton("👉 personal ", callback_data="btn4")],
-        [InlineKeyboardButton("बटन 5", callback_data="btn5")],
+        [InlineKeyboardButton("✅ हाँ, बटन और उसका सारा डेटा हटाएं", callback_data=f"purge_btn_{button_id}")],
+        [InlineKeyboardButton("❌ नहीं", callback_data=f"{button_id}")],
     ]
-    await update.message.reply_text("मुख्य मेनू:", reply_markup=InlineKeyboardMarkup(keyboard))
+    await query.edit_message_text(
+        f"क्या आप वाकई बटन {button_id} (चैनल्स, टाइम्स और पेंडिंग मैसेज समेत) हटाना चाहते हैं?",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+@owner_only
+async def final_delete_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
+    SCHEDULER.remove_button(button_id)
+    for j in context.job_queue.get_jobs_by_name(f"empty_notify_{button_id}"):
+        j.schedule_removal()
+    await delete_button(button_id)
+    text, markup = await render_main_menu(0)
+    await query.edit_message_text(f"🗑 बटन {button_id} हटा दिया गया।\n\n{text}", reply_markup=markup)
 
 @owner_only
 async def open_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -419,9 +2906,18 @@ async def open_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         [InlineKeyboardButton("➕चैनल जोड़ें➕", callback_data=f"add_chn_{button_id}")],
         [InlineKeyboardButton("💢चैनल हटाएं💢", callback_data=f"del_chn_{button_id}")],
         [InlineKeyboardButton("💌मैसेज जोड़ें💌", callback_data=f"add_msg_{button_id}")],
+        [InlineKeyboardButton("⚡अर्जेंट मैसेज⚡", callback_data=f"add_urg_{button_id}")],
+        [InlineKeyboardButton("📥CSV/JSON इम्पोर्ट📥", callback_data=f"import_{button_id}")],
         [InlineKeyboardButton("🕕टाइम सेट करें🕛", callback_data=f"set_time_{button_id}")],
         [InlineKeyboardButton("➰फॉरवर्डिंग शुरू करें➰", callback_data=f"start_fw_{button_id}")],
+        [InlineKeyboardButton("⏹फॉरवर्डिंग रोकें⏹", callback_data=f"stop_fw_{button_id}")],
         [InlineKeyboardButton("✔स्टेटस देखें🎦", callback_data=f"status_{button_id}")],
+        [InlineKeyboardButton("☠️ डेड-लेटर", callback_data=f"dlq_{button_id}")],
+        [
+            InlineKeyboardButton("✏️ नाम बदलें", callback_data=f"ren_btn_{button_id}"),
+            InlineKeyboardButton("🗑 बटन हटाएं", callback_data=f"del_btn_{button_id}"),
+        ],
+        [InlineKeyboardButton("🔙 मुख्य मेनू", callback_data="menu_0")],
     ]
     # status text (async)
     status_text = await get_button_status(button_id)
@@ -440,11 +2936,7 @@ async def delete_channel_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     button_id = query.data.split("_")[-1]
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT channel_id FROM channels WHERE button_id=?", (button_id,))
-    channels = [row[0] for row in c.fetchall()]
-    conn.close()
+    channels = await CONFIG_CACHE.channels(button_id)
 
     if not channels:
         await query.edit_message_text("❌ इस बटन में कोई चैनल नहीं है")
@@ -473,22 +2965,135 @@ async def final_delete_channel(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     _, _, button_id, channel = query.data.split("_", 3)
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM channels WHERE button_id=? AND channel_id=?", (button_id, channel))
-    conn.commit()
-    conn.close()
+    await db_execute("DELETE FROM channels WHERE button_id=? AND channel_id=?", (button_id, channel))
+    CONFIG_CACHE.invalidate(button_id)
 
     await query.edit_message_text(f"✅ चैनल {channel} सफलतापूर्वक हटाया गया")
 
 
+# =====================
+# Dead letters (inspect + replay)
+# =====================
+def _replay_dead_letters(conn: sqlite3.Connection, button_id: str, channel_id=None):
+    """
+    डेड-लेटर डिलीवरी को क्यू में वापस डालें। हर मूल मैसेज की एक नई queue row बनती है
+    और बाकी चैनल्स की ledger rows पहले से 'sent' लिखी जाती हैं, ताकि वो सिर्फ़ उन्हीं
+    चैनल्स पर जाए जहाँ डिलीवर नहीं हुआ था। जो चैनल अब बटन में नहीं है, उसकी rows छूट जाती हैं।
+    Returns: (queued_messages, replayed_deliveries)
+    """
+    channels = [r[0] for r in conn.execute("SELECT channel_id FROM channels WHERE button_id=?", (button_id,))]
+    where, params = "button_id=?", [button_id]
+    if channel_id is not None:
+        where += " AND channel_id=?"
+        params.append(channel_id)
+    rows = conn.execute(
+        f"SELECT id, message_id, channel_id, content, media_type, file_id FROM dead_letters WHERE {where} ORDER BY id",
+        params,
+    ).fetchall()
+
+    by_message = {}
+    replayed = []
+    for dl_id, msg_id, ch, content, media_type, file_id in rows:
+        if ch not in channels:
+            continue
+        by_message.setdefault(msg_id, [content, media_type, file_id, set()])[3].add(ch)
+        replayed.append((dl_id,))
+
+    for content, media_type, file_id, targets in by_message.values():
+        new_id = conn.execute(
+            "INSERT INTO messages (button_id, content, media_type, file_id) VALUES (?, ?, ?, ?)",
+            (button_id, content, media_type, file_id),
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO deliveries (message_id, channel_id, status) VALUES (?, ?, 'sent')",
+            [(new_id, ch) for ch in channels if ch not in targets],
+        )
+    conn.executemany("DELETE FROM dead_letters WHERE id=?", replayed)
+    # owner ने replay माँगा है, तो इन चैनल्स का circuit भी बंद करें
+    targets = {ch for *_, chs in by_message.values() for ch in chs}
+    conn.executemany("DELETE FROM channel_health WHERE channel_id=?", [(ch,) for ch in targets])
+    return len(by_message), len(replayed)
+
+
+@owner_only
+async def dead_letters_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
+    await CIRCUIT.refresh()
+    rows = await db_fetchall(
+        "SELECT channel_id, COUNT(*), MAX(reason) FROM dead_letters WHERE button_id=? "
+        "GROUP BY channel_id ORDER BY COUNT(*) DESC LIMIT ?",
+        (button_id, DEAD_LETTERS_SHOWN),
+    )
+    if not rows:
+        keyboard = [[InlineKeyboardButton(" 🔙वापस", callback_data=f"{button_id}")]]
+        await query.edit_message_text(f"✅ {button_id}: कोई डेड-लेटर नहीं है।", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+
+    lines = [f"☠️ {button_id} डेड-लेटर (चैनल वार):", ""]
+    keyboard: List[List[InlineKeyboardButton]] = []
+    for ch, count, reason in rows:
+        parked = " 🔴" if CIRCUIT.is_open(ch) else ""
+        lines.append(f"{ch}: {count}{parked} — {reason}")
+        keyboard.append([InlineKeyboardButton(f"🔁 {ch} ({count})", callback_data=f"dlqr_{button_id}_{ch}")])
+    lines.append("")
+    lines.append("🔴 = चैनल अभी रुका हुआ है (circuit open)। Replay करने पर circuit बंद हो जाता है।")
+    keyboard.append([
+        InlineKeyboardButton("🔁 सब replay करें", callback_data=f"dlqr_{button_id}_*"),
+        InlineKeyboardButton("🗑 साफ़ करें", callback_data=f"dlqc_{button_id}"),
+    ])
+    keyboard.append([InlineKeyboardButton(" 🔙वापस", callback_data=f"{button_id}")])
+    await query.edit_message_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+@owner_only
+async def replay_dead_letters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    _, button_id, channel = query.data.split("_", 2)
+    channel_id = None if channel == "*" else channel
+    queued, replayed = await DB.run_write(lambda conn: _replay_dead_letters(conn, button_id, channel_id))
+    await CIRCUIT.refresh()
+    cancel_empty_reminder(context.job_queue, button_id)
+    keyboard = [[InlineKeyboardButton(" 🔙वापस", callback_data=f"dlq_{button_id}")]]
+    await query.edit_message_text(
+        f"🔁 {replayed} डिलीवरी ({queued} मैसेज) क्यू में वापस डाली गईं; अगले शेड्यूल पर भेजी जाएँगी।",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+    )
+
+
+@owner_only
+async def clear_dead_letters(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
+    removed = await db_execute("DELETE FROM dead_letters WHERE button_id=?", (button_id,))
+    keyboard = [[InlineKeyboardButton(" 🔙वापस", callback_data=f"{button_id}")]]
+    await query.edit_message_text(f"🗑 {removed} डेड-लेटर हटा दिए गए।", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
 @owner_only
 async def add_messages_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
     button_id = query.data.split("_")[-1]
     context.user_data["action"] = f"add_messages_{button_id}"
-    await query.edit_message_text("🔜मैसेज भेजें (टेक्स्ट/फोटो/डॉक्युमेंट/वीडियो). फोटो/डॉक्युमेंट के साथ कैप्शन भी भेज सकते हैं:")
+    await query.edit_message_text(
+        "🔜मैसेज भेजें (टेक्स्ट/फोटो/डॉक्युमेंट/वीडियो). फोटो/डॉक्युमेंट के साथ कैप्शन भी भेज सकते हैं:\n"
+        "(पहली लाइन में @HH:MM लिखें तो उस समय से पहले नहीं भेजा जाएगा)"
+    )
+
+@owner_only
+async def add_urgent_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
+    context.user_data["action"] = f"add_urgent_{button_id}"
+    await query.edit_message_text(
+        "⚡ अर्जेंट मैसेज भेजें — ये स्लॉट का इंतज़ार किए बिना कुछ सेकंड में सारे चैनल्स पर जाएँगे।\n"
+        "किसी ख़ास समय पर भेजना हो तो पहली लाइन में @HH:MM लिखें।"
+    )
 
 @owner_only
 async def set_times_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -498,6 +3103,32 @@ async def set_times_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     context.user_data["action"] = f"set_times_{button_id}"
     await query.edit_message_text("टाइम भेजें (HH:MM फॉर्मेट में, एक लाइन में एक):")
 
+@owner_only
+async def import_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
+    context.user_data["action"] = f"import_{button_id}"
+    await query.edit_message_text(
+        "📥 .csv / .json / .jsonl फ़ाइल डॉक्यूमेंट के रूप में भेजें।\n\n"
+        "चैनल्स: कॉलम/की `channel_id`\n"
+        "मैसेज: `media_type` (text/photo/video/document), `content`, `file_id`\n"
+        "वैकल्पिक: `file_unique_id`, `priority` (> 0 = अर्जेंट), `send_at` (epoch या 2026-01-31T18:30, IST)\n"
+        "JSON में {\"channels\": [...], \"messages\": [...]} भी चलेगा।"
+    )
+
+async def set_forwarding_state(button_id: str, enabled: bool, notify_chat_id=None) -> None:
+    await db_execute(
+        "INSERT INTO forwarding (button_id, enabled, notify_chat_id, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(button_id) DO UPDATE SET enabled=excluded.enabled, "
+        "notify_chat_id=COALESCE(excluded.notify_chat_id, forwarding.notify_chat_id), updated_at=CURRENT_TIMESTAMP",
+        (button_id, int(enabled), notify_chat_id),
+    )
+    if enabled:
+        # रुके रहने के दौरान आए urgent मैसेज अब भेजें (dispatcher रुके बटन नहीं देखता)
+        URGENT.notify(button_id)
+
+
 @owner_only
 async def start_forwarding(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # start_forwarding फ़ंक्शन में
@@ -506,297 +3137,301 @@ async def start_forwarding(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await query.answer()
     button_id = query.data.split("_")[-1]
 
-    rows = await db_fetchall("SELECT schedule_time FROM schedules WHERE button_id=?", (button_id,))
-    times = [r[0] for r in rows]
+    times = await CONFIG_CACHE.schedules(button_id)
     if not times:
         await query.edit_message_text("❌ पहले टाइम सेट करें!")
         return
 
-    # cancel existing jobs for this button
-    all_jobs = context.job_queue.jobs()
-    for job in all_jobs:
-        if job.name and job.name.startswith(f"job_{button_id}_"):
-            job.schedule_removal()
-    
-       # ... (for job in all_jobs: ... के बाद)
-    created = 0
-    for t in times:
-        try:
-            h, m = map(int, t.split(":"))
-            when = dtime(hour=h, minute=m, tzinfo=IST)
-            
-            context.job_queue.run_daily(
-                forward_messages_job,
-                time=when,
-                name=f"job_{button_id}_{t}",
-                data={"button_id": button_id, "notify_chat_id": query.message.chat_id, "time": t},
-                job_kwargs={'misfire_grace_time': 300} 
-            )
-            created += 1
-        except (ValueError, IndexError):
-            logger.warning(f"Invalid time format found: {t}. Skipping.")
-            continue # अगर टाइम फॉर्मेट गलत है तो अगले पर जाएं
-    # ... (for लूप के बाद)
-    
-        if created > 0:
-            await query.edit_message_text(f"✅ फॉरवर्डिंग शुरू! {created} टाइम्स पर मैसेज भेजे जाएंगे।")
-        else:
-            await query.edit_message_text("❌ कोई भी वैध टाइम शेड्यूल नहीं किया जा सका। कृपया सही HH:MM फॉर्मेट में टाइम भेजें।")
-    
+    notify_chat_id = query.message.chat_id
+    created = SCHEDULER.set_button(button_id, times, notify_chat_id)
+
+    if created > 0:
+        # restart के बाद भी जॉब्स वापस बनें, इसलिए स्टेट सेव करें
+        await set_forwarding_state(button_id, True, notify_chat_id)
+        await query.edit_message_text(f"✅ फॉरवर्डिंग शुरू! {created} टाइम्स पर मैसेज भेजे जाएंगे।")
+    else:
+        await query.edit_message_text("❌ कोई भी वैध टाइम शेड्यूल नहीं किया जा सका। कृपया सही HH:MM फॉर्मेट में टाइम भेजें।")
+
+
+@owner_only
+async def stop_forwarding(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    button_id = query.data.split("_")[-1]
 
+    SCHEDULER.remove_button(button_id)
+    await set_forwarding_state(button_id, False)
+    await query.edit_message_text(f"⏹ {button_id}: फॉरवर्डिंग रोक दी गई।")
 
 
 # =====================
-# Message capture
+# Enqueue (content-hash dedup + shared blobs)
 # =====================
-@owner_only
-async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    action = context.user_data.get("action")
-    if not action or not action.startswith("add_messages_"):
-        return
+def content_hash(media_type: str, content, identity=None) -> str:
+    """
+    Dedup key: media के लिए identity = file_unique_id (caption इसमें नहीं), album के लिए
+    items के file_unique_id, और text के लिए खुद content।
+    """
+    key = identity if identity is not None else (content or "")
+    return hashlib.sha256(f"{media_type}\0{key}".encode()).hexdigest()
 
-    button_id = action.split("_")[-1]
-    content = update.message.caption or None
 
-    media_type = None
-    file_id = None
+def _split_payload(media_type: str, content, file_id):
+    """(blob_content, blob_file_id, row_content) — साझा हिस्सा blob में, caption/album JSON row में।"""
+    if media_type == 'text':
+        return content, None, None
+    if media_type == 'album':
+        return None, None, content
+    return None, file_id, content
 
-    if update.message.photo:
-        media_type = 'photo'
-        file_id = update.message.photo[-1].file_id
-    elif update.message.video:
-        media_type = 'video'
-        file_id = update.message.video.file_id
-    elif update.message.document:
-        media_type = 'document'
-        file_id = update.message.document.file_id
-    elif update.message.text:
-        media_type = 'text'
-        file_id = None
-        content = update.message.text
 
-    if not media_type:
-        await update.message.reply_text("⚠️ सपोर्टेड मीडिया: टेक्स्ट, फोटो, वीडियो, डॉक्यूमेंट")
-        return
+def _enqueue_message(conn: sqlite3.Connection, button_id: str, media_type: str, content, file_id, identity=None,
+                     priority: int = 0, send_at=None, mode: str = DEDUP_MODE, now=None):
+    """
+    मैसेज क्यू में डालें। Payload का साझा हिस्सा message_blobs में hash पर एक ही बार रहता है।
+    उसी बटन में वही hash अभी क्यू में हो, या DEDUP_WINDOW में भेजा जा चुका हो, तो नई row
+    नहीं बनती; 'merge' mode में अभी तक न भेजे गए मीडिया का caption नए वाले से बदल जाता है
+    और ज़्यादा priority वाली कॉपी पुरानी को urgent lane में ले जाती है।
+    Returns: (result, message_id) — result: 'queued' | 'merged' | 'duplicate'
+    """
+    now = now or time.time()
+    digest = content_hash(media_type, content, identity)
+    blob_content, blob_file_id, row_content = _split_payload(media_type, content, file_id)
+    conn.execute(
+        "INSERT INTO message_blobs (hash, media_type, content, file_id, created_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(hash) DO NOTHING",
+        (digest, media_type, blob_content, blob_file_id, now),
+    )
+    blob_id = conn.execute("SELECT id FROM message_blobs WHERE hash=?", (digest,)).fetchone()[0]
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+    if mode != "off":
+        dup = conn.execute(
+            "SELECT id, status, content, priority FROM messages WHERE blob_id=? AND button_id=? "
+            "AND status IN ('pending', 'sending') ORDER BY id LIMIT 1",
+            (blob_id, button_id),
+        ).fetchone()
+        if dup is not None:
+            dup_id, dup_status, dup_content, dup_priority = dup
+            if mode == "merge" and dup_status == 'pending':
+                merged = False
+                if media_type in ALBUM_MEDIA_TYPES and row_content != dup_content:
+                    conn.execute("UPDATE messages SET content=? WHERE id=?", (row_content, dup_id))
+                    merged = True
+                if priority > dup_priority:
+                    conn.execute("UPDATE messages SET priority=?, send_at=? WHERE id=?", (priority, send_at, dup_id))
+                    merged = True
+                if merged:
+                    return "merged", dup_id
+            return "duplicate", dup_id
+        if DEDUP_WINDOW > 0 and conn.execute(
+            "SELECT 1 FROM messages_history WHERE blob_id=? AND button_id=? AND delivered_at > ? LIMIT 1",
+            (blob_id, button_id, now - DEDUP_WINDOW),
+        ).fetchone():
+            return "duplicate", None
 
-    logger.info(f"Enqueueing message for button {button_id}: {message_data}")
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+    msg_id = conn.execute(
+        "INSERT INTO messages (button_id, content, media_type, file_id, blob_id, priority, send_at) "
+        "VALUES (?, ?, ?, NULL, ?, ?, ?)",
+        (button_id, row_content, media_type, blob_id, priority, send_at),
+    ).lastrowid
+    return "queued", msg_id
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    # message_data should be defined once, then used
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+async def enqueue_message(button_id: str, media_type: str, content, file_id=None, identity=None,
+                          priority: int = 0, send_at=None) -> str:
+    result, _ = await DB.run_write(
+        lambda conn: _enqueue_message(conn, button_id, media_type, content, file_id, identity, priority, send_at)
+    )
+    ENQUEUE_RESULTS.inc(result=result)
+    if priority > 0 and result != "duplicate":
+        URGENT.notify(button_id, send_at)
+    return result
 
-    logger.info(f"Enqueueing message for button {button_id}: {message_data}")
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
 
-    }
+SEND_AT_PREFIX = re.compile(r"^@(\d{1,2}:\d{2})[ \t]*\n?")
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
 
-    }
+def split_send_at(text):
+    """
+    टेक्स्ट/कैप्शन की शुरुआत में '@HH:MM' (IST) हो तो उस समय की अगली घटना से पहले न भेजें।
+    Returns: (send_at या None, prefix हटाया हुआ text)
+    """
+    match = SEND_AT_PREFIX.match(text or "")
+    if not match or not is_valid_time_str(match.group(1)):
+        return None, text
+    return next_slot_time(match.group(1), time.time()), text[match.end():] or None
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
 
-    }
+def parse_send_at_value(value):
+    """Import का send_at: epoch seconds या ISO datetime (timezone न हो तो IST)। खाली = None"""
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    dt = datetime.fromisoformat(str(value).strip())
+    if dt.tzinfo is None:
+        dt = IST.localize(dt) if IST else dt.replace(tzinfo=pytz.utc)
+    return dt.timestamp()
 
 
-    # enqueue AFTER log to be sure message_data is correct
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+def describe_send_at(send_at) -> str:
+    return datetime.fromtimestamp(send_at, IST or pytz.utc).strftime("%d-%m %H:%M")
 
-    
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+def message_priority(action: str) -> int:
+    return URGENT_PRIORITY if action.startswith("add_urgent_") else 0
 
-    # enqueue
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
 
+def queue_note(priority: int, send_at) -> str:
+    """Owner को जवाब में lane/समय की जानकारी।"""
+    note = ""
+    if priority > 0:
+        note += "\n⚡ अर्जेंट — स्लॉट का इंतज़ार नहीं करेगा।"
+    if send_at:
+        note += f"\n⏰ {describe_send_at(send_at)} से पहले नहीं भेजा जाएगा।"
+    return note
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+def _purge_orphan_blobs(conn: sqlite3.Connection, limit: int) -> int:
+    """जिन blobs को अब न कोई queue row और न history row इस्तेमाल करती है, उन्हें हटाएँ।"""
+    return conn.execute(
+        "DELETE FROM message_blobs WHERE id IN (SELECT b.id FROM message_blobs b "
+        "WHERE NOT EXISTS (SELECT 1 FROM messages m WHERE m.blob_id = b.id) "
+        "AND NOT EXISTS (SELECT 1 FROM messages_history h WHERE h.blob_id = b.id) LIMIT ?)",
+        (limit,),
+    ).rowcount
+
+
+DUPLICATE_REPLY = "⚠️ यह मैसेज इस बटन की क्यू में पहले से है (या हाल ही में भेजा जा चुका है) — दोबारा नहीं जोड़ा गया।"
+MERGED_REPLY = "🔁 यह मैसेज क्यू में पहले से था — नया कैप्शन/priority उसी पर लगा दिया गया।"
+
+
+# =====================
+# Message capture
+# =====================
+def cancel_empty_reminder(job_queue, button_id: str) -> None:
+    NOTIFIER.clear("empty", button_id)
+    for j in job_queue.get_jobs_by_name(f"empty_notify_{button_id}"):
+        j.schedule_removal()
+        logger.debug("Removed empty queue reminder for %s as a new message was added", button_id)
+
+
+# media_group_id -> {"button_id", "chat_id", "items": [(message_id, item), ...]}
+_album_buffers = {}
+
+
+def collect_album_item(context, message, button_id, media_type, file_id, caption, unique_id=None, priority=0) -> None:
+    """
+    एक ही media_group_id वाले updates को इकट्ठा करें। पहला आइटम आने पर एक
+    run_once जॉब लगती है जो ALBUM_COLLECT_SECONDS बाद पूरे एल्बम को एक row में लिखती है।
+    """
+    group_id = message.media_group_id
+    buf = _album_buffers.get(group_id)
+    if buf is None:
+        buf = _album_buffers[group_id] = {"button_id": button_id, "chat_id": message.chat_id, "items": [], "priority": priority}
+        context.job_queue.run_once(
+            flush_album,
+            when=ALBUM_COLLECT_SECONDS,
+            name=f"album_{group_id}",
+            data={"media_group_id": group_id},
+        )
+    buf["items"].append((message.message_id, {"type": media_type, "file_id": file_id, "caption": caption}, unique_id or file_id))
+
+
+async def flush_album(context: ContextTypes.DEFAULT_TYPE):
+    group_id = context.job.data["media_group_id"]
+    buf = _album_buffers.pop(group_id, None)
+    if not buf:
+        return
+    button_id = buf["button_id"]
+    ordered = sorted(buf["items"], key=lambda x: x[0])[:ALBUM_MAX_ITEMS]
+    items = [item for _, item, _ in ordered]
+
+    logger.info("Adding album (%d items) to SQLite for button %s", len(items), button_id)
+    result = await enqueue_message(
+        button_id, 'album', json.dumps(items, ensure_ascii=False), identity=",".join(u for _, _, u in ordered),
+        priority=buf["priority"],
+    )
+    if result != "queued":
+        await context.bot.send_message(buf["chat_id"], DUPLICATE_REPLY if result == "duplicate" else MERGED_REPLY)
+        return
+    pending_count = await count_pending(button_id)
+    cancel_empty_reminder(context.job_queue, button_id)
+    await context.bot.send_message(
+        buf["chat_id"],
+        f"✅ एल्बम ({len(items)} मीडिया) जोड़ा गया! (कुल पेंडिंग: {pending_count})" + queue_note(buf["priority"], None),
+    )
+
+
+def build_album_media(content: str):
+    """messages.content में रखे एल्बम JSON से send_media_group के लिए InputMedia लिस्ट बनाएं।"""
+    input_types = {'photo': InputMediaPhoto, 'video': InputMediaVideo, 'document': InputMediaDocument}
+    return [
+        input_types[item["type"]](media=item["file_id"], caption=item.get("caption") or None)
+        for item in json.loads(content)
+    ]
+
+
+@owner_only
+async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    action = context.user_data.get("action")
+    if action and action.startswith("import_") and update.message.document:
+        await handle_import(update, context, action.split("_")[-1])
+        return
+    if not action or not action.startswith(("add_messages_", "add_urgent_")):
+        return
+
+    button_id = action.split("_")[-1]
+    priority = message_priority(action)
+    content = update.message.caption or None
+
+    media_type = None
+    file_id = unique_id = None
+
+    if update.message.photo:
+        media_type = 'photo'
+        file_id = update.message.photo[-1].file_id
+        unique_id = update.message.photo[-1].file_unique_id
+    elif update.message.video:
+        media_type = 'video'
+        file_id = update.message.video.file_id
+        unique_id = update.message.video.file_unique_id
+    elif update.message.document:
+        media_type = 'document'
+        file_id = update.message.document.file_id
+        unique_id = update.message.document.file_unique_id
+    elif update.message.text:
+        media_type = 'text'
+        file_id = None
+        content = update.message.text
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+    if not media_type:
+        await update.message.reply_text("⚠️ सपोर्टेड मीडिया: टेक्स्ट, फोटो, वीडियो, डॉक्यूमेंट")
+        return
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+    # एल्बम का हिस्सा है तो अलग row न बनाएं; पूरा एल्बम एक क्यू आइटम बनेगा
+    if update.message.media_group_id and media_type in ALBUM_MEDIA_TYPES:
+        collect_album_item(context, update.message, button_id, media_type, file_id, content, unique_id, priority)
+        return
 
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
+    send_at, content = split_send_at(content)
+    logger.info("Adding %s message to SQLite for button %s", media_type, button_id)
+    result = await enqueue_message(button_id, media_type, content, file_id, unique_id, priority, send_at)
+    if result == "duplicate":
+        await update.message.reply_text(DUPLICATE_REPLY)
+        return
+    if result == "merged":
+        await update.message.reply_text(MERGED_REPLY)
+        return
 
-    # enqueue message once
-    message_data = {
-        "content": content,
-        "media_type": media_type,
-        "file_id": file_id,
-    }
-   # ... (media_type और file_id सेट करने के बाद)
-    logger.info(f"Adding message to SQLite for button {button_id}")
-    await db_execute(
-        "INSERT INTO messages (button_id, content, media_type, file_id) VALUES (?, ?, ?, ?)",
-        (button_id, content, media_type, file_id)
-    )
-    
     # आप चाहें तो एक्शन को यहाँ क्लियर कर सकते हैं या यूजर को और मैसेज जोड़ने दे सकते हैं
-    pending_count_rows = await db_fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='pending'", (button_id,))
-    pending_count = pending_count_rows[0][0]
+    pending_count = await count_pending(button_id)
     # --- मौजूदा रिमाइंडर को रद्द करें क्योंकि अब क्यू खाली नहीं है ---
-    jobs = context.job_queue.get_jobs_by_name(f"empty_notify_{button_id}")
-    for j in jobs:
-        j.schedule_removal()
-        print(f"DEBUG: Removed empty queue reminder for {button_id} as a new message was added.")
+    cancel_empty_reminder(context.job_queue, button_id)
     # -------------------------------------------------------------
-    await update.message.reply_text(f"✅ मीडिया मैसेज जोड़ा गया! (कुल पेंडिंग: {pending_count})")
+    await update.message.reply_text(f"✅ मीडिया मैसेज जोड़ा गया! (कुल पेंडिंग: {pending_count})" + queue_note(priority, send_at))
 
 
 @owner_only
@@ -805,15 +3440,31 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not action:
         return
 
+    # नया बटन / नाम बदलना
+    if action == "new_button" or action.startswith("rename_button_"):
+        label = (update.message.text or "").strip()[:MAX_BUTTON_LABEL]
+        if not label:
+            await update.message.reply_text("⚠️ नाम खाली है!")
+            return
+        context.user_data.pop("action", None)
+        if action == "new_button":
+            button_id = await create_button(label)
+            await update.message.reply_text(f"✅ नया बटन {button_id} ({label}) बनाया गया! /start से खोलें।")
+        else:
+            button_id = action.split("_")[-1]
+            if await rename_button(button_id, label):
+                await update.message.reply_text(f"✅ बटन {button_id} का नाम अब: {label}")
+            else:
+                await update.message.reply_text(f"❌ बटन {button_id} नहीं मिला")
+
     # चैनल जोड़ने का लॉजिक
-    if action.startswith("add_channels_"):
+    elif action.startswith("add_channels_"):
         button_id = action.split("_")[-1]
         lines = [ln.strip() for ln in (update.message.text or "").splitlines() if ln.strip()]
-        added = 0
-        for ch in lines:
-            if ch.startswith("@") or (ch.startswith("-") and ch[1:].isdigit()):
-                await db_execute("INSERT INTO channels (button_id, channel_id) VALUES (?, ?)", (button_id, ch))
-                added += 1
+        rows = [(button_id, ch) for ch in lines if is_valid_channel_id(ch)]
+        # एक ही transaction; पहले से जुड़े चैनल unique index की वजह से छोड़ दिए जाते हैं
+        added = await db_executemany("INSERT OR IGNORE INTO channels (button_id, channel_id) VALUES (?, ?)", rows) if rows else 0
+        CONFIG_CACHE.invalidate(button_id)
         context.user_data.pop("action", None)
         await update.message.reply_text(f"✅ {added} चैनल सफलतापूर्वक जोड़े गए!")
 
@@ -823,38 +3474,395 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         lines = [ln.strip() for ln in (update.message.text or "").splitlines() if ln.strip()]
         valid_times = [t for t in lines if is_valid_time_str(t)][:MAX_TIMES_PER_BUTTON]
         
-        await db_execute("DELETE FROM schedules WHERE button_id=?", (button_id,))
-        for t in valid_times:
-            await db_execute("INSERT INTO schedules (button_id, schedule_time) VALUES (?, ?)", (button_id, t))
+        await DB.run_write(lambda conn: _replace_schedules(conn, button_id, valid_times))
+        CONFIG_CACHE.invalidate(button_id)
+        # फॉरवर्डिंग चालू हो तो नए टाइम्स तुरंत लागू
+        await SCHEDULER.refresh(button_id)
             
         context.user_data.pop("action", None)
         await update.message.reply_text(f"✅ {len(valid_times)} टाइम सेट किए गए!")
 
     # टेक्स्ट मैसेज जोड़ने का लॉजिक
-    elif action.startswith("add_messages_"):
+    elif action.startswith(("add_messages_", "add_urgent_")):
         button_id = action.split("_")[-1]
-        content = update.message.text
+        priority = message_priority(action)
+        send_at, content = split_send_at(update.message.text)
         if not content:
             await update.message.reply_text("⚠️ संदेश खाली है!")
             return
         
-        logger.info(f"Adding text message to SQLite for button {button_id}")
-        await db_execute(
-            "INSERT INTO messages (button_id, content, media_type, file_id) VALUES (?, ?, ?, ?)",
-            (button_id, content, 'text', None)
-        )
+        logger.info("Adding text message to SQLite for button %s", button_id)
+        result = await enqueue_message(button_id, 'text', content, priority=priority, send_at=send_at)
+        if result != "queued":
+            await update.message.reply_text(DUPLICATE_REPLY if result == "duplicate" else MERGED_REPLY)
+            return
     
-        pending_count_rows = await db_fetchall("SELECT COUNT(*) FROM messages WHERE button_id=? AND status='pending'", (button_id,))
-        pending_count = pending_count_rows[0][0]
+        pending_count = await count_pending(button_id)
         # --- मौजूदा रिमाइंडर को रद्द करें क्योंकि अब क्यू खाली नहीं है ---
-        jobs = context.job_queue.get_jobs_by_name(f"empty_notify_{button_id}")
-        for j in jobs:
-            j.schedule_removal()
-            print(f"DEBUG: Removed empty queue reminder for {button_id} as a new message was added.")
+        cancel_empty_reminder(context.job_queue, button_id)
         # -------------------------------------------------------------
-        await update.message.reply_text(f"✅ टेक्स्ट मैसेज जोड़ा गया! (कुल पेंडिंग: {pending_count})")
+        await update.message.reply_text(f"✅ टेक्स्ट मैसेज जोड़ा गया! (कुल पेंडिंग: {pending_count})" + queue_note(priority, send_at))
+
+
+
+
+def _replace_schedules(conn: sqlite3.Connection, button_id: str, times) -> None:
+    conn.execute("DELETE FROM schedules WHERE button_id=?", (button_id,))
+    conn.executemany(
+        "INSERT INTO schedules (button_id, schedule_time) VALUES (?, ?)", [(button_id, t) for t in times]
+    )
+
+
+# =====================
+# Bulk import (CSV / JSON / JSON Lines)
+# =====================
+def iter_import_records(data: bytes, filename: str):
+    """फ़ाइल से records (dict) एक-एक करके निकालें; CSV और JSON Lines stream होते हैं।"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        yield from csv.DictReader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    elif name.endswith((".jsonl", ".ndjson")):
+        for line in io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig"):
+            if line.strip():
+                yield json.loads(line)
+    elif name.endswith(".json"):
+        doc = json.loads(bytes(data).decode("utf-8-sig"))
+        # सही JSON पर गलत आकार (जैसे {"channels": 5}) भी ValueError ही हो, ताकि owner को जवाब मिले
+        if isinstance(doc, dict):
+            channels, messages = doc.get("channels", []), doc.get("messages", [])
+            if not isinstance(channels, list) or not isinstance(messages, list):
+                raise ValueError('"channels" और "messages" लिस्ट होनी चाहिए')
+            for ch in channels:
+                yield {"channel_id": ch} if isinstance(ch, str) else ch
+            yield from messages
+        elif isinstance(doc, list):
+            yield from doc
+        else:
+            raise ValueError("JSON में records की लिस्ट या {\"channels\": [...], \"messages\": [...]} होना चाहिए")
+    else:
+        raise ValueError("सिर्फ़ .csv, .json या .jsonl फ़ाइल सपोर्टेड है")
+
+
+async def resolve_import_unique_ids(bot, data: bytes, filename: str) -> dict:
+    """
+    Import के media records का file_id -> file_unique_id (getFile से), ताकि dedup वही पहचान
+    इस्तेमाल करे जो UI से जुड़े मैसेज करते हैं। जिन records में file_unique_id पहले से है
+    वो छोड़े जाते हैं; जो resolve न हो (जैसे 20 MB से बड़ी फ़ाइल) वो file_id से पहचाने जाते हैं।
+    """
+    file_ids = set()
+    for rec in iter_import_records(data, filename):
+        if not isinstance(rec, dict) or rec.get("file_unique_id"):
+            continue
+        file_id = rec.get("file_id")
+        if isinstance(file_id, str) and file_id and str(rec.get("media_type") or "").strip().lower() in ALBUM_MEDIA_TYPES:
+            file_ids.add(file_id)
+
+    resolved = {}
+    slots = asyncio.Semaphore(IMPORT_RESOLVE_CONCURRENCY)
+
+    async def resolve(file_id: str) -> None:
+        async with slots:
+            for _ in range(3):
+                try:
+                    resolved[file_id] = (await bot.get_file(file_id)).file_unique_id
+                    return
+                except error.RetryAfter as e:
+                    await asyncio.sleep(retry_after_seconds(e))
+                except error.TelegramError as e:
+                    logger.debug("Import: no file_unique_id for %s: %s", file_id, e)
+                    return
+
+    await asyncio.gather(*(resolve(file_id) for file_id in file_ids))
+    if len(resolved) < len(file_ids):
+        logger.info("Import: %d of %d files dedup by file_id only", len(file_ids) - len(resolved), len(file_ids))
+    return resolved
+
+
+def _message_record(button_id: str, rec: dict, unique_ids=None):
+    """
+    Import record को (button_id, media_type, content, file_id, priority, send_at, identity) में
+    बदलें; अमान्य हो तो None। identity = file_unique_id (record का या unique_ids से), नहीं तो file_id।
+    """
+    media_type = str(rec.get("media_type") or "text").strip().lower()
+    try:
+        priority = int(rec.get("priority") or 0)
+        send_at = parse_send_at_value(rec.get("send_at"))
+    except (TypeError, ValueError):
+        return None
+    content = rec.get("content") or None
+    file_id = rec.get("file_id") or None
+    if not isinstance(content, (str, type(None))) or not isinstance(file_id, (str, type(None))):
+        return None
+    identity = None
+    if media_type == 'text':
+        if not content:
+            return None
+        file_id = None
+    elif media_type in ALBUM_MEDIA_TYPES:
+        if not file_id:
+            return None
+        identity = rec.get("file_unique_id") or (unique_ids or {}).get(file_id)
+        if not isinstance(identity, str):
+            identity = file_id
+    else:
+        return None
+    return (button_id, media_type, content, file_id, priority, send_at, identity)
+
+
+def _import_records(conn: sqlite3.Connection, button_id: str, records, unique_ids=None) -> dict:
+    """
+    Writer thread पर एक ही transaction में import: records IMPORT_CHUNK_SIZE के
+    chunks में executemany से लिखे जाते हैं, इसलिए मेमोरी सीमित रहती है।
+    """
+    stats = {"channels": 0, "duplicates": 0, "messages": 0, "duplicate_messages": 0, "urgent": 0, "invalid": 0}
+    channel_buf, message_buf = [], []
 
+    def flush_channels():
+        added = conn.executemany(
+            "INSERT OR IGNORE INTO channels (button_id, channel_id) VALUES (?, ?)", channel_buf
+        ).rowcount
+        stats["channels"] += added
+        stats["duplicates"] += len(channel_buf) - added
+        channel_buf.clear()
 
+    def flush_messages():
+        # हर chunk पर statements की गिनती तय: blobs, blob ids, messages और (merge mode में) merges —
+        # सब executemany / एक SELECT से, dedup SQL में (row-दर-row _enqueue_message नहीं)
+        now = time.time()
+        digests = []
+        blob_rows = {}
+        for _, media_type, content, file_id, _, _, identity in message_buf:
+            # media की पहचान UI वाली ही: file_unique_id (जो resolve न हुआ उसका file_id)
+            digest = content_hash(media_type, content, identity)
+            digests.append(digest)
+            if digest not in blob_rows:
+                blob_content, blob_file_id, _ = _split_payload(media_type, content, file_id)
+                blob_rows[digest] = (digest, media_type, blob_content, blob_file_id, now)
+        conn.executemany(
+            "INSERT INTO message_blobs (hash, media_type, content, file_id, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(hash) DO NOTHING",
+            list(blob_rows.values()),
+        )
+        blob_ids = dict(conn.execute(
+            f"SELECT hash, id FROM message_blobs WHERE hash IN ({_placeholders(len(blob_rows))})", tuple(blob_rows)
+        ).fetchall())
+
+        rows = []
+        for (bid, media_type, content, _, priority, send_at, _), digest in zip(message_buf, digests):
+            _, _, row_content = _split_payload(media_type, content, None)
+            rows.append((bid, row_content, media_type, blob_ids[digest], priority, send_at))
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        if DEDUP_MODE == "off":
+            queued = conn.executemany(
+                "INSERT INTO messages (button_id, content, media_type, file_id, blob_id, priority, send_at) "
+                "VALUES (?, ?, ?, NULL, ?, ?, ?)",
+                rows,
+            ).rowcount
+        else:
+            # executemany rows क्रम से चलती हैं, इसलिए chunk के अंदर के duplicates भी पकड़े जाते हैं
+            queued = conn.executemany(
+                "INSERT INTO messages (button_id, content, media_type, file_id, blob_id, priority, send_at) "
+                "SELECT ?1, ?2, ?3, NULL, ?4, ?5, ?6 WHERE NOT EXISTS ("
+                "SELECT 1 FROM messages WHERE blob_id=?4 AND button_id=?1 AND status IN ('pending', 'sending')"
+                ") AND NOT EXISTS ("
+                "SELECT 1 FROM messages_history WHERE blob_id=?4 AND button_id=?1 AND delivered_at > ?7)",
+                [(*r, now - DEDUP_WINDOW if DEDUP_WINDOW > 0 else now) for r in rows],
+            ).rowcount
+        stats["messages"] += queued
+        stats["duplicate_messages"] += len(rows) - queued
+        stats["urgent"] += conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE id > ? AND priority > 0", (last_id,)
+        ).fetchone()[0]
+
+        if DEDUP_MODE == "merge":
+            # _enqueue_message जैसा merge: क्यू में pending कॉपी पर नया caption / ज़्यादा priority
+            first_pending = (
+                "(SELECT id FROM messages WHERE blob_id=? AND button_id=? AND status IN ('pending', 'sending') "
+                "ORDER BY id LIMIT 1)"
+            )
+            conn.executemany(
+                f"UPDATE messages SET content=? WHERE id={first_pending} AND status='pending' AND content IS NOT ?",
+                [(r[1], r[3], r[0], r[1]) for r in rows if r[2] in ALBUM_MEDIA_TYPES],
+            )
+            stats["urgent"] += conn.executemany(
+                f"UPDATE messages SET priority=?, send_at=? WHERE id={first_pending} AND status='pending' "
+                "AND priority < ?",
+                [(r[4], r[5], r[3], r[0], r[4]) for r in rows if r[4] > 0],
+            ).rowcount
+        message_buf.clear()
+
+    for rec in records:
+        if not isinstance(rec, dict):
+            stats["invalid"] += 1
+            continue
+        ch = str(rec.get("channel_id") or "").strip()
+        if ch:
+            if is_valid_channel_id(ch):
+                channel_buf.append((button_id, ch))
+            else:
+                stats["invalid"] += 1
+        else:
+            row = _message_record(button_id, rec, unique_ids)
+            if row is None:
+                stats["invalid"] += 1
+            else:
+                message_buf.append(row)
+        if len(channel_buf) >= IMPORT_CHUNK_SIZE:
+            flush_channels()
+        if len(message_buf) >= IMPORT_CHUNK_SIZE:
+            flush_messages()
+
+    if channel_buf:
+        flush_channels()
+    if message_buf:
+        flush_messages()
+    return stats
+
+
+async def handle_import(update: Update, context: ContextTypes.DEFAULT_TYPE, button_id: str) -> None:
+    document = update.message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.message.reply_text(f"❌ फ़ाइल बहुत बड़ी है (अधिकतम {IMPORT_MAX_BYTES // (1024 * 1024)} MB)")
+        return
+
+    tg_file = await context.bot.get_file(document.file_id)
+    data = bytes(await tg_file.download_as_bytearray())
+    started = time.perf_counter()
+    try:
+        unique_ids = await resolve_import_unique_ids(context.bot, data, document.file_name)
+        stats = await DB.run_write(
+            lambda conn: _import_records(conn, button_id, iter_import_records(data, document.file_name), unique_ids)
+        )
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        # पूरा import rollback हो चुका है
+        await update.message.reply_text(f"❌ इम्पोर्ट असफल, कुछ भी नहीं जोड़ा गया: {e}")
+        return
+
+    if stats["channels"]:
+        CONFIG_CACHE.invalidate(button_id)
+    if stats["messages"]:
+        cancel_empty_reminder(context.job_queue, button_id)
+    if stats["urgent"]:
+        URGENT.notify(button_id)
+    context.user_data.pop("action", None)
+    logger.info("Import for %s: %s in %.2fs", button_id, stats, time.perf_counter() - started)
+    await update.message.reply_text(
+        f"✅ इम्पोर्ट पूरा ({time.perf_counter() - started:.1f}s)\n"
+        f"चैनल जोड़े: {stats['channels']} (पहले से मौजूद: {stats['duplicates']})\n"
+        f"मैसेज जोड़े: {stats['messages']} (duplicate छोड़े: {stats['duplicate_messages']})\n"
+        f"अमान्य rows छोड़ी गईं: {stats['invalid']}"
+    )
+
+
+# =====================
+# Profiling (job spans + sampling profiler)
+# =====================
+_profile_running = False
+
+
+def sample_stacks(seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> collections.Counter:
+    """
+    हर interval पर सारे threads (event loop समेत) के Python stacks लें और उन्हें
+    collapsed ("folded") रूप में गिनें — flamegraph.pl / speedscope सीधे खोल लेते हैं।
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(parts))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def summarize_stacks(stacks: collections.Counter, thread_name: str, top: int = 12) -> str:
+    """एक thread के सबसे ज़्यादा दिखे leaf frames (self samples)।"""
+    leaves = collections.Counter()
+    total = 0
+    for stack, n in stacks.items():
+        frames = stack.split(";")
+        if frames[0] != thread_name:
+            continue
+        total += n
+        leaves[frames[-1]] += n
+    lines = [f"{thread_name}: {total} samples"]
+    for frame, n in leaves.most_common(top):
+        lines.append(f"{n * 100 / max(total, 1):5.1f}%  {frame}")
+    return "\n".join(lines)
+
+
+@owner_only
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile [seconds] — चलते बॉट का sampling profile, folded stacks की फ़ाइल के रूप में।"""
+    global _profile_running
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text("⚠️ उपयोग: /profile [seconds]")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    if _profile_running:
+        await update.message.reply_text("⏳ एक profile पहले से चल रहा है।")
+        return
+
+    _profile_running = True
+    loop_thread = threading.current_thread().name
+    await update.message.reply_text(f"⏱ {seconds}s का sampling profile शुरू…")
+    try:
+        stacks = await asyncio.to_thread(sample_stacks, seconds)
+    finally:
+        _profile_running = False
+
+    folded = "\n".join(f"{stack} {n}" for stack, n in stacks.most_common())
+    await update.message.reply_document(
+        document=io.BytesIO(folded.encode()),
+        filename=f"profile-{datetime.now(IST):%Y%m%d-%H%M%S}.folded",
+        caption=summarize_stacks(stacks, loop_thread)[:1024],
+    )
+
+
+@owner_only
+async def job_profiles_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/jobprofiles [button_id] — हाल के job runs का span breakdown।"""
+    if context.args:
+        rows = await db_fetchall(
+            "SELECT button_id, slot, started_at, wall_seconds, spans FROM job_profiles WHERE button_id=? "
+            "ORDER BY id DESC LIMIT ?",
+            (context.args[0], JOB_PROFILES_SHOWN),
+        )
+    else:
+        rows = await db_fetchall(
+            "SELECT button_id, slot, started_at, wall_seconds, spans FROM job_profiles ORDER BY id DESC LIMIT ?",
+            (JOB_PROFILES_SHOWN,),
+        )
+    if not rows:
+        hint = "" if PROFILE_JOBS else " (PROFILE_JOBS=1 से चालू करें)"
+        await update.message.reply_text(f"कोई job profile नहीं मिला{hint}।")
+        return
+
+    lines = []
+    for button_id, slot, started_at, wall, spans in rows:
+        when = datetime.fromtimestamp(started_at, IST).strftime("%d-%m %H:%M")
+        lines.append(f"{button_id}@{slot} ({when}) — {wall:.1f}s")
+        top = sorted(json.loads(spans).items(), key=lambda kv: kv[1]["seconds"], reverse=True)
+        for name, s in top:
+            lines.append(f"   {name}: {s['seconds']:.2f}s / {s['count']}")
+    await update.message.reply_text("\n".join(lines)[:4000])
+
+
+@owner_only
+async def dashboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/dashboard — dashboard को नए मैसेज के रूप में नीचे ले आएँ (digest mode में अभी भेजें)।"""
+    await NOTIFIER.repost(context.bot, update.effective_chat.id)
 
 
 # =====================
@@ -872,10 +3880,8 @@ async def show_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 # Error Handler
 # =====================
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
-    logger.error(f"Exception while handling an update: {context.error}")
-    # --- DEBUG PRINT यहाँ डालें ---
-    print(f"DEBUG: Error occurred with update object: {update}")
-    # ---
+    logger.error("Exception while handling an update: %s", context.error, exc_info=context.error)
+    logger.debug("Error occurred with update object: %s", update)
 
     try:
         msg = f"Error: {context.error}\n"
@@ -885,30 +3891,606 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
             txt = update.message.text or update.message.caption
             if txt:
                 msg += f"Msg: {txt[:300]}\n"
-        for admin_id in ADMIN_IDS:
-            await context.bot.send_message(admin_id, f"⚠️ Bot Error Alert:\n{msg}")
+        # एक ही तरह की error बार-बार आए तो dashboard/digest में एक line, गिनती के साथ
+        NOTIFIER.post_admins("bot_error", type(context.error).__name__, f"⚠️ Bot Error: {msg.strip()}")
     except Exception as ex:
-        logger.error(f"Failed sending error alert: {ex}")
+        logger.error("Failed sending error alert: %s", ex)
+
+
+# =====================
+# DB maintenance (retention, incremental vacuum, ANALYZE)
+# =====================
+def migrate_auto_vacuum(path: str = DB_NAME) -> None:
+    """
+    पुरानी DB (auto_vacuum=NONE) को एक बार VACUUM करके INCREMENTAL पर लाएँ।
+    यह पूरी फ़ाइल दोबारा लिखता है, इसलिए सिर्फ़ startup पर, engine शुरू होने से पहले चलता है।
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        started = time.perf_counter()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info("Converted DB to incremental auto_vacuum in %.1fs", time.perf_counter() - started)
+    finally:
+        conn.close()
+
+
+def _purge_history_slice(conn: sqlite3.Connection, cutoff: float, limit: int) -> int:
+    return conn.execute(
+        "DELETE FROM messages_history WHERE id IN ("
+        "SELECT id FROM messages_history WHERE delivered_at < ? ORDER BY delivered_at LIMIT ?)",
+        (cutoff, limit),
+    ).rowcount
+
+
+def _vacuum_step(conn: sqlite3.Connection, pages: int) -> int:
+    """कुछ free pages OS को लौटाएँ; बचे हुए free pages की गिनती लौटाता है।"""
+    # sqlite3 module यह pragma सिर्फ़ एक बार step करता है (= एक page), इसलिए loop
+    for _ in range(pages):
+        conn.execute("PRAGMA incremental_vacuum(1)")
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _optimize(conn: sqlite3.Connection) -> None:
+    # analysis_limit की वजह से ANALYZE हर index के कुछ सौ rows ही देखता है
+    conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+    conn.execute("PRAGMA optimize").fetchall()
+
+
+async def db_maintenance_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    History retention, incremental vacuum और ANALYZE — हर हिस्सा अलग छोटे write में,
+    ताकि forwarding और UI के writes बीच में आते रहें।
+    """
+    started = time.perf_counter()
+    purged = 0
+    if HISTORY_RETENTION_DAYS > 0:
+        cutoff = time.time() - HISTORY_RETENTION_DAYS * 86400
+        while True:
+            n = await DB.run_write(lambda conn: _purge_history_slice(conn, cutoff, MAINTENANCE_PURGE_BATCH))
+            purged += n
+            if n < MAINTENANCE_PURGE_BATCH:
+                break
+            await asyncio.sleep(0)
+        await db_execute("DELETE FROM job_profiles WHERE started_at < ?", (cutoff,))
+
+    blobs = 0
+    while True:
+        n = await DB.run_write(lambda conn: _purge_orphan_blobs(conn, BLOB_PURGE_BATCH))
+        blobs += n
+        if n < BLOB_PURGE_BATCH:
+            break
+        await asyncio.sleep(0)
+
+    free_pages = None
+    for _ in range(VACUUM_MAX_STEPS):
+        free_pages = await DB.run_write(lambda conn: _vacuum_step(conn, VACUUM_PAGES_PER_STEP))
+        if free_pages == 0:
+            break
+        await asyncio.sleep(0)
+
+    await DB.run_write(_optimize)
+    logger.info(
+        "DB maintenance: purged %d history rows, %d blobs, %s free pages left, %.0f ms",
+        purged, blobs, free_pages, (time.perf_counter() - started) * 1000,
+    )
+
+
+# =====================
+# Forwarding workers (multi-process, lease-based)
+# =====================
+async def enqueue_forward_task(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Worker mode में स्लॉट की जॉब: बटन का काम forward_tasks में डालें (पहले से queued हो तो नहीं)।
+    Urgent-only task किसी भी queued task के रहते नहीं बनता (स्लॉट रन भी पहले urgent भेजता है),
+    पर queued urgent task स्लॉट task को नहीं रोकता।
+    """
+    data = context.job.data or {}
+    button_id = data.get("button_id")
+    slot = data.get("time")
+    await db_execute(
+        "INSERT INTO forward_tasks (button_id, slot, notify_chat_id, created_at) SELECT ?, ?, ?, ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM forward_tasks WHERE button_id=? AND owner IS NULL "
+        "AND (? = ? OR slot IS NOT ?))",
+        (button_id, slot, data.get("notify_chat_id"), time.time(), button_id, slot, URGENT_SLOT, URGENT_SLOT),
+    )
+
+
+def _claim_forward_task(conn: sqlite3.Connection, owner: str, now: float):
+    """
+    सबसे पुराना ऐसा task claim करें जिसका बटन किसी और worker की ज़िंदा lease में न हो।
+    Writer transaction (BEGIN IMMEDIATE) की वजह से processes के बीच भी atomic है,
+    इसलिए एक बटन (और उसके मैसेज) एक समय में सिर्फ़ एक worker के पास होते हैं।
+    """
+    row = conn.execute(
+        """
+        SELECT t.id, t.button_id, t.slot, t.notify_chat_id FROM forward_tasks t
+        LEFT JOIN leases l ON l.resource = 'button:' || t.button_id
+        WHERE (t.owner IS NULL OR t.lease_expires < ?)
+          AND (l.resource IS NULL OR l.expires_at < ?)
+          AND t.attempts < ?
+        ORDER BY t.id LIMIT 1
+        """,
+        (now, now, FORWARD_TASK_MAX_ATTEMPTS),
+    ).fetchone()
+    if row is None:
+        return None
+    task_id, button_id = row[0], row[1]
+    conn.execute(
+        "INSERT INTO leases (resource, owner, expires_at, heartbeat_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(resource) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at, "
+        "heartbeat_at=excluded.heartbeat_at",
+        (f"button:{button_id}", owner, now + LEASE_TTL, now),
+    )
+    conn.execute(
+        "UPDATE forward_tasks SET owner=?, lease_expires=?, attempts=attempts+1 WHERE id=?",
+        (owner, now + LEASE_TTL, task_id),
+    )
+    return row
+
+
+def _drop_exhausted_tasks(conn: sqlite3.Connection, now: float):
+    """
+    जो task FORWARD_TASK_MAX_ATTEMPTS बार claim होकर भी पूरा नहीं हुआ (हर बार worker मर गया या
+    lease चली गई) उसे हटाएँ — वरना वो हर worker को बारी-बारी गिराता रहेगा।
+    Returns: [(button_id, slot, attempts), ...]
+    """
+    where = "attempts >= ? AND (owner IS NULL OR lease_expires < ?)"
+    rows = conn.execute(
+        f"SELECT button_id, slot, attempts FROM forward_tasks WHERE {where}", (FORWARD_TASK_MAX_ATTEMPTS, now)
+    ).fetchall()
+    if rows:
+        conn.execute(f"DELETE FROM forward_tasks WHERE {where}", (FORWARD_TASK_MAX_ATTEMPTS, now))
+    return rows
+
+
+def _renew_lease(conn: sqlite3.Connection, task_id: int, button_id: str, owner: str, now: float) -> bool:
+    renewed = conn.execute(
+        "UPDATE leases SET expires_at=?, heartbeat_at=? WHERE resource=? AND owner=?",
+        (now + LEASE_TTL, now, f"button:{button_id}", owner),
+    ).rowcount
+    conn.execute("UPDATE forward_tasks SET lease_expires=? WHERE id=? AND owner=?", (now + LEASE_TTL, task_id, owner))
+    return renewed > 0
+
+
+def _complete_forward_task(conn: sqlite3.Connection, task_id: int, button_id: str, owner: str) -> None:
+    conn.execute("DELETE FROM forward_tasks WHERE id=? AND owner=?", (task_id, owner))
+    conn.execute("DELETE FROM leases WHERE resource=? AND owner=?", (f"button:{button_id}", owner))
+
+
+async def run_claimed_task(app: Application, owner: str, task) -> None:
+    task_id, button_id, slot, notify_chat_id = task
+    # दूसरे process ने channels/schedules बदले हों सकते हैं — हर रन पर ताज़ा पढ़ें
+    CONFIG_CACHE.invalidate(button_id)
+    context = job_context(app, {"button_id": button_id, "notify_chat_id": notify_chat_id, "time": slot})
+    job = asyncio.create_task((urgent_forward_job if slot == URGENT_SLOT else forward_messages_job)(context))
+    try:
+        while True:
+            done, _ = await asyncio.wait({job}, timeout=LEASE_HEARTBEAT)
+            if done:
+                break
+            renewed = await DB.run_write(lambda conn: _renew_lease(conn, task_id, button_id, owner, time.time()))
+            if not renewed:
+                logger.error("Worker %s lost lease on %s; stopping its run", owner, button_id)
+                job.cancel()
+                await asyncio.gather(job, return_exceptions=True)
+                return
+    finally:
+        await DB.run_write(lambda conn: _complete_forward_task(conn, task_id, button_id, owner))
+
+
+async def _worker_main(worker_id: int) -> None:
+    owner = f"{socket.gethostname()}:{os.getpid()}:{worker_id}"
+    app = configure_transport(
+        Application.builder()
+        .token(TOKEN)
+        .base_url(BOT_API_BASE_URL)
+        .base_file_url(BOT_API_BASE_FILE_URL),
+        polling=False,
+    ).build()
+    slots = asyncio.Semaphore(WORKER_MAX_TASKS)
+    running = set()
+    async with app:
+        await app.start()  # सिर्फ़ JobQueue (रिमाइंडर्स) के लिए; यहाँ polling नहीं होती
+        # worker के notifications notify_outbox से main process के dashboard में
+        app.job_queue.run_repeating(notify_flush_job, interval=NOTIFY_INTERVAL, first=NOTIFY_INTERVAL, name="notify_flush")
+        # इस worker की deferred डिलीवरी यहीं से (claim की वजह से main process से टकराव नहीं)
+        RETRY.task = asyncio.create_task(RETRY.run(app.bot))
+        logger.info("Forward worker %s started", owner)
+        try:
+            while True:
+                await slots.acquire()
+                task = await DB.run_write(lambda conn: _claim_forward_task(conn, owner, time.time()))
+                if task is None:
+                    slots.release()
+                    for button_id, slot, attempts in await DB.run_write(
+                        lambda conn: _drop_exhausted_tasks(conn, time.time())
+                    ):
+                        logger.error("Dropping forward task %s@%s after %d attempts", button_id, slot, attempts)
+                        NOTIFIER.post_admins(
+                            "job_error", f"task:{button_id}",
+                            f"❌ {button_id}@{slot}: फॉरवर्ड task {attempts} कोशिशों के बाद भी पूरा नहीं हुआ, छोड़ दिया गया।",
+                        )
+                    await asyncio.sleep(WORKER_POLL_INTERVAL)
+                    continue
+                t = asyncio.create_task(run_claimed_task(app, owner, task))
+                running.add(t)
+                t.add_done_callback(running.discard)
+                t.add_done_callback(lambda _: slots.release())
+        finally:
+            RETRY.task.cancel()
+            for t in list(running):
+                t.cancel()
+            await asyncio.gather(RETRY.task, *running, return_exceptions=True)
+            await NOTIFIER.flush(app.bot)
+            await app.stop()
+            DB.close()
+
+
+def process_rate_limiter() -> RateLimiter:
+    """
+    Worker mode में global limit का हिस्सा: main process (urgent lane, retries, notifications)
+    और हर worker को बराबर — सब मिलकर TG_GLOBAL_RATE के अंदर रहें।
+    """
+    shares = FORWARD_WORKERS + 1
+    return RateLimiter(global_rate=TG_GLOBAL_RATE / shares, global_burst=max(1.0, TG_GLOBAL_BURST / shares))
+
+
+def run_worker(worker_id: int) -> None:
+    """Worker process का entry point।"""
+    global RATE_LIMITER, NOTIFIER
+    RATE_LIMITER = process_rate_limiter()
+    NOTIFIER = Notifier(relay=True)
+    try:
+        asyncio.run(_worker_main(worker_id))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_forward_workers(count: int):
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for i in range(count):
+        p = ctx.Process(target=run_worker, args=(i,), name=f"forward-worker-{i}", daemon=True)
+        p.start()
+        workers.append(p)
+    logger.info("Started %d forward worker processes", count)
+    return workers
+
+
+def stop_forward_workers(workers) -> None:
+    for p in workers:
+        if p.is_alive():
+            p.terminate()
+    for p in workers:
+        p.join(timeout=10)
+
+
+# =====================
+# Soak monitor (memory + event-loop lag)
+# =====================
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoopLagMonitor:
+    """Event loop कितनी देर से जाग रहा है: asyncio.sleep(interval) के ऊपर का अतिरिक्त समय।"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.task = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - started - self.interval)
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+    def take_max(self) -> float:
+        lag, self.max_lag = self.max_lag, 0.0
+        return lag
+
+
+LOOP_LAG = LoopLagMonitor()
+
+
+async def soak_report_job(context: ContextTypes.DEFAULT_TYPE):
+    soak = {
+        "rss_mb": round(current_rss_mb(), 1),
+        "loop_lag_ms": round(LOOP_LAG.last_lag * 1000, 2),
+        "loop_lag_max_ms": round(LOOP_LAG.take_max() * 1000, 2),
+        "tasks": len(asyncio.all_tasks()),
+        "jobs": len(context.job_queue.jobs()),
+        "scheduled_slots": len(SCHEDULER.slots),
+        "config_cache": CONFIG_CACHE.stats(),
+        "log_dropped": DroppingQueueHandler.dropped,
+    }
+    logger.info("SOAK %s", soak, extra={"fields": soak})
+
+
+# =====================
+# Metrics HTTP endpoint
+# =====================
+async def collect_pending_gauge() -> None:
+    rows = await db_fetchall(
+        "SELECT button_id, COUNT(*) FROM messages WHERE status IN ('pending', 'sending') GROUP BY button_id"
+    )
+    PENDING_MESSAGES.replace({(button_id,): n for button_id, n in rows})
+    rows = await db_fetchall(
+        "SELECT m.button_id, COUNT(*) FROM deliveries d JOIN messages m ON m.id = d.message_id "
+        "WHERE d.status='retry' GROUP BY m.button_id"
+    )
+    RETRY_QUEUE.replace({(button_id,): n for button_id, n in rows})
+
+
+async def collect_loop_lag() -> None:
+    LOOP_LAG_GAUGE.set(LOOP_LAG.last_lag)
+
+
+METRICS.add_collector(collect_pending_gauge)
+METRICS.add_collector(collect_loop_lag)
+
+
+def stalled_jobs():
+    now = time.monotonic()
+    return [f"{b}@{slot}" for (b, slot), progress in RUNNING_JOBS.items() if now - progress > JOB_STALL_SECONDS]
+
+
+async def _metrics_http_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode(errors="replace").split()
+        path = urlparse(parts[1]).path if len(parts) >= 2 else "/"
+
+        status, ctype = "200 OK", "text/plain; charset=utf-8"
+        if path == "/metrics":
+            body = await METRICS.render()
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/healthz":
+            # जवाब आ रहा है = event loop ज़िंदा है
+            body = json.dumps({"status": "ok", "loop_lag_ms": round(LOOP_LAG.last_lag * 1000, 2)})
+            ctype = "application/json"
+        elif path == "/readyz":
+            stalled = stalled_jobs()
+            writer_alive = DB._writer is not None and DB._writer.is_alive()
+            ready = writer_alive and not stalled
+            status = "200 OK" if ready else "503 Service Unavailable"
+            body = json.dumps({"ready": ready, "db_writer": writer_alive, "stalled_jobs": stalled})
+            ctype = "application/json"
+        else:
+            status, body = "404 Not Found", "not found\n"
+
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server():
+    server = await asyncio.start_server(_metrics_http_handler, METRICS_HOST, METRICS_PORT)
+    logger.info("Metrics endpoint on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+    return server
+
+
+# =====================
+# Webhook ingestion
+# =====================
+UPDATE_RECEIVED = {}  # update_id -> perf_counter जब update मिला
+
+
+def ingest_mode() -> str:
+    return "webhook" if WEBHOOK_PORT > 0 else "polling"
+
+
+async def stamp_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # webhook में समय पहले ही receipt पर लग चुका है
+    UPDATE_RECEIVED.setdefault(update.update_id, time.perf_counter())
+    # इस update के handlers के सारे log records एक trace id से जुड़ेंगे
+    TRACE_ID.set(f"u{update.update_id}")
+
+
+async def observe_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    started = UPDATE_RECEIVED.pop(update.update_id, None)
+    if started is not None:
+        UPDATE_HANDLING.observe(time.perf_counter() - started, mode=ingest_mode())
+
+
+def _http_response(status: str, body: str = "") -> bytes:
+    payload = body.encode()
+    return (
+        f"HTTP/1.1 {status}\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Length: {len(payload)}\r\n"
+        f"Connection: close\r\n\r\n"
+    ).encode() + payload
+
+
+def make_webhook_handler(application: Application):
+    async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=10)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            parts = request_line.decode(errors="replace").split()
+
+            if len(parts) < 2 or parts[0] != "POST" or urlparse(parts[1]).path != WEBHOOK_PATH:
+                response = _http_response("404 Not Found")
+            elif not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), WEBHOOK_SECRET):
+                logger.warning("Webhook request with wrong secret token rejected")
+                response = _http_response("403 Forbidden")
+            else:
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = 0  # ग़ैर-संख्या header पर भी जवाब 400 हो, बिना जवाब के socket बंद नहीं
+                if length <= 0 or length > WEBHOOK_MAX_BODY:
+                    response = _http_response("413 Payload Too Large" if length else "400 Bad Request")
+                else:
+                    body = await asyncio.wait_for(reader.readexactly(length), timeout=10)
+                    try:
+                        payload = json.loads(body)
+                        if not isinstance(payload, dict):
+                            raise ValueError(f"update must be a JSON object, got {type(payload).__name__}")
+                        update = Update.de_json(payload, application.bot)
+                    except (ValueError, TypeError, KeyError, AttributeError) as e:
+                        logger.warning("Malformed webhook update: %s", e)
+                        response = _http_response("400 Bad Request")
+                    else:
+                        UPDATE_RECEIVED[update.update_id] = time.perf_counter()
+                        # Telegram को तुरंत 200; handlers update_queue से चलते हैं
+                        await application.update_queue.put(update)
+                        response = _http_response("200 OK")
+            writer.write(response)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return handler
+
+
+async def run_webhook(application: Application) -> None:
+    """run_polling की जगह: app चलाएँ, webhook server खोलें और SIGINT/SIGTERM तक रुकें।"""
+    if not WEBHOOK_URL and not os.environ.get("WEBHOOK_SECRET"):
+        # random secret कहीं दिखता नहीं — उसके बिना कोई भी लोकल POST 403 ही पाएगा
+        raise ValueError("WEBHOOK_SECRET environment variable must be set when WEBHOOK_URL is empty.")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    server = await asyncio.start_server(make_webhook_handler(application), WEBHOOK_LISTEN, WEBHOOK_PORT)
+    try:
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+        await application.start()
+        logger.info("Webhook listening on http://%s:%s%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
 
 
 # =====================
 # Main
 # =====================
+_metrics_server = None
+
+
+async def _post_init(application: Application) -> None:
+    global _metrics_server
+    await CONFIG_CACHE.load_all()
+    await SCHEDULER.load_all()
+    # application.create_task नहीं — वो stop() पर इस कभी-न-ख़त्म होने वाले task का इंतज़ार करेगा
+    SCHEDULER.task = asyncio.create_task(SCHEDULER.run(application))
+    await URGENT.load_all()
+    URGENT.task = asyncio.create_task(URGENT.run(application))
+    RETRY.task = asyncio.create_task(RETRY.run(application.bot))
+    if SOAK_MONITOR_INTERVAL > 0 or METRICS_PORT > 0:
+        LOOP_LAG.task = asyncio.create_task(LOOP_LAG.run())
+    if METRICS_PORT > 0:
+        _metrics_server = await start_metrics_server()
+    application.job_queue.run_repeating(
+        db_maintenance_job, interval=MAINTENANCE_INTERVAL, first=60, name="db_maintenance"
+    )
+    application.job_queue.run_repeating(
+        notify_flush_job, interval=NOTIFY_INTERVAL, first=NOTIFY_INTERVAL, name="notify_flush"
+    )
+    if SOAK_MONITOR_INTERVAL > 0:
+        application.job_queue.run_repeating(soak_report_job, interval=SOAK_MONITOR_INTERVAL, first=SOAK_MONITOR_INTERVAL, name="soak_monitor")
+
+
+async def _post_shutdown(application: Application) -> None:
+    if _metrics_server is not None:
+        _metrics_server.close()
+    for task in (LOOP_LAG.task, SCHEDULER.task, URGENT.task, RETRY.task):
+        if task is not None:
+            task.cancel()
+    DB.close()
+
+
 def main() -> None:
+    global RATE_LIMITER
+    migrate_auto_vacuum()
     init_db()
-    app = Application.builder().token(TOKEN).pool_timeout(60).connect_timeout(60).read_timeout(60).build()
+    app = (
+        configure_transport(
+            Application.builder()
+            .token(TOKEN)
+            .base_url(BOT_API_BASE_URL)
+            .base_file_url(BOT_API_BASE_FILE_URL),
+            # webhook mode में getUpdates होता ही नहीं, उसका pool न बनाएँ
+            polling=ingest_mode() == "polling",
+        )
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+
+    # Update latency (पहले और आख़िरी group में)
+    app.add_handler(TypeHandler(Update, stamp_update), group=-1)
+    app.add_handler(TypeHandler(Update, observe_update), group=1)
 
     # UI handlers
     app.add_handler(CommandHandler("start", start))
-    app.add_handler(CallbackQueryHandler(open_button, pattern=r"^btn[1-5]$"))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CommandHandler("jobprofiles", job_profiles_command))
+    app.add_handler(CommandHandler("dashboard", dashboard_command))
+    app.add_handler(CallbackQueryHandler(open_button, pattern=r"^btn\d+$"))
+    app.add_handler(CallbackQueryHandler(main_menu_page, pattern=r"^menu_\d+$"))
+    app.add_handler(CallbackQueryHandler(new_button_prompt, pattern=r"^new_btn$"))
+    app.add_handler(CallbackQueryHandler(rename_button_prompt, pattern=r"^ren_btn_"))
+    app.add_handler(CallbackQueryHandler(delete_button_prompt, pattern=r"^del_btn_"))
+    app.add_handler(CallbackQueryHandler(final_delete_button, pattern=r"^purge_btn_"))
     app.add_handler(CallbackQueryHandler(add_channels_prompt, pattern=r"^add_chn_"))
     app.add_handler(CallbackQueryHandler(delete_channel_menu, pattern=r"^del_chn_"))
     app.add_handler(CallbackQueryHandler(confirm_delete_channel, pattern=r"^confirm_del_"))
     app.add_handler(CallbackQueryHandler(final_delete_channel, pattern=r"^final_del_"))
     app.add_handler(CallbackQueryHandler(add_messages_prompt, pattern=r"^add_msg_"))
+    app.add_handler(CallbackQueryHandler(add_urgent_prompt, pattern=r"^add_urg_"))
     app.add_handler(CallbackQueryHandler(set_times_prompt, pattern=r"^set_time_"))
+    app.add_handler(CallbackQueryHandler(import_prompt, pattern=r"^import_"))
     app.add_handler(CallbackQueryHandler(start_forwarding, pattern=r"^start_fw_"))
+    app.add_handler(CallbackQueryHandler(stop_forwarding, pattern=r"^stop_fw_"))
     app.add_handler(CallbackQueryHandler(show_status, pattern=r"^status_"))
+    app.add_handler(CallbackQueryHandler(dead_letters_menu, pattern=r"^dlq_"))
+    app.add_handler(CallbackQueryHandler(replay_dead_letters, pattern=r"^dlqr_"))
+    app.add_handler(CallbackQueryHandler(clear_dead_letters, pattern=r"^dlqc_"))
 
     # Messages
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
@@ -917,8 +4499,19 @@ def main() -> None:
     # Error handler
     app.add_error_handler(error_handler)
 
-    logger.info("Bot started…")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    workers = []
+    if FORWARD_WORKERS > 0:
+        RATE_LIMITER = process_rate_limiter()
+        workers = start_forward_workers(FORWARD_WORKERS)
+
+    logger.info("Bot started… (%s)", ingest_mode())
+    try:
+        if WEBHOOK_PORT > 0:
+            asyncio.run(run_webhook(app))
+        else:
+            app.run_polling(allowed_updates=ALLOWED_UPDATES)
+    finally:
+        stop_forward_workers(workers)
 #    app.run_polling(close_loop=False)
 
 